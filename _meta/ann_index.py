@@ -0,0 +1,219 @@
+"""
+ANN index (IVF) pro code_chunks — k-means centroidy + invertované seznamy.
+
+Každý chunk patří do seznamu nejbližšího centroidu. Dotaz projde jen
+`nprobe` nejbližších seznamů a skóruje kandidáty přes float16 kopie
+normalizovaných vektorů; přesný re-ranking (float32 z .vec souboru) je volitelný.
+
+add/remove se volají po souborech (writer indexace) — změny se jen odloží
+a do polí se promítnou jednou před hledáním / uložením, takže inkrementální
+běh přes mnoho souborů nepřepisuje celý index za každý soubor.
+
+Soubor: ~/.ai-agent/code_index.ivf.npz (vedle code_index.db)
+  centroids  (nlist × dim)  float32, normalizované
+  ids        (n,)           int64   — code_chunks.id
+  lists      (n,)           int32   — číslo seznamu pro každé id
+  codes      (n × dim)      float16 — normalizované vektory
+  trained_n  ()             int64   — počet vektorů při posledním tréninku
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+# ─── Konfigurace ─────────────────────────────────────────────────────────────
+
+MIN_TRAIN      = 1024   # pod touto velikostí jediný seznam (= brute force)
+TRAIN_SAMPLE   = 256    # max. trénovacích vektorů na centroid
+KMEANS_ITERS   = 10
+RETRAIN_FACTOR = 4      # přetrénovat až index naroste 4× od posledního tréninku
+DEFAULT_NPROBE = 8
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    m = np.asarray(m, dtype=np.float32)
+    if m.ndim == 1:
+        return m / (np.linalg.norm(m) + 1e-10)
+    return m / (np.linalg.norm(m, axis=1, keepdims=True) + 1e-10)
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray, block: int = 8192) -> np.ndarray:
+    """Index nejbližšího centroidu pro každý řádek x (po blocích kvůli paměti)."""
+    out = np.empty(len(x), dtype=np.int32)
+    for s in range(0, len(x), block):
+        out[s:s + block] = np.argmax(x[s:s + block] @ centroids.T, axis=1)
+    return out
+
+
+def _kmeans(x: np.ndarray, k: int, seed: int = 0) -> np.ndarray:
+    """Sférický k-means (kosínusová podobnost) nad normalizovanými vektory."""
+    rng  = np.random.default_rng(seed)
+    cent = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(KMEANS_ITERS):
+        assign = _nearest(x, cent)
+        sums   = np.zeros_like(cent)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=k)
+        empty  = counts == 0
+        if empty.any():
+            # Prázdné clustery znovu nasadit na náhodné body
+            sums[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+        cent = _normalize(sums)
+    return cent
+
+
+class IVFIndex:
+    """Invertovaný index nad normalizovanými embeddingy chunků."""
+
+    def __init__(self, dim: int) -> None:
+        self.dim       = dim
+        self.centroids = np.zeros((1, dim), dtype=np.float32)
+        self.ids       = np.empty(0, dtype=np.int64)
+        self.lists     = np.empty(0, dtype=np.int32)
+        self.codes     = np.empty((0, dim), dtype=np.float16)
+        self.trained_n = 0
+        self.dirty     = False  # změněno od posledního save/load
+        self._order: np.ndarray | None = None    # ids seřazené dle seznamu
+        self._offsets: np.ndarray | None = None  # hranice seznamů v _order
+        # Odložené změny (viz _apply): odebrání z polí výše, přidané bloky
+        self._removed: list[np.ndarray] = []
+        self._added:   list[tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self._added_ids: set[int] = set()
+
+    def __len__(self) -> int:
+        self._apply()
+        return len(self.ids)
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    # ── Stavba a údržba ──────────────────────────────────────────────────────
+
+    def build(self, ids: np.ndarray, vecs: np.ndarray) -> None:
+        """Natrénuje centroidy a přiřadí všechny vektory (plný rebuild)."""
+        x = _normalize(vecs) if len(vecs) else np.empty((0, self.dim), np.float32)
+        n = len(x)
+        if n < MIN_TRAIN:
+            self.centroids = np.zeros((1, self.dim), dtype=np.float32)
+        else:
+            nlist  = int(min(4096, max(2, np.sqrt(n))))
+            sample = x
+            if n > nlist * TRAIN_SAMPLE:
+                pick   = np.random.default_rng(0).choice(n, nlist * TRAIN_SAMPLE, replace=False)
+                sample = x[pick]
+            self.centroids = _kmeans(sample, nlist)
+        self.ids       = np.asarray(ids, dtype=np.int64)
+        self.lists     = _nearest(x, self.centroids) if n else np.empty(0, np.int32)
+        self.codes     = x.astype(np.float16)
+        self.trained_n = n
+        self._removed, self._added, self._added_ids = [], [], set()
+        self._invalidate()
+
+    def needs_retrain(self) -> bool:
+        self._apply()
+        n = len(self.ids)
+        if self.nlist == 1:
+            return n >= MIN_TRAIN
+        return n > RETRAIN_FACTOR * max(self.trained_n, 1)
+
+    def add(self, ids: list[int] | np.ndarray, vecs: np.ndarray) -> None:
+        """Přidá nové vektory do existujících seznamů (bez přetrénování)."""
+        if len(ids) == 0:
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        x   = _normalize(np.asarray(vecs).reshape(len(ids), self.dim))
+        self._added.append((ids, _nearest(x, self.centroids), x.astype(np.float16)))
+        self._added_ids.update(ids.tolist())
+        self._invalidate()
+
+    def remove(self, ids: list[int] | np.ndarray) -> None:
+        if len(ids) == 0:
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        if self._added_ids.intersection(ids.tolist()):
+            # Odebírá se i z dosud odložených přidání (id SQLite se může znovu použít)
+            self._added = [(i[keep], l[keep], c[keep]) for i, l, c in self._added
+                           for keep in [~np.isin(i, ids)]]
+            self._added_ids.difference_update(ids.tolist())
+        self._removed.append(ids)
+        self._invalidate()
+
+    def _apply(self) -> None:
+        """Promítne odložené remove/add do polí (jedno isin + jedno concatenate)."""
+        if self._removed and len(self.ids):
+            keep = ~np.isin(self.ids, np.concatenate(self._removed))
+            self.ids, self.lists, self.codes = self.ids[keep], self.lists[keep], self.codes[keep]
+        if self._added:
+            ids, lists, codes = zip(*self._added)
+            self.ids   = np.concatenate([self.ids,   *ids])
+            self.lists = np.concatenate([self.lists, *lists])
+            self.codes = np.concatenate([self.codes, *codes])
+        self._removed, self._added, self._added_ids = [], [], set()
+
+    def _invalidate(self) -> None:
+        self._order = self._offsets = None
+        self.dirty  = True
+
+    def _ensure_lists(self) -> None:
+        if self._order is None:
+            self._order   = np.argsort(self.lists, kind='stable')
+            counts        = np.bincount(self.lists, minlength=self.nlist)
+            self._offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    # ── Vyhledávání ──────────────────────────────────────────────────────────
+
+    def search(self, query: np.ndarray, k: int, nprobe: int = DEFAULT_NPROBE,
+               allowed: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Vrátí (ids, skóre) top-k kandidátů z `nprobe` nejbližších seznamů.
+        allowed: volitelné pole povolených id (filtr projekt/scope); pokud po
+        filtraci nezbývá dost kandidátů, nprobe se postupně zdvojnásobuje.
+        """
+        self._apply()
+        if len(self.ids) == 0:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        self._ensure_lists()
+        q     = _normalize(query)
+        probe = np.argsort(self.centroids @ q)[::-1]
+        nprobe = max(1, min(nprobe, self.nlist))
+
+        while True:
+            rows = np.concatenate([
+                self._order[self._offsets[c]:self._offsets[c + 1]] for c in probe[:nprobe]
+            ])
+            if allowed is not None:
+                rows = rows[np.isin(self.ids[rows], allowed)]
+            if len(rows) >= k or nprobe >= self.nlist:
+                break
+            nprobe = min(self.nlist, nprobe * 2)
+
+        scores = self.codes[rows].astype(np.float32) @ q
+        top    = np.argsort(scores)[::-1][:k]
+        return self.ids[rows[top]], scores[top]
+
+    # ── Persistence ──────────────────────────────────────────────────────────
+
+    def save(self, path: Path) -> None:
+        self._apply()
+        tmp = path.with_suffix('.tmp.npz')
+        np.savez(tmp, centroids=self.centroids, ids=self.ids, lists=self.lists,
+                 codes=self.codes, trained_n=np.int64(self.trained_n))
+        tmp.replace(path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: Path) -> 'IVFIndex | None':
+        """Načte index ze souboru; vrátí None pokud neexistuje nebo je poškozený."""
+        try:
+            with np.load(path) as data:
+                idx = cls(int(data['centroids'].shape[1]))
+                idx.centroids = data['centroids']
+                idx.ids       = data['ids']
+                idx.lists     = data['lists']
+                idx.codes     = data['codes']
+                idx.trained_n = int(data['trained_n'])
+            idx.dirty = False
+            return idx
+        except (OSError, KeyError, ValueError):
+            return None
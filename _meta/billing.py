@@ -4,15 +4,18 @@ Billing — správa DB, ceny modelů, hash cache.
 Extrahováno z token_tracker.py.
 """
 
+import atexit
 import sqlite3
 import hashlib
 import json
-from pathlib import Path
+import queue
+import sys
+import threading
+import time
 
-# ─── Konfigurace ─────────────────────────────────────────────────────────────
+from _meta.db import DB_DIR, DB_PATH, connect, migrate   # DB_DIR: re-export (token_tracker)
 
-DB_DIR  = Path.home() / '.ai-agent'
-DB_PATH = DB_DIR / 'tokens.db'
+# ─── Konfigurace ─────────────────────────────────────────────────────────────
 
 MODEL_PRICES: dict[str, dict] = {
     'claude-opus-4-6':   {'in': 15.00, 'out': 75.00},
@@ -23,6 +26,16 @@ MODEL_PRICES: dict[str, dict] = {
     'haiku':             {'in':  0.80, 'out':  4.00},
 }
 
+# Prompt caching (Anthropic): čtení z cache / zápis do cache vůči ceně vstupu
+CACHE_READ_FACTOR  = 0.10
+CACHE_WRITE_FACTOR = 1.25
+
+CACHE_SWEEP_EVERY = 3600   # s — jak často billing writer maže expirované řádky
+BILLING_FLUSH_MS  = 200    # max. zpoždění zápisu do token_log
+BILLING_BATCH     = 200    # max. řádků v jedné transakci
+BILLING_RETRIES   = 4      # opakování dávky při "database is locked" / busy
+BILLING_BACKOFF   = 0.05   # s — 0.05, 0.1, 0.2, 0.4; pak dávka zpět do fronty
+
 MODEL_ALIASES = {
     'opus':   'claude-opus-4-6',
     'sonnet': 'claude-sonnet-4-6',
@@ -33,38 +46,182 @@ MODEL_ALIASES = {
 # ─── DB ───────────────────────────────────────────────────────────────────────
 
 def init_db() -> sqlite3.Connection:
-    """Inicializuje ~/.ai-agent/tokens.db, provede migraci nových sloupců."""
-    DB_DIR.mkdir(exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS token_log (
-            id            INTEGER PRIMARY KEY,
-            timestamp     DATETIME DEFAULT CURRENT_TIMESTAMP,
-            project       VARCHAR(50),
-            operation     VARCHAR(50),
-            model         VARCHAR(30),
-            tokens_in     INTEGER,
-            tokens_out    INTEGER,
-            cost_usd      DECIMAL(10,6),
-            prompt_hash   VARCHAR(64),
-            notes         TEXT,
-            response_text TEXT,
-            cache_hit     INTEGER DEFAULT 0
-        )
-    """)
-    for sql in [
-        "ALTER TABLE token_log ADD COLUMN response_text TEXT",
-        "ALTER TABLE token_log ADD COLUMN cache_hit INTEGER DEFAULT 0",
-    ]:
-        try:
-            conn.execute(sql)
-        except sqlite3.OperationalError:
-            pass
-    conn.commit()
+    """Spojení na ~/.ai-agent/tokens.db z poolu; migrace proběhnou jednou za proces."""
+    conn = connect(DB_PATH)
+    migrate(conn, 'billing', _MIGRATIONS)
     return conn
 
 
+def _backfill_response_cache(conn: sqlite3.Connection) -> None:
+    """Jednorázově převezme ještě platné odpovědi z token_log.response_text."""
+    from _meta.router import get_cache_ttl   # lazy — router importuje billing
+
+    ops = [r['operation'] for r in conn.execute("""
+        SELECT DISTINCT operation FROM token_log
+        WHERE (cache_hit = 0 OR cache_hit IS NULL)
+          AND response_text IS NOT NULL AND response_text != ''
+    """)]
+    for op in ops:
+        ttl = get_cache_ttl(op)
+        if ttl <= 0:
+            continue
+        # Od nejnovějšího; existující záznamy (i z response_cache) mají přednost
+        conn.execute("""
+            INSERT OR IGNORE INTO response_cache
+                (prompt_hash, operation, model, response_text,
+                 tokens_in, tokens_out, cost_usd, created_at, expires_at)
+            SELECT prompt_hash, operation, model, response_text,
+                   tokens_in, tokens_out, cost_usd, timestamp,
+                   DATETIME(timestamp, ? || ' hours')
+            FROM token_log
+            WHERE operation = ?
+              AND (cache_hit = 0 OR cache_hit IS NULL)
+              AND prompt_hash IS NOT NULL
+              AND response_text IS NOT NULL AND response_text != ''
+              AND timestamp >= DATETIME('now', ? || ' hours')
+            ORDER BY id DESC
+        """, (f'+{ttl}', op, f'-{ttl}'))
+
+
+# ─── Rollupy ──────────────────────────────────────────────────────────────────
+# billing_hourly / billing_daily: předagregovaný token_log per
+# (bucket, project, operation, model, cache_hit). Udržuje je trigger při
+# každém INSERT do token_log (i z jiných procesů / manuálního `agent log`);
+# rebuild_rollups() je přepočítá od nuly. saved_cost u cache hitu = cena
+# posledního reálného volání se stejným prompt_hash.
+
+ROLLUPS = {
+    'billing_hourly': '%Y-%m-%d %H:00:00',
+    'billing_daily':  '%Y-%m-%d',
+}
+
+_SAVED_COST_SQL = """
+    COALESCE((SELECT o.cost_usd FROM token_log AS o
+              WHERE o.prompt_hash = {row}.prompt_hash
+                AND (o.cache_hit = 0 OR o.cache_hit IS NULL)
+              ORDER BY o.id DESC LIMIT 1), 0.0)
+"""
+
+
+def _rollup_table_sql(table: str) -> str:
+    return f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        bucket     TEXT    NOT NULL,
+        project    TEXT    NOT NULL,
+        operation  TEXT    NOT NULL,
+        model      TEXT    NOT NULL,
+        cache_hit  INTEGER NOT NULL,
+        calls      INTEGER DEFAULT 0,
+        tokens_in  INTEGER DEFAULT 0,
+        tokens_out INTEGER DEFAULT 0,
+        cost_usd   REAL    DEFAULT 0.0,
+        saved_cost REAL    DEFAULT 0.0,
+        PRIMARY KEY (bucket, project, operation, model, cache_hit)
+    )
+    """
+
+
+def _rollup_trigger_sql() -> str:
+    upserts = ''.join(f"""
+        INSERT INTO {table}
+            (bucket, project, operation, model, cache_hit,
+             calls, tokens_in, tokens_out, cost_usd, saved_cost)
+        VALUES (
+            strftime('{fmt}', NEW.timestamp),
+            COALESCE(NEW.project, ''), COALESCE(NEW.operation, ''),
+            COALESCE(NEW.model, ''),   COALESCE(NEW.cache_hit, 0),
+            1, COALESCE(NEW.tokens_in, 0), COALESCE(NEW.tokens_out, 0),
+            COALESCE(NEW.cost_usd, 0.0),
+            CASE WHEN NEW.cache_hit = 1 THEN {_SAVED_COST_SQL.format(row='NEW')} ELSE 0.0 END
+        )
+        ON CONFLICT (bucket, project, operation, model, cache_hit) DO UPDATE SET
+            calls      = calls      + 1,
+            tokens_in  = tokens_in  + excluded.tokens_in,
+            tokens_out = tokens_out + excluded.tokens_out,
+            cost_usd   = cost_usd   + excluded.cost_usd,
+            saved_cost = saved_cost + excluded.saved_cost;
+    """ for table, fmt in ROLLUPS.items())
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS trg_token_log_rollup AFTER INSERT ON token_log
+    BEGIN {upserts}
+    END
+    """
+
+
+def rebuild_rollups(conn: sqlite3.Connection) -> None:
+    """
+    Přepočítá rollup tabulky z celého token_log (po ruční úpravě ledgeru).
+    Necommituje — běží i jako krok migrace uvnitř její transakce.
+    """
+    for table, fmt in ROLLUPS.items():
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"""
+            INSERT INTO {table}
+                (bucket, project, operation, model, cache_hit,
+                 calls, tokens_in, tokens_out, cost_usd, saved_cost)
+            SELECT strftime('{fmt}', t.timestamp),
+                   COALESCE(t.project, ''), COALESCE(t.operation, ''),
+                   COALESCE(t.model, ''),   COALESCE(t.cache_hit, 0),
+                   COUNT(*),
+                   COALESCE(SUM(t.tokens_in), 0), COALESCE(SUM(t.tokens_out), 0),
+                   COALESCE(SUM(t.cost_usd), 0.0),
+                   COALESCE(SUM(CASE WHEN t.cache_hit = 1
+                                     THEN {_SAVED_COST_SQL.format(row='t')} END), 0.0)
+            FROM token_log AS t
+            GROUP BY 1, 2, 3, 4, 5
+        """)
+
+
+# Kroky se jen přidávají na konec (verze = počet kroků), viz _meta/db.py
+_MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS token_log (
+        id            INTEGER PRIMARY KEY,
+        timestamp     DATETIME DEFAULT CURRENT_TIMESTAMP,
+        project       VARCHAR(50),
+        operation     VARCHAR(50),
+        model         VARCHAR(30),
+        tokens_in     INTEGER,
+        tokens_out    INTEGER,
+        cost_usd      DECIMAL(10,6),
+        prompt_hash   VARCHAR(64),
+        notes         TEXT,
+        response_text TEXT,
+        cache_hit     INTEGER DEFAULT 0
+    )
+    """,
+    "ALTER TABLE token_log ADD COLUMN response_text TEXT",
+    "ALTER TABLE token_log ADD COLUMN cache_hit INTEGER DEFAULT 0",
+    # Hash cache — samostatná tabulka, token_log zůstává jen účetnictví
+    """
+    CREATE TABLE IF NOT EXISTS response_cache (
+        id            INTEGER PRIMARY KEY,
+        prompt_hash   VARCHAR(64) NOT NULL,
+        operation     VARCHAR(50) NOT NULL,
+        model         VARCHAR(30),
+        response_text TEXT NOT NULL,
+        tokens_in     INTEGER,
+        tokens_out    INTEGER,
+        cost_usd      DECIMAL(10,6),
+        created_at    DATETIME DEFAULT CURRENT_TIMESTAMP,
+        expires_at    DATETIME NOT NULL,
+        last_hit      DATETIME,
+        hit_count     INTEGER DEFAULT 0,
+        UNIQUE (prompt_hash, operation)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_response_cache_expires ON response_cache(expires_at)",
+    _backfill_response_cache,
+    "CREATE INDEX IF NOT EXISTS idx_token_log_hash ON token_log(prompt_hash)",
+    *[_rollup_table_sql(table) for table in ROLLUPS],
+    _rollup_trigger_sql(),
+    rebuild_rollups,
+    "ALTER TABLE token_log ADD COLUMN latency_ms INTEGER",
+    "ALTER TABLE token_log ADD COLUMN cache_read_tokens INTEGER DEFAULT 0",
+    "ALTER TABLE token_log ADD COLUMN cache_write_tokens INTEGER DEFAULT 0",
+]
+
+
 # ─── Pomocné funkce ───────────────────────────────────────────────────────────
 
 def normalize_model(model: str) -> str:
@@ -72,8 +229,12 @@ def normalize_model(model: str) -> str:
     return MODEL_ALIASES.get(model.lower(), model)
 
 
-def calc_cost(model: str, tokens_in: int, tokens_out: int) -> float:
-    """Vypočítá cenu v USD podle cen modelu."""
+def calc_cost(model: str, tokens_in: int, tokens_out: int,
+              cache_read: int = 0, cache_write: int = 0) -> float:
+    """
+    Vypočítá cenu v USD podle cen modelu. tokens_in = necachovaný vstup;
+    cache_read / cache_write = vstup přečtený z / zapsaný do prompt cache.
+    """
     prices = MODEL_PRICES.get(model) or MODEL_PRICES.get(model.lower())
     if not prices:
         for part in model.lower().split('-'):
@@ -82,7 +243,9 @@ def calc_cost(model: str, tokens_in: int, tokens_out: int) -> float:
                 break
     if not prices:
         return 0.0
-    return (tokens_in * prices['in'] + tokens_out * prices['out']) / 1_000_000
+    tokens_in_eq = (tokens_in + cache_read * CACHE_READ_FACTOR
+                    + cache_write * CACHE_WRITE_FACTOR)
+    return (tokens_in_eq * prices['in'] + tokens_out * prices['out']) / 1_000_000
 
 
 def hash_prompt(messages: list[dict], system: str | None = None) -> str:
@@ -99,50 +262,219 @@ def hash_prompt(messages: list[dict], system: str | None = None) -> str:
 def cache_lookup(conn: sqlite3.Connection, prompt_hash: str,
                  operation: str, ttl: int) -> str | None:
     """
-    Hledá platnou cached odpověď v DB.
-    ttl: TTL v hodinách (0 = cache zakázána).
+    Hledá platnou cached odpověď v response_cache (unikátní klíč → 1 lookup).
+    ttl: TTL v hodinách (0 = cache zakázána); záznam musí být i mladší než
+    aktuální TTL, kdyby se pravidlo od uložení zkrátilo.
     """
     if ttl == 0:
         return None
 
+    # Ještě nezapsaná odpověď z tohoto procesu (write-behind fronta)
+    with _sink_lock:
+        pending = _pending.get((prompt_hash, operation))
+    if pending and time.monotonic() - pending[1] < ttl * 3600:
+        _enqueue('hit', (prompt_hash, operation))
+        return pending[0]
+
     row = conn.execute("""
-        SELECT response_text FROM token_log
+        SELECT response_text FROM response_cache
         WHERE prompt_hash = ?
           AND operation   = ?
-          AND (cache_hit = 0 OR cache_hit IS NULL)
-          AND response_text IS NOT NULL
-          AND response_text != ''
-          AND timestamp >= DATETIME('now', ? || ' hours')
-        ORDER BY timestamp DESC
-        LIMIT 1
+          AND expires_at  > DATETIME('now')
+          AND created_at >= DATETIME('now', ? || ' hours')
     """, (prompt_hash, operation, f'-{ttl}')).fetchone()
+    if not row:
+        return None
 
-    return row['response_text'] if row else None
+    _enqueue('hit', (prompt_hash, operation))
+    return row['response_text']
 
 
 def cache_store(conn: sqlite3.Connection, project: str, operation: str,
                 model: str, tokens_in: int, tokens_out: int, cost: float,
-                prompt_hash: str, response_text: str, notes: str = '') -> None:
-    """Uloží výsledek reálného API volání (cache_hit=0) včetně textu odpovědi."""
-    conn.execute(
-        """INSERT INTO token_log
-           (project, operation, model, tokens_in, tokens_out, cost_usd,
-            prompt_hash, notes, response_text, cache_hit)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)""",
-        (project, operation, model, tokens_in, tokens_out, cost,
-         prompt_hash, notes, response_text)
-    )
-    conn.commit()
+                prompt_hash: str, response_text: str, notes: str = '',
+                ttl: int = 0, latency_ms: int | None = None,
+                cache_read: int = 0, cache_write: int = 0) -> None:
+    """
+    Zaloguje reálné API volání (cache_hit=0) do token_log a při ttl > 0
+    uloží odpověď do response_cache (upsert, platnost ttl hodin).
+    cache_read / cache_write: tokeny prompt cache backendu (cena už v cost).
+    Zápis je write-behind (viz flush()); conn zůstává kvůli kompatibilitě API.
+    """
+    _enqueue('log', (_now(), project, operation, model, tokens_in, tokens_out, cost,
+                     prompt_hash, notes, 0, latency_ms, cache_read, cache_write))
+    if ttl > 0 and response_text:
+        with _sink_lock:
+            _pending[(prompt_hash, operation)] = (response_text, time.monotonic())
+        _enqueue('cache', (prompt_hash, operation, model, response_text,
+                           tokens_in, tokens_out, cost, f'+{ttl}'))
 
 
 def log_cache_hit(conn: sqlite3.Connection, project: str, operation: str,
                   model: str, prompt_hash: str) -> None:
-    """Zaznamená cache hit — 0 tokenů, $0, cache_hit=1."""
-    conn.execute(
-        """INSERT INTO token_log
-           (project, operation, model, tokens_in, tokens_out, cost_usd,
-            prompt_hash, cache_hit)
-           VALUES (?, ?, ?, 0, 0, 0.0, ?, 1)""",
-        (project, operation, model, prompt_hash)
-    )
+    """Zaznamená cache hit — 0 tokenů, $0, cache_hit=1 (write-behind)."""
+    _enqueue('log', (_now(), project, operation, model, 0, 0, 0.0,
+                     prompt_hash, None, 1, None, 0, 0))
+
+
+def sweep_cache(conn: sqlite3.Connection) -> int:
+    """Smaže expirované řádky response_cache (index na expires_at). Vrátí počet."""
+    c = conn.execute("DELETE FROM response_cache WHERE expires_at <= DATETIME('now')")
     conn.commit()
+    return c.rowcount
+
+
+# ─── Write-behind billing ─────────────────────────────────────────────────────
+# Zápisy z request path jdou do fronty; jedno vlákno je slučuje do transakcí
+# (max. BILLING_BATCH řádků nebo BILLING_FLUSH_MS). flush() počká na zápis
+# všeho dosud zařazeného — volají ho čtenáři (agent billing/cache, UI statistiky)
+# a atexit. Mezi procesy je tak zpoždění nejvýš BILLING_FLUSH_MS.
+
+_SQL = {
+    'log': """
+        INSERT INTO token_log
+            (timestamp, project, operation, model, tokens_in, tokens_out, cost_usd,
+             prompt_hash, notes, cache_hit, latency_ms,
+             cache_read_tokens, cache_write_tokens)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    'cache': """
+        INSERT INTO response_cache
+            (prompt_hash, operation, model, response_text,
+             tokens_in, tokens_out, cost_usd, expires_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, DATETIME('now', ? || ' hours'))
+        ON CONFLICT (prompt_hash, operation) DO UPDATE SET
+            model         = excluded.model,
+            response_text = excluded.response_text,
+            tokens_in     = excluded.tokens_in,
+            tokens_out    = excluded.tokens_out,
+            cost_usd      = excluded.cost_usd,
+            created_at    = CURRENT_TIMESTAMP,
+            expires_at    = excluded.expires_at
+    """,
+    'hit': """
+        UPDATE response_cache SET last_hit = CURRENT_TIMESTAMP, hit_count = hit_count + 1
+        WHERE prompt_hash = ? AND operation = ?
+    """,
+}
+
+_queue: queue.Queue = queue.Queue()
+_pending: dict[tuple[str, str], tuple[str, float]] = {}
+_sink_lock = threading.Lock()
+_writer: threading.Thread | None = None
+_last_sweep = 0.0
+
+
+def _now() -> str:
+    """Čas zařazení ve formátu CURRENT_TIMESTAMP (UTC)."""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+
+def _enqueue(kind: str, params: tuple) -> None:
+    global _writer
+    if _writer is None or not _writer.is_alive():
+        with _sink_lock:
+            if _writer is None or not _writer.is_alive():
+                _writer = threading.Thread(target=_writer_loop, name='billing-writer',
+                                           daemon=True)
+                _writer.start()
+    _queue.put((kind, params))
+
+
+def _writer_loop() -> None:
+    while True:
+        batch    = [_queue.get()]
+        deadline = time.monotonic() + BILLING_FLUSH_MS / 1000
+        while len(batch) < BILLING_BATCH and batch[-1][0] != 'flush':
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        rows    = [b for b in batch if b[0] != 'flush']
+        flushes = [b for b in batch if b[0] == 'flush']
+        try:
+            written = _write_batch(rows)
+        except Exception as e:   # writer nesmí umřít — flush() by čekal navždy
+            print(f'billing: zápis dávky ({len(rows)} řádků) selhal: {e}', file=sys.stderr)
+            _forget_pending(rows)
+            written = True
+        if written:
+            for _, event in flushes:
+                event.set()
+        else:
+            # DB zamčená i po opakováních → dávka (a flush za ní) zpět do fronty
+            for item in rows + flushes:
+                _queue.put(item)
+
+
+def _forget_pending(batch: list[tuple[str, tuple]]) -> None:
+    """Zapsané (nebo zahozené) odpovědi už nejsou čekající."""
+    with _sink_lock:
+        for kind, params in batch:
+            if kind == 'cache':
+                key = (params[0], params[1])
+                if key in _pending and _pending[key][0] == params[3]:
+                    del _pending[key]
+
+
+def _is_locked(e: sqlite3.Error) -> bool:
+    """Dočasná chyba — DB drží jiný zapisovatel (database is locked / busy)."""
+    msg = str(e).lower()
+    return isinstance(e, sqlite3.OperationalError) and ('locked' in msg or 'busy' in msg)
+
+
+def _write_batch(batch: list[tuple[str, tuple]]) -> bool:
+    """
+    Zapíše dávku v jedné transakci. Zamčená / busy DB → opakování s backoffem;
+    False = pořád zamčeno, dávku je třeba zařadit znovu. Jiná chyba SQLite
+    (chybějící tabulka / sloupec, poškozený řádek) dávku zahodí s hlášením —
+    opakování by nepomohlo.
+    """
+    global _last_sweep
+    if not batch:
+        return True
+    conn = None
+    try:
+        for attempt in range(BILLING_RETRIES + 1):
+            try:
+                conn = conn or init_db()
+                with conn:   # jedna transakce na dávku
+                    for kind, params in batch:
+                        conn.execute(_SQL[kind], params)
+                break
+            except sqlite3.Error as e:
+                if not _is_locked(e):
+                    print(f'billing: zápis dávky ({len(batch)} řádků) selhal: {e}',
+                          file=sys.stderr)
+                    _forget_pending(batch)
+                    return True
+                if attempt == BILLING_RETRIES:
+                    print(f'billing: DB nedostupná ({e}), dávka {len(batch)} řádků '
+                          f'se zkusí znovu', file=sys.stderr)
+                    return False
+                time.sleep(BILLING_BACKOFF * 2 ** attempt)
+
+        # Commitnuté odpovědi už najde cache_lookup v DB
+        _forget_pending(batch)
+        if time.monotonic() - _last_sweep >= CACHE_SWEEP_EVERY:
+            _last_sweep = time.monotonic()
+            sweep_cache(conn)
+        return True
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def flush(timeout: float | None = 10) -> bool:
+    """Počká, až writer zapíše vše zařazené před voláním. False = timeout."""
+    if _writer is None or not _writer.is_alive():
+        return True
+    event = threading.Event()
+    _queue.put(('flush', event))
+    return event.wait(timeout)
+
+
+atexit.register(flush, 5)
@@ -3,43 +3,81 @@
 Sémantický vyhledávač kódu — SQLite + numpy + Ollama embeddingy.
 
 chromadb není kompatibilní s Python 3.14 (pydantic v1 crash) → vlastní implementace:
-  - Úložiště:   ~/.ai-agent/code_index.db  (SQLite + numpy BLOB)
+  - Úložiště:   ~/.ai-agent/code_index.db  (SQLite — metadata + číslo řádku)
+                ~/.ai-agent/code_index.<gen>.vec  (float32/float16/int8 matice, np.memmap)
   - Embeddingy: nomic-embed-text via Ollama HTTP API
-  - Vyhledávání: kosínusová podobnost přes numpy (fast enough pro osobní workspace)
+  - Zápis:      jen jeden indexer najednou (flock na code_index.lock)
+  - Změny:      manifest `files` (cesta, velikost, mtime_ns, hash) porovnaný
+                hromadně s průchodem os.scandir (SKIP_DIRS se vůbec neprochází)
+  - Vyhledávání: IVF ANN index (ann_index.py) + volitelný přesný re-ranking,
+                 fallback na kosínusovou podobnost přes celou matici;
+                 FTS5 (BM25) nad obsahem, názvem a cestou chunku, výchozí
+                 režim hybrid = reciprocal-rank fusion obou pořadí
 
 CLI (přes ~/bin/agent):
   agent index                      # indexuje vše
   agent index --project dashboard  # jen jeden projekt
   agent index --diff               # jen soubory změněné v git
   agent index --force              # ignoruj mtime cache, přeindexuj vše
+  agent index --watch              # po indexaci průběžně sleduje změny (Ctrl+C)
   agent search "retry logika"
   agent search "retry logika" --project backup-dashboard
   agent search "záloha borg"  --top 10
   agent search "co projekt dělá" --scope docs   # hledá v CLAUDE.md souborech
+  agent search "retry logika" --exact          # přesný re-ranking top-k (float32)
+  agent search get_borg_env --mode lexical     # jen FTS5, bez Ollamy
+  agent search-daemon                          # drží index v paměti (search ho použije)
+  agent index --recall-check                   # recall@5 float16/int8 vůči uloženým vektorům
+  agent index --vec-format int8                # převod vektorového souboru do jiného formátu
 """
 
+import os
 import sqlite3
 import argparse
-import json
+import fcntl
+import hashlib
+import queue
+import re
 import struct
 import subprocess
 import datetime
-import urllib.request
-import urllib.error
+import threading
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
 
 import numpy as np
 
+from _meta import embeddings, quantize
+from _meta.ann_index import IVFIndex, DEFAULT_NPROBE
+from _meta.embeddings import EMBED_MODEL
+from _meta.vector_store import VectorFile
+
 # ─── Konfigurace ─────────────────────────────────────────────────────────────
 
 PROJECTS_ROOT  = Path.home() / 'projects'
 DB_DIR         = Path.home() / '.ai-agent'
 INDEX_DB_PATH  = DB_DIR / 'code_index.db'
-OLLAMA_URL     = 'http://localhost:11434/api/embeddings'
-EMBED_MODEL    = 'nomic-embed-text'
+ANN_INDEX_PATH = DB_DIR / 'code_index.ivf.npz'
+INDEX_LOCK_PATH = DB_DIR / 'code_index.lock'
 EMBED_DIM      = 768
 CHUNK_LINES    = 60    # velikost chunků pro nepy soubory
 CHUNK_OVERLAP  = 10   # překryv mezi chunky
+RERANK_FACTOR  = 4    # --exact: kolikrát víc ANN kandidátů přeskórovat
+INDEX_WORKERS     = 4    # chunker pool (čtení + dělení souborů)
+EMBED_CONCURRENCY = 2    # souběžné embedding requesty na Ollamu
+EMBED_BATCH       = 32   # chunků na jeden /api/embed request
+COMMIT_EVERY      = 50   # writer commituje po tolika souborech
+COMPACT_MIN_DEAD = 1000   # kompakce vektorového souboru od tolika mrtvých řádků…
+COMPACT_RATIO    = 0.25   # …a zároveň od tohoto podílu mrtvých řádků
+VEC_FORMAT       = 'float16'  # formát nového indexu (float32 / float16 / int8)
+RECALL_SAMPLE_ROWS = 50_000   # --recall-check: max. řádků reference
+RRF_K            = 60     # hybrid: konstanta reciprocal-rank fusion
+HYBRID_FACTOR    = 4      # hybrid: kandidátů z každého pořadí = top × faktor
+FTS_WEIGHTS      = (1.0, 4.0, 2.0)   # BM25 váhy sloupců content, name, filepath
 
 # Přípony k indexování
 CODE_EXTENSIONS = {'.py', '.js', '.ts', '.jsx', '.tsx', '.java', '.sql', '.sh'}
@@ -82,45 +120,344 @@ def init_index_db() -> sqlite3.Connection:
             chunk_type  TEXT,
             name        TEXT,
             content     TEXT NOT NULL,
-            embedding   BLOB NOT NULL,
+            embedding   BLOB NOT NULL,  -- legacy; embeddingy jsou ve .vec souboru
             indexed_at  DATETIME DEFAULT CURRENT_TIMESTAMP,
-            file_mtime  REAL
+            file_mtime  REAL,
+            vec_row     INTEGER,
+            content_hash TEXT
+        )
+    """)
+    # Globální hash → řádek .vec souboru (dedup shodných chunků napříč soubory/projekty)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chunk_vectors (
+            content_hash TEXT PRIMARY KEY,
+            vec_row      INTEGER NOT NULL
+        )
+    """)
+    # Manifest indexovaných souborů — co se od poslední indexace změnilo
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS files (
+            path         TEXT PRIMARY KEY,   -- relativně k PROJECTS_ROOT
+            size         INTEGER NOT NULL,
+            mtime_ns     INTEGER NOT NULL,
+            content_hash TEXT NOT NULL       -- SHA-256 obsahu souboru
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS index_meta (
+            key   TEXT PRIMARY KEY,
+            value TEXT
         )
     """)
+    for sql in [
+        "ALTER TABLE code_chunks ADD COLUMN vec_row INTEGER",
+        "ALTER TABLE code_chunks ADD COLUMN content_hash TEXT",
+    ]:
+        try:
+            conn.execute(sql)
+        except sqlite3.OperationalError:
+            pass
     conn.execute("CREATE INDEX IF NOT EXISTS idx_project  ON code_chunks(project)")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_filepath ON code_chunks(filepath)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_content_hash ON code_chunks(content_hash)")
+    _init_fts(conn)
     conn.commit()
     return conn
 
 
-def store_embedding(arr: np.ndarray) -> bytes:
-    """Serializuje numpy float32 array do BLOB."""
-    return arr.astype(np.float32).tobytes()
+class IndexLocked(RuntimeError):
+    """Index právě zapisuje jiný proces."""
+
+
+_lock_guard = threading.Lock()
+_lock_depth = 0
+_lock_file  = None
+
+
+@contextmanager
+def index_lock() -> Iterator[None]:
+    """
+    Výhradní zámek zápisu do indexu napříč procesy (flock na INDEX_LOCK_PATH).
+    Dva indexery by si navzájem přepisovaly řádky .vec souboru (append počítá
+    s tím, že je jediný) a kompakce by smazala generaci, do které druhý píše —
+    druhý proto skončí IndexLocked, místo aby čekal. V rámci procesu je zámek
+    reentrantní (cmd_index → run_pipeline / index_file).
+    """
+    global _lock_depth, _lock_file
+    with _lock_guard:
+        if _lock_depth == 0:
+            DB_DIR.mkdir(exist_ok=True)
+            f = open(INDEX_LOCK_PATH, 'a+')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.seek(0)
+                holder = f.read().strip() or '?'
+                f.close()
+                raise IndexLocked(f"Index právě zapisuje jiný proces (pid {holder}, "
+                                  f"např. agent index --watch)") from None
+            f.truncate(0)
+            f.write(str(os.getpid()))
+            f.flush()
+            _lock_file = f
+        _lock_depth += 1
+    try:
+        yield
+    finally:
+        with _lock_guard:
+            _lock_depth -= 1
+            if _lock_depth == 0:
+                fcntl.flock(_lock_file, fcntl.LOCK_UN)
+                _lock_file.close()
+                _lock_file = None
+
+
+def _init_fts(conn: sqlite3.Connection) -> None:
+    """
+    FTS5 external-content tabulka nad code_chunks (content, name, filepath).
+    Triggery ji drží v souladu při každém INSERT/DELETE/UPDATE chunků
+    (index_file i pipeline writer); při založení se naplní ze stávajících dat.
+    SQLite bez FTS5 → lexikální hledání není k dispozici.
+    """
+    if conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'code_chunks_fts'"
+    ).fetchone():
+        return
+    try:
+        conn.execute("""
+            CREATE VIRTUAL TABLE code_chunks_fts USING fts5(
+                content, name, filepath,
+                content = 'code_chunks', content_rowid = 'id'
+            )
+        """)
+    except sqlite3.OperationalError:
+        return
+    conn.executescript("""
+        CREATE TRIGGER IF NOT EXISTS trg_code_chunks_fts_ins AFTER INSERT ON code_chunks BEGIN
+            INSERT INTO code_chunks_fts (rowid, content, name, filepath)
+            VALUES (NEW.id, NEW.content, NEW.name, NEW.filepath);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_code_chunks_fts_del AFTER DELETE ON code_chunks BEGIN
+            INSERT INTO code_chunks_fts (code_chunks_fts, rowid, content, name, filepath)
+            VALUES ('delete', OLD.id, OLD.content, OLD.name, OLD.filepath);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_code_chunks_fts_upd
+        AFTER UPDATE OF content, name, filepath ON code_chunks BEGIN
+            INSERT INTO code_chunks_fts (code_chunks_fts, rowid, content, name, filepath)
+            VALUES ('delete', OLD.id, OLD.content, OLD.name, OLD.filepath);
+            INSERT INTO code_chunks_fts (rowid, content, name, filepath)
+            VALUES (NEW.id, NEW.content, NEW.name, NEW.filepath);
+        END;
+    """)
+    conn.execute("INSERT INTO code_chunks_fts (code_chunks_fts) VALUES ('rebuild')")
+
+
+def has_fts(conn: sqlite3.Connection) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'code_chunks_fts'"
+    ).fetchone() is not None
+
+
+def _meta_get(conn: sqlite3.Connection, key: str, default: str = '') -> str:
+    row = conn.execute("SELECT value FROM index_meta WHERE key = ?", (key,)).fetchone()
+    return row['value'] if row else default
+
 
+def _meta_set(conn: sqlite3.Connection, key: str, value: str) -> None:
+    conn.execute(
+        "INSERT INTO index_meta (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, value)
+    )
+
+
+def _vec_path(gen: int) -> Path:
+    return DB_DIR / f'code_index.{gen}.vec'
+
+
+def open_vectors(conn: sqlite3.Connection, upgrade: bool = True) -> VectorFile:
+    """
+    Otevře aktuální generaci vektorového souboru v jeho formátu.
+    upgrade: při prvním použití uloží formát, přesune legacy BLOB embeddingy
+    z code_chunks do souboru a dopočítá hashe — to zapisuje, takže pod
+    index_lock. Hledání otevírá s upgrade=False a index nemění.
+    """
+    with index_lock() if upgrade else nullcontext():
+        path = _vec_path(int(_meta_get(conn, 'vec_generation', '0')))
+        fmt  = _meta_get(conn, 'vec_format')
+        if not fmt:
+            # Soubor z doby před kvantizací je float32; nový index dostane VEC_FORMAT
+            fmt = 'float32' if path.exists() and path.stat().st_size else VEC_FORMAT
+            if upgrade:
+                _meta_set(conn, 'vec_format', fmt)
+                conn.commit()
+        vecs = VectorFile(path, EMBED_DIM, fmt)
+        if upgrade:
+            if needs_migration(conn):
+                _migrate_blobs(conn, vecs)
+            if conn.execute("SELECT 1 FROM code_chunks WHERE content_hash IS NULL LIMIT 1").fetchone():
+                _backfill_hashes(conn)
+    return vecs
+
+
+def needs_migration(conn: sqlite3.Connection) -> bool:
+    """Zbyly chunky s legacy BLOB embeddingem (bez řádku v .vec souboru)?"""
+    return conn.execute(
+        "SELECT 1 FROM code_chunks WHERE vec_row IS NULL LIMIT 1"
+    ).fetchone() is not None
+
+
+def chunk_hash(content: str) -> str:
+    """SHA-256 obsahu chunku včetně embedding modelu (jiný model = jiný vektor)."""
+    return hashlib.sha256(f'{EMBED_MODEL}\0{content}'.encode()).hexdigest()
+
+
+def _backfill_hashes(conn: sqlite3.Connection) -> None:
+    """Jednorázově dopočítá content_hash starým chunkům a zaregistruje jejich vektory."""
+    rows = conn.execute(
+        "SELECT id, content, vec_row FROM code_chunks WHERE content_hash IS NULL"
+    ).fetchall()
+    hashes = [(chunk_hash(r['content']), r['id'], r['vec_row']) for r in rows]
+    conn.executemany("UPDATE code_chunks SET content_hash = ? WHERE id = ?",
+                     [(h, i) for h, i, _ in hashes])
+    conn.executemany("INSERT OR IGNORE INTO chunk_vectors (content_hash, vec_row) VALUES (?, ?)",
+                     [(h, v) for h, _, v in hashes])
+    conn.commit()
 
-def load_embedding(blob: bytes) -> np.ndarray:
-    """Deserializuje BLOB na numpy float32 array."""
-    return np.frombuffer(blob, dtype=np.float32)
+
+def gc_chunk_vectors(conn: sqlite3.Connection) -> int:
+    """Odregistruje hashe, které už nepoužívá žádný chunk. Vrátí počet smazaných."""
+    cur = conn.execute("""
+        DELETE FROM chunk_vectors WHERE NOT EXISTS (
+            SELECT 1 FROM code_chunks c WHERE c.content_hash = chunk_vectors.content_hash
+        )
+    """)
+    conn.commit()
+    return cur.rowcount
+
+
+def _migrate_blobs(conn: sqlite3.Connection, vecs: VectorFile, batch: int = 2048) -> None:
+    """Jednorázová migrace: BLOB embeddingy → .vec soubor, BLOB se vyprázdní."""
+    last_id = 0
+    while True:
+        rows = conn.execute("""
+            SELECT id, embedding FROM code_chunks
+            WHERE vec_row IS NULL AND id > ?
+            ORDER BY id LIMIT ?
+        """, (last_id, batch)).fetchall()
+        if not rows:
+            break
+        start = vecs.append(_normalize_rows(
+            np.stack([quantize.decode(r['embedding'], EMBED_DIM) for r in rows])
+        ))
+        conn.executemany(
+            "UPDATE code_chunks SET vec_row = ?, embedding = X'' WHERE id = ?",
+            [(start + i, r['id']) for i, r in enumerate(rows)]
+        )
+        conn.commit()
+        last_id = rows[-1]['id']
+    conn.execute("VACUUM")
+
+
+_LIVE_ROWS_SQL = """
+    SELECT vec_row FROM code_chunks WHERE vec_row IS NOT NULL
+    UNION
+    SELECT vec_row FROM chunk_vectors
+"""
+
+
+def dead_vector_rows(conn: sqlite3.Connection, vecs: VectorFile) -> int:
+    """Počet řádků souboru, na které už nic neodkazuje (tombstones)."""
+    live = conn.execute(f"SELECT COUNT(*) AS n FROM ({_LIVE_ROWS_SQL})").fetchone()['n']
+    return vecs.rows - live
+
+
+@index_lock()
+def compact_vectors(conn: sqlite3.Connection, vecs: VectorFile,
+                    fmt: str | None = None) -> VectorFile:
+    """
+    Přepíše živé řádky do nové generace souboru a přečísluje vec_row.
+    Generace se v DB přepne ve stejné transakci jako vec_row; starý soubor
+    se smaže až po commitu. fmt: zároveň převést do jiného formátu.
+    """
+    fmt = fmt or vecs.fmt
+    keep = np.array(
+        sorted(r['vec_row'] for r in conn.execute(_LIVE_ROWS_SQL)), dtype=np.int64
+    )
+    chunks = conn.execute(
+        "SELECT id, vec_row FROM code_chunks WHERE vec_row IS NOT NULL"
+    ).fetchall()
+    shared = conn.execute("SELECT content_hash, vec_row FROM chunk_vectors").fetchall()
+
+    gen     = int(_meta_get(conn, 'vec_generation', '0')) + 1
+    new_vec = VectorFile(_vec_path(gen), EMBED_DIM, fmt)
+    vecs.copy_rows_to(new_vec.path, keep, fmt=fmt)
+
+    # Přečíslování přes id/hash (ne přes vec_row — kolidovalo by se starými čísly)
+    def remap(rows: list[sqlite3.Row]) -> list[int]:
+        return np.searchsorted(keep, [r['vec_row'] for r in rows]).tolist()
+
+    conn.executemany(
+        "UPDATE code_chunks SET vec_row = ? WHERE id = ?",
+        zip(remap(chunks), [r['id'] for r in chunks])
+    )
+    conn.executemany(
+        "UPDATE chunk_vectors SET vec_row = ? WHERE content_hash = ?",
+        zip(remap(shared), [r['content_hash'] for r in shared])
+    )
+    _meta_set(conn, 'vec_generation', str(gen))
+    _meta_set(conn, 'vec_format', fmt)
+    conn.commit()
+
+    vecs.close()
+    vecs.path.unlink(missing_ok=True)
+    return new_vec
 
 
 # ─── Embeddingy ───────────────────────────────────────────────────────────────
 
 def get_embedding(text: str) -> np.ndarray:
-    """Získá embedding přes Ollama nomic-embed-text HTTP API."""
-    payload = json.dumps({'model': EMBED_MODEL, 'prompt': text}).encode()
-    req = urllib.request.Request(
-        OLLAMA_URL, data=payload,
-        headers={'Content-Type': 'application/json'}
-    )
+    """
+    Získá embedding přes sdílenou embedding službu (nomic-embed-text).
+    Dotazy se cachují (LRU + embed_cache.db) — opakovaný search neplatí Ollamu.
+    """
+    return embeddings.embed(text, EMBED_MODEL)
+
+
+def get_embeddings(texts: list[str]) -> np.ndarray:
+    """
+    Batch embedding — jeden request na /api/embed pro celý seznam textů.
+    Vrátí matici (len(texts) × EMBED_DIM). Obchází embed cache: chunky
+    deduplikuje content_hash (chunk_vectors) a vektory už leží v .vec souboru.
+    """
+    return np.stack(embeddings.embed_many(texts, EMBED_MODEL, cache=False))
+
+
+def _embed_batch(texts: list[str]) -> list[np.ndarray | None]:
+    """
+    Batch embedding s fallbackem: pokud selže celý batch (ne kvůli
+    nedostupné Ollamě), zkusí texty po jednom; neúspěšné → None.
+    """
     try:
-        with urllib.request.urlopen(req, timeout=30) as r:
-            data = json.loads(r.read())
-        return np.array(data['embedding'], dtype=np.float32)
-    except urllib.error.URLError as e:
-        raise RuntimeError(
-            f"Ollama nedostupná ({OLLAMA_URL}): {e}\n"
-            "  Spusť: ollama serve"
-        )
+        return list(get_embeddings(texts))
+    except RuntimeError:
+        raise
+    except Exception:
+        pass
+    out: list[np.ndarray | None] = []
+    for t in texts:
+        try:
+            out.append(embeddings.embed(t, EMBED_MODEL, cache=False))
+        except RuntimeError:
+            raise
+        except Exception:
+            out.append(None)  # přeskočit chunk kde embedding selhal
+    return out
+
+
+def _normalize_rows(m: np.ndarray) -> np.ndarray:
+    m = np.asarray(m, dtype=np.float32)
+    return m / (np.linalg.norm(m, axis=-1, keepdims=True) + 1e-10)
 
 
 def cosine_similarity(query: np.ndarray, matrix: np.ndarray) -> np.ndarray:
@@ -130,6 +467,29 @@ def cosine_similarity(query: np.ndarray, matrix: np.ndarray) -> np.ndarray:
     return (matrix / norms) @ q
 
 
+# ─── ANN index ────────────────────────────────────────────────────────────────
+
+def ann_is_fresh(conn: sqlite3.Connection, ann: IVFIndex | None) -> bool:
+    """Index odpovídá DB, pokud sedí počet chunků i nejvyšší id."""
+    if ann is None:
+        return False
+    row = conn.execute("SELECT COUNT(*) AS n, MAX(id) AS max_id FROM code_chunks").fetchone()
+    if row['n'] != len(ann):
+        return False
+    return row['n'] == 0 or int(ann.ids.max()) == row['max_id']
+
+
+def rebuild_ann(conn: sqlite3.Connection, vecs: VectorFile) -> IVFIndex:
+    """Postaví ANN index znovu ze všech embeddingů ve vektorovém souboru a uloží ho."""
+    rows = conn.execute("SELECT id, vec_row FROM code_chunks ORDER BY id").fetchall()
+    ann  = IVFIndex(EMBED_DIM)
+    if rows:
+        ann.build(np.array([r['id'] for r in rows], dtype=np.int64),
+                  vecs.take([r['vec_row'] for r in rows]))
+    ann.save(ANN_INDEX_PATH)
+    return ann
+
+
 # ─── Chunking ─────────────────────────────────────────────────────────────────
 
 def chunk_python(lines: list[str], filepath: str) -> list[dict]:
@@ -275,122 +635,652 @@ def get_project_files(project: str | None = None,
         return [p for p in paths if p.exists() and p.suffix.lower() in extensions]
 
     search_root = PROJECTS_ROOT / project if project else PROJECTS_ROOT
-    files = []
+    return sorted(p for p, _ in walk_files(search_root, extensions))
 
-    for p in search_root.rglob('*'):
-        if not p.is_file():
-            continue
-        if any(skip in p.parts for skip in SKIP_DIRS):
-            continue
-        if p.suffix.lower() not in extensions:
-            continue
-        # Přeskočit backup soubory
-        if '.backup-' in p.name:
+
+def walk_files(root: Path, extensions: set) -> Iterator[tuple[Path, os.stat_result]]:
+    """
+    Indexovatelné soubory pod root + jejich stat. os.scandir s prořezáváním:
+    do SKIP_DIRS (node_modules, .git, …) se vůbec nesestupuje, typ položky
+    se bere z readdir bez dalšího stat().
+    """
+    stack = [str(root)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
             continue
-        files.append(p)
+        with it:
+            for entry in it:
+                if entry.name in SKIP_DIRS:
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    if not entry.is_file():
+                        continue
+                    if (os.path.splitext(entry.name)[1].lower() not in extensions
+                            or '.backup-' in entry.name):
+                        continue
+                    yield Path(entry.path), entry.stat()
+                except OSError:
+                    continue   # smazáno během procházení
+
+
+def file_hash(filepath: Path) -> str:
+    return hashlib.sha256(filepath.read_bytes()).hexdigest()
+
+
+def diff_manifest(conn: sqlite3.Connection, walked: list[tuple[Path, os.stat_result]],
+                  project: str | None, extensions: set,
+                  force: bool = False) -> tuple[list[Path], list[str], int]:
+    """
+    Porovná průchod s manifestem `files` (jeden SELECT, ne dotaz per soubor).
+    Vrátí (změněné soubory, relativní cesty smazaných, počet beze změny).
+    Jiné mtime při stejné velikosti → rozhodne hash obsahu (touch, checkout);
+    soubor z doby před manifestem se převezme podle code_chunks.file_mtime.
+    """
+    prefix = f'{project}/' if project else ''
+    def in_scope(rel: str) -> bool:
+        return rel.startswith(prefix) and os.path.splitext(rel)[1].lower() in extensions
+
+    manifest = {
+        r['path']: (r['size'], r['mtime_ns'], r['content_hash'])
+        for r in conn.execute("SELECT path, size, mtime_ns, content_hash FROM files")
+    }
+    legacy: dict[str, float] | None = None
+
+    changed: list[Path] = []
+    adopt:   list[tuple] = []     # (path, size, mtime_ns, hash) bez reindexace
+    seen:    set[str]   = set()
+    for p, st in walked:
+        rel = str(p.relative_to(PROJECTS_ROOT))
+        prev = manifest.get(rel)
+        try:
+            if force:
+                changed.append(p)
+            elif prev is not None:
+                if prev[:2] == (st.st_size, st.st_mtime_ns):
+                    pass
+                elif prev[0] == st.st_size and file_hash(p) == prev[2]:
+                    adopt.append((rel, st.st_size, st.st_mtime_ns, prev[2]))
+                else:
+                    changed.append(p)
+            else:
+                if legacy is None:
+                    legacy = {r['filepath']: r['mtime'] for r in conn.execute(
+                        "SELECT filepath, MAX(file_mtime) AS mtime FROM code_chunks GROUP BY filepath"
+                    )}
+                old = legacy.get(rel)
+                if old and abs(old - st.st_mtime) < 1.0:
+                    adopt.append((rel, st.st_size, st.st_mtime_ns, file_hash(p)))
+                else:
+                    changed.append(p)
+        except FileNotFoundError:
+            continue   # smazán od průchodu → mezi smazanými níže
+        seen.add(rel)
+
+    # Smazané: v manifestu nebo v code_chunks, ale ne na disku
+    indexed = set(manifest) | {r['filepath'] for r in conn.execute(
+        "SELECT DISTINCT filepath FROM code_chunks"
+    )}
+    gone = sorted(rel for rel in indexed - seen if in_scope(rel))
+
+    if adopt:
+        conn.executemany(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, content_hash) VALUES (?, ?, ?, ?)",
+            adopt
+        )
+        conn.commit()
+    return changed, gone, len(seen) - len(changed)
+
 
-    return sorted(files)
+def is_indexable(path: Path, extensions: set) -> bool:
+    """Cesta pod PROJECTS_ROOT mimo SKIP_DIRS, se správnou příponou, ne backup."""
+    if any(skip in path.parts for skip in SKIP_DIRS):
+        return False
+    if path.suffix.lower() not in extensions:
+        return False
+    # Přeskočit backup soubory
+    return '.backup-' not in path.name
 
 
-def index_file(conn: sqlite3.Connection, filepath: Path, force: bool = False) -> int:
+@dataclass
+class FileJob:
     """
-    Indexuje jeden soubor. Vrátí počet nových chunků.
-    Přeskočí soubor pokud mtime nezměněno (pokud force=False).
+    Jeden soubor na cestě pipeline: chunky → embeddingy → zápis.
+    rows[i]: řádek .vec souboru znovu použitý podle content_hash (jinak None),
+    vecs[i]: nově spočtený embedding pro chunky bez známého hashe.
     """
-    rel_path  = str(filepath.relative_to(PROJECTS_ROOT))
-    project   = rel_path.split('/')[0] if '/' in rel_path else '_root'
-    language  = filepath.suffix.lstrip('.').lower()
-    mtime     = filepath.stat().st_mtime
-
-    # Kontrola mtime — přeskočit pokud nezměněno
-    if not force:
-        existing = conn.execute(
-            "SELECT file_mtime FROM code_chunks WHERE filepath = ? LIMIT 1",
-            (rel_path,)
-        ).fetchone()
-        if existing and existing['file_mtime'] and abs(existing['file_mtime'] - mtime) < 1.0:
-            return 0  # beze změny
+    rel_path: str
+    project:  str
+    language: str
+    mtime:    float
+    chunks:   list[dict]
+    size:     int = 0
+    mtime_ns: int = 0
+    file_hash: str = ''
+    rows:     list[int | None] = field(default_factory=list)
+    vecs:     list[np.ndarray | None] = field(default_factory=list)
+    pending:  int = 0
+
+    def resolve(self, known: dict[str, int]) -> list[int]:
+        """Doplní rows ze známých hashů; vrátí indexy chunků k embeddingu."""
+        todo = []
+        for i, c in enumerate(self.chunks):
+            row = known.get(c['hash'])
+            if row is None:
+                todo.append(i)
+            else:
+                self.rows[i] = row
+        self.pending = len(todo)
+        return todo
+
+
+def _file_job(filepath: Path, st: os.stat_result) -> FileJob:
+    rel_path = str(filepath.relative_to(PROJECTS_ROOT))
+    chunks   = get_chunks(filepath)
+    for c in chunks:
+        c['hash'] = chunk_hash(c['content'])
+    return FileJob(
+        rel_path  = rel_path,
+        project   = rel_path.split('/')[0] if '/' in rel_path else '_root',
+        language  = filepath.suffix.lstrip('.').lower(),
+        mtime     = st.st_mtime,
+        chunks    = chunks,
+        rows      = [None] * len(chunks),
+        vecs      = [None] * len(chunks),
+        size      = st.st_size,
+        mtime_ns  = st.st_mtime_ns,
+        file_hash = file_hash(filepath),
+    )
 
-    # Smazat staré chunky pro tento soubor
-    conn.execute("DELETE FROM code_chunks WHERE filepath = ?", (rel_path,))
 
-    # Chunking
-    raw_chunks = get_chunks(filepath)
-    if not raw_chunks:
-        conn.commit()
-        return 0
+def _write_job(conn: sqlite3.Connection, job: FileJob, vecs: VectorFile,
+               ann: IVFIndex | None, replace: bool = False) -> int:
+    """
+    Nahradí chunky souboru novými (bez commitu). Vrátí počet zapsaných chunků.
+    Nové embeddingy se připíšou do .vec souboru a zaregistrují v chunk_vectors;
+    chunky se známým hashem jen odkážou na existující řádek.
+    replace (--force): nový embedding přepíše registraci hashe místo reuse.
+    Staré řádky .vec souboru se jen přestanou odkazovat (viz compact_vectors).
+    """
+    if ann is not None:
+        ann.remove([r['id'] for r in conn.execute(
+            "SELECT id FROM code_chunks WHERE filepath = ?", (job.rel_path,)
+        )])
+    conn.execute("DELETE FROM code_chunks WHERE filepath = ?", (job.rel_path,))
+
+    # Nové vektory — mezitím je mohl zaregistrovat jiný soubor téhož běhu
+    fresh: dict[str, list[int]] = {}
+    for i, c in enumerate(job.chunks):
+        if job.rows[i] is not None or job.vecs[i] is None:
+            continue
+        hit = None if replace else conn.execute(
+            "SELECT vec_row FROM chunk_vectors WHERE content_hash = ?", (c['hash'],)
+        ).fetchone()
+        if hit:
+            job.rows[i] = hit['vec_row']
+        else:
+            fresh.setdefault(c['hash'], []).append(i)
+
+    if fresh:
+        # Jedním zápisem na konec .vec souboru, duplicitní chunky jen jednou
+        start = vecs.append(_normalize_rows(
+            np.stack([job.vecs[idx[0]] for idx in fresh.values()])
+        ))
+        for n, (h, idx) in enumerate(fresh.items()):
+            for i in idx:
+                job.rows[i] = start + n
+        conn.executemany(
+            f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO chunk_vectors "
+            f"(content_hash, vec_row) VALUES (?, ?)",
+            [(h, start + n) for n, h in enumerate(fresh)]
+        )
 
-    count = 0
-    for chunk in raw_chunks:
-        try:
-            emb = get_embedding(chunk['content'])
-        except RuntimeError:
-            raise
-        except Exception:
-            continue  # přeskočit chunk kde embedding selhal
+    keep = [i for i in range(len(job.chunks)) if job.rows[i] is not None]
 
+    # Manifest jen pro kompletně zaindexovaný soubor (jinak se zkusí znovu)
+    if len(keep) == len(job.chunks):
         conn.execute(
-            """INSERT INTO code_chunks
-               (filepath, project, language, chunk_start, chunk_end,
-                chunk_type, name, content, embedding, file_mtime)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (rel_path, project, language,
-             chunk['start'], chunk['end'],
-             chunk['type'], chunk['name'],
-             chunk['content'], store_embedding(emb), mtime)
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, content_hash) VALUES (?, ?, ?, ?)",
+            (job.rel_path, job.size, job.mtime_ns, job.file_hash)
         )
-        count += 1
+    else:
+        conn.execute("DELETE FROM files WHERE path = ?", (job.rel_path,))
+    if not keep:
+        return 0
+
+    conn.executemany(
+        """INSERT INTO code_chunks
+           (filepath, project, language, chunk_start, chunk_end,
+            chunk_type, name, content, embedding, file_mtime, vec_row, content_hash)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, X'', ?, ?, ?)""",
+        [(job.rel_path, job.project, job.language,
+          job.chunks[i]['start'], job.chunks[i]['end'],
+          job.chunks[i]['type'], job.chunks[i]['name'],
+          job.chunks[i]['content'], job.mtime, job.rows[i], job.chunks[i]['hash'])
+         for i in keep]
+    )
+    if ann is not None:
+        rows = conn.execute(
+            "SELECT id, vec_row FROM code_chunks WHERE filepath = ?", (job.rel_path,)
+        ).fetchall()
+        ann.add([r['id'] for r in rows], vecs.take([r['vec_row'] for r in rows]))
+    return len(keep)
+
+
+def _known_hashes(conn: sqlite3.Connection, hashes: list[str] | None = None) -> dict[str, int]:
+    """content_hash → vec_row; bez argumentu celá tabulka chunk_vectors."""
+    if hashes is None:
+        rows = conn.execute("SELECT content_hash, vec_row FROM chunk_vectors")
+    else:
+        rows = conn.execute(
+            f"SELECT content_hash, vec_row FROM chunk_vectors "
+            f"WHERE content_hash IN ({','.join('?' * len(hashes))})", hashes
+        )
+    return {r['content_hash']: r['vec_row'] for r in rows}
+
+
+@index_lock()
+def index_file(conn: sqlite3.Connection, filepath: Path, force: bool = False,
+               ann: IVFIndex | None = None, vecs: VectorFile | None = None) -> int:
+    """
+    Indexuje jeden soubor. Vrátí počet nových chunků.
+    Přeskočí soubor pokud velikost a mtime sedí s manifestem (pokud force=False).
+    ann: pokud zadán, inkrementálně se v něm odeberou staré a přidají nové chunky.
+    vecs: vektorový soubor (výchozí: aktuální generace); staré řádky se jen
+          přestanou odkazovat a uvolní je až compact_vectors().
+    Pro hromadné indexování viz run_pipeline().
+    """
+    if vecs is None:
+        vecs = open_vectors(conn)
+    rel_path  = str(filepath.relative_to(PROJECTS_ROOT))
+    try:
+        st = filepath.stat()
+        if not force:
+            existing = conn.execute(
+                "SELECT size, mtime_ns FROM files WHERE path = ?", (rel_path,)
+            ).fetchone()
+            if existing and tuple(existing) == (st.st_size, st.st_mtime_ns):
+                return 0  # beze změny
+        job = _file_job(filepath, st)
+    except FileNotFoundError:
+        # Smazán mezitím → pryč i z indexu
+        remove_files(conn, [rel_path], ann)
+        conn.commit()
+        return 0
 
+    todo = job.resolve({} if force else _known_hashes(conn, [c['hash'] for c in job.chunks]))
+    for s in range(0, len(todo), EMBED_BATCH):
+        batch = todo[s:s + EMBED_BATCH]
+        for i, v in zip(batch, _embed_batch([job.chunks[i]['content'] for i in batch])):
+            job.vecs[i] = v
+
+    count = _write_job(conn, job, vecs, ann, replace=force)
     conn.commit()
     return count
 
 
+def remove_files(conn: sqlite3.Connection, rel_paths: list[str],
+                 ann: IVFIndex | None = None) -> int:
+    """
+    Odstraní chunky smazaných souborů (bez commitu — volající drží index_lock).
+    Cesta může být i adresář (přesunutý / smazaný celý) — odstraní se vše pod
+    ním. Vrátí počet chunků.
+    """
+    removed = 0
+    for rel in rel_paths:
+        cond   = "filepath = ? OR substr(filepath, 1, ?) = ?"
+        params = (rel, len(rel) + 1, rel + '/')
+        conn.execute(f"DELETE FROM files WHERE {cond.replace('filepath', 'path')}", params)
+        ids = [r['id'] for r in conn.execute(f"SELECT id FROM code_chunks WHERE {cond}", params)]
+        if not ids:
+            continue
+        if ann is not None:
+            ann.remove(ids)
+        conn.execute(f"DELETE FROM code_chunks WHERE {cond}", params)
+        removed += len(ids)
+    return removed
+
+
+@index_lock()
+def run_pipeline(files, force: bool = False, ann: IVFIndex | None = None,
+                 vecs: VectorFile | None = None, workers: int = INDEX_WORKERS,
+                 concurrency: int = EMBED_CONCURRENCY,
+                 batch_size: int = EMBED_BATCH) -> tuple[int, int, int]:
+    """
+    Paralelní indexování: producer (procházení souborů + filtr dle manifestu)
+    → chunker pool (+ content hash) → omezený počet souběžných batch embedding
+    requestů jen pro chunky s neznámým hashem → jediný writer thread
+    (executemany, commit po COMMIT_EVERY souborech).
+
+    Každý neznámý hash se embedduje jednou za běh: shodný chunk, jehož hash
+    už je rozpracovaný v jiném batchi / souboru, na výsledek počká (inflight),
+    hotový a ještě nezapsaný vektor se převezme (ready), zapsaný se odkáže
+    na jeho řádek (hashes). force: známé hashe z DB se nepoužijí.
+
+    files: iterovatelné cesty (může být líný generátor).
+    Vrátí (počet zapsaných chunků, počet přeskočených souborů, počet
+    chunků se znovu použitým embeddingem).
+    """
+    conn = init_index_db()
+    if vecs is None:
+        vecs = open_vectors(conn)
+    known = {} if force else {
+        r['path']: (r['size'], r['mtime_ns'])
+        for r in conn.execute("SELECT path, size, mtime_ns FROM files")
+    }
+    hashes = {} if force else _known_hashes(conn)   # hash → vec_row (doplňuje writer)
+    conn.close()
+
+    jobs: queue.Queue    = queue.Queue(maxsize=4 * workers)
+    written: queue.Queue = queue.Queue()
+    stop   = threading.Event()
+    errors: list[BaseException] = []
+    vanished: list[str] = []   # soubory, které zmizely během běhu → remove_files
+    stats  = {'chunks': 0, 'unchanged': 0, 'empty': 0, 'reused': 0}  # každý klíč píše jen jedno vlákno
+    pending_lock = threading.Lock()   # job.pending, hashes, inflight, ready
+    inflight: dict[str, list[tuple[FileJob, int]]] = {}   # hash v embeddingu → čekající chunky
+    ready:    dict[str, np.ndarray] = {}                  # hash s embeddingem, zatím nezapsaný
+
+    # ── 1. Producer: procházení + mtime filtr + chunker pool ────────────────
+    def put_job(rel: str, fut) -> None:
+        try:
+            jobs.put(fut.result())
+        except FileNotFoundError:
+            vanished.append(rel)   # smazán / přejmenován mezi výpisem a čtením
+
+    def produce() -> None:
+        pending: deque = deque()
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as chunkers:
+                for fp in files:
+                    if stop.is_set():
+                        break
+                    rel = str(fp.relative_to(PROJECTS_ROOT))
+                    try:
+                        st = fp.stat()
+                    except FileNotFoundError:
+                        vanished.append(rel)
+                        continue
+                    if known.get(rel) == (st.st_size, st.st_mtime_ns):
+                        stats['unchanged'] += 1
+                        continue
+                    pending.append((rel, chunkers.submit(_file_job, fp, st)))
+                    while len(pending) > 2 * workers:
+                        put_job(*pending.popleft())
+                while pending:
+                    put_job(*pending.popleft())
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            jobs.put(None)
+
+    # ── 3. Writer: jediné spojení, bulk insert ──────────────────────────────
+    def write() -> None:
+        wconn = init_index_db()
+        done  = 0
+        try:
+            while (job := written.get()) is not None:
+                if stop.is_set():
+                    continue  # chyba jinde — nepřepisovat chunky neúplnými daty
+                with pending_lock:
+                    for i, c in enumerate(job.chunks):
+                        if job.rows[i] is None:
+                            job.rows[i] = hashes.get(c['hash'])
+                count = _write_job(wconn, job, vecs, ann, replace=force)
+                with pending_lock:
+                    for c, row in zip(job.chunks, job.rows):
+                        if row is not None:
+                            hashes[c['hash']] = row
+                            ready.pop(c['hash'], None)
+                if count:
+                    print(f"  {G}+{count:>3}{R}  {C}{job.rel_path}{R}")
+                    stats['chunks'] += count
+                else:
+                    stats['empty'] += 1
+                done += 1
+                if done % COMMIT_EVERY == 0:
+                    wconn.commit()
+            wconn.commit()
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+            while written.get() is not None:  # odblokovat embedding stage
+                pass
+        finally:
+            wconn.close()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    writer   = threading.Thread(target=write, daemon=True)
+    producer.start()
+    writer.start()
+
+    # ── 2. Embedding stage: batche přes soubory, max `concurrency` najednou ──
+    slots = threading.BoundedSemaphore(concurrency)
+
+    def embed(batch: list[tuple[FileJob, int]]) -> None:
+        try:
+            if not stop.is_set():
+                out = _embed_batch([job.chunks[i]['content'] for job, i in batch])
+                for (job, i), v in zip(batch, out):
+                    job.vecs[i] = v
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            complete = []
+            with pending_lock:
+                for job, i in batch:
+                    h, v = job.chunks[i]['hash'], job.vecs[i]
+                    if v is not None:
+                        ready[h] = v
+                    waiting = inflight.pop(h, [])
+                    for other, j in waiting:
+                        other.vecs[j] = v
+                    for done in [job] + [other for other, _ in waiting]:
+                        done.pending -= 1
+                        if done.pending == 0:
+                            complete.append(done)
+            for job in complete:
+                written.put(job)
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as embedders:
+        def submit(batch: list[tuple[FileJob, int]]) -> None:
+            slots.acquire()
+            embedders.submit(embed, batch)
+
+        buf: list[tuple[FileJob, int]] = []
+        while (job := jobs.get()) is not None:
+            new = []
+            with pending_lock:
+                for i in job.resolve(hashes):
+                    h = job.chunks[i]['hash']
+                    if h in ready:
+                        job.vecs[i] = ready[h]
+                        job.pending -= 1
+                    elif h in inflight:
+                        inflight[h].append((job, i))   # počká na rozpracovaný embedding
+                    else:
+                        inflight[h] = []
+                        new.append(i)
+                complete = job.pending == 0
+            stats['reused'] += len(job.chunks) - len(new)
+            if complete:
+                written.put(job)  # vše známé (nebo prázdný soubor) — rovnou zápis
+                continue
+            buf.extend((job, i) for i in new)
+            while len(buf) >= batch_size:
+                submit(buf[:batch_size])
+                buf = buf[batch_size:]
+        if buf:
+            submit(buf)
+
+    written.put(None)
+    producer.join()
+    writer.join()
+    if errors:
+        raise errors[0]
+
+    if vanished:
+        conn = init_index_db()
+        remove_files(conn, vanished, ann)
+        conn.commit()
+        conn.close()
+        for rel in vanished:
+            print(f"  {Y}  −{R}  {D}{rel} (mezitím smazán){R}")
+    return stats['chunks'], stats['unchanged'] + stats['empty'], stats['reused']
+
+
+def cmd_vectors(args: argparse.Namespace) -> None:
+    """
+    agent index --recall-check / --vec-format FMT: recall@k jednotlivých
+    formátů vůči uloženým vektorům, volitelně převod souboru do FMT.
+    """
+    conn = init_index_db()
+    vecs = open_vectors(conn)
+    live = np.array(sorted(r['vec_row'] for r in conn.execute(_LIVE_ROWS_SQL)),
+                    dtype=np.int64)
+    if not len(live):
+        conn.close()
+        print(f"{Y}Žádné indexované vektory. Spusť: agent index{R}")
+        return
+
+    sample = live
+    if len(live) > RECALL_SAMPLE_ROWS:
+        sample = np.sort(np.random.default_rng(0).choice(live, RECALL_SAMPLE_ROWS,
+                                                         replace=False))
+    ref = vecs.take(sample)
+
+    print(f"\n{bold('VEKTORY')}  {D}{len(live)} živých řádků, formát {vecs.fmt}, "
+          f"{vecs.rows * vecs.row_bytes / 1e6:.1f} MB{R}")
+    print(f"{D}{'Formát':<10} {'B/řádek':>8} {'recall@5':>9}   (reference: {vecs.fmt}){R}")
+    for fmt in quantize.FORMATS:
+        recall = quantize.recall_at_k(ref, fmt, k=5)
+        mark   = f"  {C}← aktuální{R}" if fmt == vecs.fmt else ''
+        print(f"  {fmt:<8} {quantize.row_bytes(EMBED_DIM, fmt):>8} {recall:>9.3f}{mark}")
+
+    target = getattr(args, 'vec_format', None)
+    if target and target != vecs.fmt:
+        before = vecs.rows * vecs.row_bytes
+        vecs   = compact_vectors(conn, vecs, fmt=target)
+        print(f"\n  {G}✓ Převedeno na {target}:{R} {before / 1e6:.1f} MB → "
+              f"{vecs.rows * vecs.row_bytes / 1e6:.1f} MB")
+    conn.close()
+    print()
+
+
 def cmd_index(args: argparse.Namespace) -> None:
-    """Indexuje soubory do SQLite vector store."""
-    extensions = DOCS_EXTENSIONS if getattr(args, 'docs', False) else CODE_EXTENSIONS
+    """Indexuje soubory do SQLite vector store (po celou dobu drží index_lock)."""
+    try:
+        with index_lock():
+            if getattr(args, 'recall_check', False) or getattr(args, 'vec_format', None):
+                cmd_vectors(args)
+            else:
+                _index(args)
+    except IndexLocked as e:
+        print(f"{Y}{e}{R}")
 
-    files = get_project_files(
-        project    = getattr(args, 'project', None),
-        extensions = extensions,
-        diff_only  = getattr(args, 'diff', False)
-    )
 
-    if not files:
-        print(f"{Y}Žádné soubory k indexování.{R}")
+def _index(args: argparse.Namespace) -> None:
+    extensions = DOCS_EXTENSIONS if getattr(args, 'docs', False) else CODE_EXTENSIONS
+    project    = getattr(args, 'project', None)
+    force      = getattr(args, 'force', False)
+    compact    = getattr(args, 'compact', False)
+    watch      = getattr(args, 'watch', False)
+
+    conn = init_index_db()
+    if getattr(args, 'diff', False):
+        files, gone, unchanged = get_project_files(project, extensions, diff_only=True), [], 0
+    else:
+        root   = PROJECTS_ROOT / project if project else PROJECTS_ROOT
+        walked = list(walk_files(root, extensions))
+        files, gone, unchanged = diff_manifest(conn, walked, project, extensions, force)
+        if not walked and not gone and not watch:
+            conn.close()
+            print(f"{Y}Žádné soubory k indexování.{R}")
+            return
+
+    # Nic se nezměnilo → bez vektorů, ANN indexu i pipeline
+    if not files and not gone and not compact and ANN_INDEX_PATH.exists():
+        conn.close()
+        print(f"{G}✓ Index je aktuální{R} {D}({unchanged} souborů beze změny){R}")
+        if watch:
+            _watch(project, extensions, None, None, args)
         return
 
-    conn   = init_index_db()
-    force  = getattr(args, 'force', False)
-    total  = 0
-    skipped = 0
+    vecs = open_vectors(conn)
 
-    print(f"\n{bold('INDEXOVÁNÍ')}  {D}{len(files)} souborů{R}")
+    # ANN index se udržuje inkrementálně; pokud chybí nebo nesedí s DB,
+    # postaví se na konci znovu
+    ann = IVFIndex.load(ANN_INDEX_PATH)
+    if not ann_is_fresh(conn, ann):
+        ann = None
 
-    for fp in files:
-        rel = str(fp.relative_to(PROJECTS_ROOT))
-        count = index_file(conn, fp, force=force)
-        if count > 0:
-            print(f"  {G}+{count:>3}{R}  {C}{rel}{R}")
-            total += count
-        else:
-            skipped += 1
+    print(f"\n{bold('INDEXOVÁNÍ')}  {D}{len(files)} změněných souborů"
+          f"{f', {len(gone)} smazaných' if gone else ''}{R}")
+
+    removed = remove_files(conn, gone, ann)
+    conn.commit()
+    try:
+        total, skipped, reused = run_pipeline(
+            files, force=force, ann=ann, vecs=vecs,
+            workers     = getattr(args, 'workers', INDEX_WORKERS),
+            concurrency = getattr(args, 'concurrency', EMBED_CONCURRENCY),
+            batch_size  = getattr(args, 'batch_size', EMBED_BATCH),
+        )
+    except RuntimeError as e:
+        conn.close()
+        print(f"\033[91mChyba:{R} {e}")
+        return
+
+    vecs, ann = finish_index(conn, vecs, ann, compact=compact)
 
     conn.close()
-    print(f"\n  {bold('Hotovo:')} {total} chunků přidáno, {skipped} souborů beze změny.\n")
+    print(f"\n  {bold('Hotovo:')} {total} chunků přidáno "
+          f"{D}({reused} s již známým embeddingem){R}, {removed} odebráno, "
+          f"{unchanged + skipped} souborů beze změny.\n")
 
+    if watch:
+        _watch(project, extensions, vecs, ann, args)
 
-# ─── Vyhledávání ─────────────────────────────────────────────────────────────
 
-def cmd_search(args: argparse.Namespace) -> None:
-    """Sémantické vyhledávání přes indexovaný kód nebo dokumentaci."""
-    query   = args.query
-    top_n   = getattr(args, 'top', 5)
-    project = getattr(args, 'project', None)
-    scope   = getattr(args, 'scope', 'code')
+def _watch(project: str | None, extensions: set, vecs: VectorFile | None,
+           ann: IVFIndex | None, args: argparse.Namespace) -> None:
+    from _meta import index_watch
+    index_watch.watch(project=project, extensions=extensions, vecs=vecs, ann=ann, args=args)
 
-    conn = init_index_db()
 
-    # Sestavit WHERE
+@index_lock()
+def finish_index(conn: sqlite3.Connection, vecs: VectorFile, ann: IVFIndex | None,
+                 compact: bool = False) -> tuple[VectorFile, IVFIndex]:
+    """
+    Údržba po zápisu: GC sdílených vektorů, kompakce souboru při velkém podílu
+    tombstones, přestavba / uložení ANN indexu. Vrátí (vecs, ann) — po kompakci
+    nová generace souboru, po přestavbě nový index.
+    """
+    gc_chunk_vectors(conn)
+    dead = dead_vector_rows(conn, vecs)
+    if compact or (dead >= COMPACT_MIN_DEAD and dead >= COMPACT_RATIO * vecs.rows):
+        vecs = compact_vectors(conn, vecs)
+        print(f"  {D}Vektorový soubor zkompaktován: -{dead} řádků{R}")
+
+    if ann is None or ann.needs_retrain():
+        ann = rebuild_ann(conn, vecs)
+        print(f"  {D}ANN index přestavěn: {len(ann)} vektorů, {ann.nlist} seznamů{R}")
+    elif ann.dirty:
+        ann.save(ANN_INDEX_PATH)
+    return vecs, ann
+
+
+# ─── Vyhledávání ─────────────────────────────────────────────────────────────
+
+def _search_where(scope: str, project: str | None) -> tuple[str, list]:
+    """WHERE klauzule pro scope (code/docs) a volitelný projekt."""
     conditions = []
     params: list = []
 
@@ -405,42 +1295,17 @@ def cmd_search(args: argparse.Namespace) -> None:
         params.append(project)
 
     where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    return where, params
 
-    # Načíst všechny chunky + embeddingy
-    rows = conn.execute(f"""
-        SELECT id, filepath, project, language, chunk_start, chunk_end,
-               chunk_type, name, content, embedding
-        FROM code_chunks {where}
-    """, params).fetchall()
-
-    conn.close()
-
-    if not rows:
-        print(f"{Y}Žádné indexované soubory. Spusť: agent index{R}")
-        return
-
-    # Query embedding + cosine similarity
-    try:
-        q_emb = get_embedding(query)
-    except RuntimeError as e:
-        print(f"\033[91mChyba:{R} {e}")
-        return
-
-    matrix = np.stack([load_embedding(r['embedding']) for r in rows])
-    scores = cosine_similarity(q_emb, matrix)
-
-    # Top-N výsledků
-    top_idx = np.argsort(scores)[::-1][:top_n]
 
+def _print_results(query: str, scope: str, project: str | None,
+                   results: list[tuple[sqlite3.Row, float]]) -> None:
     print(f"\n{bold('VÝSLEDKY')}  {D}dotaz: \"{query}\"{R}  {D}scope: {scope}{R}")
     if project:
         print(f"  {D}projekt: {project}{R}")
     print()
 
-    for rank, idx in enumerate(top_idx, 1):
-        r     = rows[idx]
-        score = scores[idx]
-
+    for r, score in results:
         # Zvýraznění skóre
         if score >= 0.75:   score_color = G
         elif score >= 0.55: score_color = Y
@@ -458,6 +1323,264 @@ def cmd_search(args: argparse.Namespace) -> None:
         print()
 
 
+def _fetch_chunks(conn: sqlite3.Connection, ids: list[int]) -> dict[int, sqlite3.Row]:
+    """Metadata + obsah jen pro vybraná id (výsledky / kandidáty)."""
+    rows = conn.execute(f"""
+        SELECT id, filepath, project, language, chunk_start, chunk_end,
+               chunk_type, name, content, vec_row
+        FROM code_chunks WHERE id IN ({','.join('?' * len(ids))})
+    """, ids).fetchall()
+    return {r['id']: r for r in rows}
+
+
+def _search_brute(conn: sqlite3.Connection, vecs: VectorFile, q_emb: np.ndarray,
+                  where: str, params: list, top_n: int) -> list[tuple[sqlite3.Row, float]]:
+    """
+    Přesné vyhledávání — kosínus přes všechny chunky ve filtru.
+    Skóruje se přímo nad memmapem (řádky jsou normalizované), bez kopie matice.
+    """
+    rows = conn.execute(
+        f"SELECT id, vec_row FROM code_chunks {where}", params
+    ).fetchall()
+    ids      = np.array([r['id'] for r in rows], dtype=np.int64)
+    vec_rows = np.array([r['vec_row'] for r in rows], dtype=np.int64)
+
+    scores  = vecs.scores(_normalize_rows(q_emb))[vec_rows]
+    top_idx = np.argsort(scores)[::-1][:top_n]
+    by_id   = _fetch_chunks(conn, [int(ids[i]) for i in top_idx])
+    return [(by_id[int(ids[i])], float(scores[i])) for i in top_idx]
+
+
+def _fts_query(text: str) -> str:
+    """
+    Dotaz → FTS5 výraz: každé slovo jako fráze, spojené OR (BM25 pak
+    upřednostní chunky s více shodami). `get_borg_env` = fráze get borg env.
+    """
+    words = re.findall(r'\w+', text)
+    return ' OR '.join(f'"{w}"' for w in words)
+
+
+def _search_lexical(conn: sqlite3.Connection, query: str, where: str, params: list,
+                    top_n: int) -> list[tuple[sqlite3.Row, float]]:
+    """
+    BM25 přes FTS5 — bez embeddingu. Skóre = BM25 relativně k nejlepšímu
+    výsledku (1.0 = nejlepší shoda).
+    """
+    match = _fts_query(query)
+    if not match:
+        return []
+    filt = where.replace('WHERE', 'AND', 1)
+    rows = conn.execute(f"""
+        SELECT c.id, c.filepath, c.project, c.language, c.chunk_start, c.chunk_end,
+               c.chunk_type, c.name, c.content, c.vec_row,
+               bm25(code_chunks_fts, {', '.join(map(str, FTS_WEIGHTS))}) AS rank
+        FROM code_chunks_fts
+        JOIN code_chunks AS c ON c.id = code_chunks_fts.rowid
+        WHERE code_chunks_fts MATCH ? {filt}
+        ORDER BY rank
+        LIMIT ?
+    """, [match, *params, top_n]).fetchall()
+    if not rows:
+        return []
+    best = rows[0]['rank'] or -1.0
+    return [(r, r['rank'] / best) for r in rows]
+
+
+def _fuse(rankings: list[list[tuple[sqlite3.Row, float]]],
+          top_n: int) -> list[tuple[sqlite3.Row, float]]:
+    """
+    Reciprocal-rank fusion: skóre = Σ 1 / (RRF_K + pořadí) přes pořadí.
+    Normalizováno na 1.0 = první místo ve všech pořadích.
+    """
+    fused: dict[int, float] = {}
+    rows:  dict[int, sqlite3.Row] = {}
+    for ranking in rankings:
+        for pos, (r, _) in enumerate(ranking, start=1):
+            fused[r['id']] = fused.get(r['id'], 0.0) + 1.0 / (RRF_K + pos)
+            rows.setdefault(r['id'], r)
+    best  = len(rankings) / (RRF_K + 1)
+    order = sorted(fused, key=fused.get, reverse=True)[:top_n]
+    return [(rows[i], fused[i] / best) for i in order]
+
+
+def _search_ann(conn: sqlite3.Connection, ann: IVFIndex, vecs: VectorFile,
+                q_emb: np.ndarray, allowed: np.ndarray, top_n: int, nprobe: int,
+                exact: bool) -> list[tuple[sqlite3.Row, float]]:
+    """
+    ANN vyhledávání — skóruje jen kandidáty z nprobe seznamů.
+    exact=True: RERANK_FACTOR × top_n kandidátů se přeskóruje float32 řádky z .vec.
+    """
+    k = top_n * RERANK_FACTOR if exact else top_n
+    ids, approx = ann.search(q_emb, k, nprobe=nprobe, allowed=allowed)
+    if not len(ids):
+        return []
+
+    by_id = _fetch_chunks(conn, [int(i) for i in ids])
+
+    if exact:
+        rows   = [by_id[int(i)] for i in ids if int(i) in by_id]
+        scores = vecs.take([r['vec_row'] for r in rows]) @ _normalize_rows(q_emb)
+        order  = np.argsort(scores)[::-1][:top_n]
+        return [(rows[i], float(scores[i])) for i in order]
+
+    return [(by_id[int(i)], float(s)) for i, s in zip(ids, approx) if int(i) in by_id]
+
+
+class SearchContext:
+    """
+    Otevřené zdroje pro hledání: spojení, vektorový soubor, ANN index a id
+    chunků per filtr. Otevírají se líně (lexical vektory nepotřebuje).
+    `agent search` je použije jednou; search daemon je drží mezi dotazy
+    a po změně indexu zahodí (invalidate).
+    """
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+        self._vecs: VectorFile | None = None
+        self._ann:  IVFIndex | None   = None
+        self._ann_loaded = False
+        self._ann_stale  = False
+        self._legacy: bool | None = None
+        self._allowed: dict[tuple, np.ndarray] = {}
+
+    def vectors(self) -> VectorFile:
+        if self._vecs is None:
+            self._vecs = open_vectors(self.conn, upgrade=False)
+        return self._vecs
+
+    def legacy(self) -> bool:
+        """Index čeká na migraci BLOB embeddingů (udělá ji až agent index)."""
+        if self._legacy is None:
+            self._legacy = needs_migration(self.conn)
+        return self._legacy
+
+    def ann(self) -> tuple[IVFIndex | None, bool]:
+        """(ANN index nebo None, zastaralý?) — zastaralý index se nepoužije."""
+        if not self._ann_loaded:
+            self._ann = IVFIndex.load(ANN_INDEX_PATH)
+            self._ann_loaded = True
+            self._ann_stale  = self._ann is not None and not ann_is_fresh(self.conn, self._ann)
+        return (None if self._ann_stale else self._ann), self._ann_stale
+
+    def allowed(self, where: str, params: list) -> np.ndarray:
+        """Jen id ve filtru — bez obsahu a embeddingů."""
+        key = (where, tuple(params))
+        if key not in self._allowed:
+            self._allowed[key] = np.array(
+                [r['id'] for r in self.conn.execute(f"SELECT id FROM code_chunks {where}", params)],
+                dtype=np.int64,
+            )
+        return self._allowed[key]
+
+    def invalidate(self) -> None:
+        if self._vecs is not None:
+            self._vecs.close()
+        self._vecs = None
+        self._ann  = None
+        self._ann_loaded = False
+        self._legacy     = None
+        self._allowed.clear()
+
+    def close(self) -> None:
+        self.invalidate()
+        self.conn.close()
+
+
+def search(ctx: SearchContext, query: str, top_n: int = 5, project: str | None = None,
+           scope: str = 'code', exact: bool = False, nprobe: int = DEFAULT_NPROBE,
+           mode: str = 'hybrid', brute: bool = False) -> tuple[list[tuple], list[str]]:
+    """
+    Vyhledá dotaz v indexu. Vrací (výsledky [(řádek, skóre)], poznámky k výpisu).
+    Prázdné výsledky + poznámka = chyba / nic k prohledání.
+    """
+    conn  = ctx.conn
+    notes: list[str] = []
+    where, params = _search_where(scope, project)
+
+    if mode != 'vector' and not has_fts(conn):
+        notes.append(f"{Y}SQLite bez FTS5 — jen vektorové hledání{R}")
+        mode = 'vector'
+
+    if mode == 'lexical':
+        return _search_lexical(conn, query, where, params, top_n), notes
+
+    if ctx.legacy():
+        notes.append(f"{Y}Vektory čekají na migraci — spusť: agent index{R}")
+        if mode == 'hybrid':
+            return _search_lexical(conn, query, where, params, top_n), notes
+        return [], notes
+
+    vecs = ctx.vectors()
+
+    ann = None
+    if not brute:
+        ann, stale = ctx.ann()
+        if stale:
+            notes.append(f"{D}ANN index je zastaralý — plné prohledání "
+                         f"(obnoví se při: agent index){R}")
+
+    allowed = ctx.allowed(where, params)
+    if not len(allowed):
+        notes.append(f"{Y}Žádné indexované soubory. Spusť: agent index{R}")
+        return [], notes
+
+    # Query embedding
+    try:
+        q_emb = get_embedding(query)
+    except RuntimeError as e:
+        if mode == 'hybrid':
+            # Ollama nedostupná / vytížená → aspoň lexikální výsledky
+            notes.append(f"{Y}Embedding nedostupný — jen lexikální výsledky{R}")
+            return _search_lexical(conn, query, where, params, top_n), notes
+        notes.append(f"\033[91mChyba:{R} {e}")
+        return [], notes
+
+    k = top_n * HYBRID_FACTOR if mode == 'hybrid' else top_n
+    if ann is None:
+        results = _search_brute(conn, vecs, q_emb, where, params, k)
+    else:
+        results = _search_ann(conn, ann, vecs, q_emb, allowed, k, nprobe, exact)
+    if mode == 'hybrid':
+        results = _fuse([results, _search_lexical(conn, query, where, params, k)], top_n)
+    return results, notes
+
+
+def cmd_search(args: argparse.Namespace) -> None:
+    """
+    Sémantické vyhledávání přes indexovaný kód nebo dokumentaci.
+    Běží-li search daemon, dotaz vyřídí on (teplý index); jinak v procesu.
+    """
+    from _meta import search_daemon
+
+    opts = {
+        'query':   args.query,
+        'top_n':   getattr(args, 'top', 5),
+        'project': getattr(args, 'project', None),
+        'scope':   getattr(args, 'scope', 'code'),
+        'exact':   getattr(args, 'exact', False),
+        'nprobe':  getattr(args, 'nprobe', DEFAULT_NPROBE),
+        'mode':    getattr(args, 'mode', 'hybrid'),
+        'brute':   getattr(args, 'brute', False),
+    }
+
+    answer = None if getattr(args, 'no_daemon', False) else search_daemon.query(opts)
+    if answer is not None:
+        results, notes = answer
+    else:
+        ctx = SearchContext(init_index_db())
+        try:
+            results, notes = search(ctx, **opts)
+        finally:
+            ctx.close()
+
+    for note in notes:
+        print(note)
+    if results:
+        _print_results(opts['query'], opts['scope'], opts['project'], results)
+    elif not notes:
+        print(f"{Y}Žádné výsledky.{R}")
+
+
 # ─── Main ─────────────────────────────────────────────────────────────────────
 
 def main() -> None:
@@ -473,6 +1596,20 @@ def main() -> None:
     p_idx.add_argument('--diff',    action='store_true', help='Jen git-změněné soubory')
     p_idx.add_argument('--force',   action='store_true', help='Ignoruj mtime, přeindexuj vše')
     p_idx.add_argument('--docs',    action='store_true', help='Indexovat i .md soubory')
+    p_idx.add_argument('--compact', action='store_true',
+                       help='Vynutit kompakci vektorového souboru (odstraní tombstones)')
+    p_idx.add_argument('--vec-format', dest='vec_format', choices=quantize.FORMATS,
+                       help='Převést vektorový soubor do formátu (bez indexování)')
+    p_idx.add_argument('--recall-check', dest='recall_check', action='store_true',
+                       help='Recall@5 formátů float16/int8 vůči uloženým vektorům')
+    p_idx.add_argument('--watch',   action='store_true',
+                       help='Po indexaci sledovat změny souborů a indexovat průběžně')
+    p_idx.add_argument('--workers', type=int, default=INDEX_WORKERS,
+                       help=f'Vlákna chunkeru (výchozí: {INDEX_WORKERS})')
+    p_idx.add_argument('--concurrency', type=int, default=EMBED_CONCURRENCY,
+                       help=f'Souběžné embedding requesty (výchozí: {EMBED_CONCURRENCY})')
+    p_idx.add_argument('--batch-size', dest='batch_size', type=int, default=EMBED_BATCH,
+                       help=f'Chunků na jeden embedding request (výchozí: {EMBED_BATCH})')
 
     # ── agent search ──────────────────────────────────────────────────────────
     p_srch = sub.add_parser('search', help='Sémantické vyhledávání v kódu')
@@ -481,6 +1618,23 @@ def main() -> None:
     p_srch.add_argument('--top',     type=int, default=5, help='Počet výsledků (výchozí: 5)')
     p_srch.add_argument('--scope',   choices=['code', 'docs'], default='code',
                         help='code = zdrojáky, docs = CLAUDE.md soubory')
+    p_srch.add_argument('--exact',   action='store_true',
+                        help='Přesný re-ranking ANN kandidátů (float32 vektory)')
+    p_srch.add_argument('--nprobe',  type=int, default=DEFAULT_NPROBE,
+                        help=f'Počet prohledaných IVF seznamů (výchozí: {DEFAULT_NPROBE})')
+    p_srch.add_argument('--brute',   action='store_true',
+                        help='Bez ANN indexu — kosínus přes všechny chunky')
+    p_srch.add_argument('--mode',    choices=['hybrid', 'lexical', 'vector'], default='hybrid',
+                        help='hybrid = BM25 + kosínus (RRF), lexical = jen FTS5 '
+                             '(bez Ollamy), vector = jen embeddingy (výchozí: hybrid)')
+    p_srch.add_argument('--no-daemon', dest='no_daemon', action='store_true',
+                        help='Hledat v procesu, i když běží search daemon')
+
+    # ── agent search-daemon ───────────────────────────────────────────────────
+    p_dmn = sub.add_parser('search-daemon',
+                           help='Search daemon — drží index v paměti pro rychlé dotazy')
+    p_dmn.add_argument('--stop',   action='store_true', help='Zastavit běžící daemon')
+    p_dmn.add_argument('--status', action='store_true', help='Stav běžícího daemonu')
 
     args = parser.parse_args()
 
@@ -488,6 +1642,9 @@ def main() -> None:
         cmd_index(args)
     elif args.cmd == 'search':
         cmd_search(args)
+    elif args.cmd == 'search-daemon':
+        from _meta import search_daemon
+        search_daemon.cmd_daemon(args)
     else:
         parser.print_help()
 
@@ -0,0 +1,208 @@
+"""
+Pool předehřátých `claude -p` procesů pro ClaudeCodeBackend.
+
+Start CLI (node, konfigurace, přihlášení) stojí pár sekund z každé odpovědi.
+Pool drží pro každý použitý model CLI_POOL_SIZE procesů spuštěných dopředu
+se stream-json vstupem i výstupem; request pošle zprávu na stdin a čte
+události až po 'result'.
+
+  - jen pro dlouho běžící procesy (agent-ui, daemon): zapne ho až volání
+    prewarm(); jednorázové `agent ask` / skripty spouští proces na request
+    (předehřátí náhradníků by tam jen spustilo procesy, které atexit zabije)
+  - worker obslouží jediný request — CLI session si pamatuje předchozí
+    zprávy, takže znovupoužití by sdílelo kontext mezi requesty; pool jen
+    skrývá start procesu (náhradník startuje, zatímco request běží)
+  - health: mrtvý nebo starší než CLI_MAX_AGE worker se při checkoutu zahodí
+  - request delší než CLI_TIMEOUT → kill procesu
+  - stderr workeru jde do dočasného souboru (plná roura by CLI zablokovala)
+"""
+
+import atexit
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+
+from _meta.plugins.base import BackendUnavailable
+
+# ─── Konfigurace ─────────────────────────────────────────────────────────────
+
+CLI_POOL_SIZE = int(os.environ.get('AGENT_CLI_POOL', '2'))  # po prewarm(); 0 = vždy proces na request
+CLI_TIMEOUT   = 120.0    # s — max. doba jednoho requestu
+CLI_MAX_AGE   = 600.0    # s — starší nečinný worker se nahradí čerstvým
+
+STREAM_FLAGS = ['--output-format', 'stream-json', '--verbose', '--include-partial-messages']
+
+_idle: dict[str, list['_Worker']] = {}
+_lock  = threading.Lock()
+_warm  = False   # prewarm() zavolán → dlouho běžící proces, pool se používá
+_stats = {'spawned': 0, 'served': 0, 'discarded': 0, 'timeouts': 0}
+
+
+def cli_env() -> dict[str, str]:
+    """Prostředí bez CLAUDECODE (umožní nested session)."""
+    return {k: v for k, v in os.environ.items() if k != 'CLAUDECODE'}
+
+
+# ─── Worker ───────────────────────────────────────────────────────────────────
+
+class _Worker:
+    """Jeden dlouhožijící `claude -p --input-format stream-json` proces."""
+
+    def __init__(self, model: str) -> None:
+        self.model     = model
+        self.started   = time.monotonic()
+        self.timed_out = False
+        self.stderr    = tempfile.TemporaryFile('w+')
+        try:
+            self.proc = subprocess.Popen(
+                ['claude', '-p', '--model', model, '--no-session-persistence',
+                 '--input-format', 'stream-json', *STREAM_FLAGS],
+                env=cli_env(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=self.stderr, text=True, bufsize=1,
+            )
+        except OSError:
+            self.stderr.close()
+            raise
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def events(self, prompt: str) -> Iterator[dict]:
+        """Pošle prompt a yielduje JSON události až po 'result' (včetně)."""
+        msg = {'type': 'user', 'message': {'role': 'user', 'content': prompt}}
+        try:
+            self.proc.stdin.write(json.dumps(msg, ensure_ascii=False) + '\n')
+            self.proc.stdin.flush()
+        except OSError:
+            pass   # proces už skončil — chybu popíše čtení níže
+        for line in self.proc.stdout:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            yield event
+            if event.get('type') == 'result':
+                return
+        code = self.proc.wait()
+        if self.timed_out:
+            raise subprocess.TimeoutExpired(self.proc.args, CLI_TIMEOUT)
+        self.stderr.seek(0)
+        err = self.stderr.read().strip()
+        raise BackendUnavailable(f"claude CLI selhal (kód {code}): {err}")
+
+    def timeout(self) -> None:
+        self.timed_out = True
+        self.kill()
+
+    def kill(self) -> None:
+        if self.alive():
+            self.proc.kill()
+        self.proc.wait()
+        for f in (self.proc.stdin, self.proc.stdout, self.stderr):
+            try:
+                f.close()
+            except OSError:
+                pass
+
+
+# ─── Pool ─────────────────────────────────────────────────────────────────────
+
+def _spawn(model: str) -> '_Worker | None':
+    try:
+        w = _Worker(model)
+    except OSError:
+        return None   # claude není v PATH — health to ohlásí
+    with _lock:
+        _stats['spawned'] += 1
+    return w
+
+
+def prewarm(model: str) -> None:
+    """
+    Zapne pool (volá dlouho běžící proces) a doplní nečinné workery modelu
+    na CLI_POOL_SIZE (start běží na pozadí v CLI).
+    """
+    global _warm
+    with _lock:
+        _warm   = True
+        missing = CLI_POOL_SIZE - len(_idle.get(model, []))
+    for _ in range(max(0, missing)):
+        w = _spawn(model)
+        if w is None:
+            return
+        with _lock:
+            _idle.setdefault(model, []).append(w)
+
+
+def _checkout(model: str) -> _Worker:
+    now = time.monotonic()
+    stale: list[_Worker] = []
+    w = None
+    with _lock:
+        idle = _idle.setdefault(model, [])
+        while idle:
+            cand = idle.pop(0)   # nejstarší = nejdéle předehřátý
+            if cand.alive() and now - cand.started < CLI_MAX_AGE:
+                w = cand
+                break
+            stale.append(cand)
+        _stats['discarded'] += len(stale)
+    for s in stale:
+        s.kill()
+    if w is None:
+        w = _spawn(model)
+        if w is None:
+            raise BackendUnavailable("claude CLI nenalezen v PATH")
+    prewarm(model)   # náhradník startuje, zatímco tenhle zpracuje request
+    return w
+
+
+def _checkin(w: _Worker) -> None:
+    """Použitý worker končí (session má kontext requestu); náhradník už startuje."""
+    with _lock:
+        _stats['served'] += 1
+        if w.timed_out:
+            _stats['timeouts'] += 1
+    w.kill()
+
+
+def run(model: str, prompt: str) -> Iterator[dict]:
+    """
+    Vykoná prompt na workeru modelu; yielduje stream-json události
+    (stream_event, assistant, …) a jako poslední 'result'.
+    """
+    w     = _checkout(model)
+    timer = threading.Timer(CLI_TIMEOUT, w.timeout)
+    timer.start()
+    try:
+        yield from w.events(prompt)
+    finally:
+        timer.cancel()
+        _checkin(w)
+
+
+def enabled() -> bool:
+    """Pool jen v procesu, který zavolal prewarm() (agent-ui / daemon)."""
+    return _warm and CLI_POOL_SIZE > 0
+
+
+def stats() -> dict:
+    """Čítače od startu procesu + počty nečinných workerů per model."""
+    with _lock:
+        return {**_stats, 'idle': {m: len(ws) for m, ws in _idle.items()}}
+
+
+def shutdown() -> None:
+    """Ukončí nečinné workery (konec procesu)."""
+    with _lock:
+        workers = [w for ws in _idle.values() for w in ws]
+        _idle.clear()
+    for w in workers:
+        w.kill()
+
+
+atexit.register(shutdown)
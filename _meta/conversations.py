@@ -4,61 +4,66 @@ Používá stejný soubor ~/.ai-agent/tokens.db jako billing.
 """
 
 import sqlite3
-from _meta.billing import DB_DIR, DB_PATH
+from _meta.db import DB_PATH, connect, migrate
 
 
 def init_conv_db() -> sqlite3.Connection:
-    """Inicializuje tabulky konverzací, zpráv, šablon a souhrnů."""
-    DB_DIR.mkdir(exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.executescript("""
-        CREATE TABLE IF NOT EXISTS templates (
-            id         INTEGER PRIMARY KEY,
-            name       VARCHAR(100) NOT NULL,
-            content    TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-
-        CREATE TABLE IF NOT EXISTS conversations (
-            id         INTEGER PRIMARY KEY,
-            name       VARCHAR(200),
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            closed_at  DATETIME,
-            is_closed  INTEGER DEFAULT 0
-        );
-
-        CREATE TABLE IF NOT EXISTS messages (
-            id               INTEGER PRIMARY KEY,
-            conversation_id  INTEGER REFERENCES conversations(id),
-            parent_id        INTEGER REFERENCES messages(id),
-            role             VARCHAR(20) NOT NULL,
-            content          TEXT,
-            is_template      INTEGER DEFAULT 0,
-            model            VARCHAR(50),
-            backend          VARCHAR(30),
-            tokens_in        INTEGER DEFAULT 0,
-            tokens_out       INTEGER DEFAULT 0,
-            cost_usd         DECIMAL(10,6) DEFAULT 0.0,
-            response_time_ms INTEGER,
-            timestamp        DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-
-        CREATE TABLE IF NOT EXISTS conv_summaries (
-            id               INTEGER PRIMARY KEY,
-            conversation_id  INTEGER REFERENCES conversations(id),
-            model            VARCHAR(50),
-            content          TEXT,
-            word_count       INTEGER DEFAULT 0,
-            char_count       INTEGER DEFAULT 0,
-            gen_time_ms      INTEGER,
-            created_at       DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
-    conn.commit()
+    """Spojení z poolu; tabulky konverzací, zpráv, šablon a souhrnů přes migrace."""
+    conn = connect(DB_PATH)
+    migrate(conn, 'conversations', _MIGRATIONS)
     return conn
 
 
+_MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS templates (
+        id         INTEGER PRIMARY KEY,
+        name       VARCHAR(100) NOT NULL,
+        content    TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS conversations (
+        id         INTEGER PRIMARY KEY,
+        name       VARCHAR(200),
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        closed_at  DATETIME,
+        is_closed  INTEGER DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        id               INTEGER PRIMARY KEY,
+        conversation_id  INTEGER REFERENCES conversations(id),
+        parent_id        INTEGER REFERENCES messages(id),
+        role             VARCHAR(20) NOT NULL,
+        content          TEXT,
+        is_template      INTEGER DEFAULT 0,
+        model            VARCHAR(50),
+        backend          VARCHAR(30),
+        tokens_in        INTEGER DEFAULT 0,
+        tokens_out       INTEGER DEFAULT 0,
+        cost_usd         DECIMAL(10,6) DEFAULT 0.0,
+        response_time_ms INTEGER,
+        timestamp        DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS conv_summaries (
+        id               INTEGER PRIMARY KEY,
+        conversation_id  INTEGER REFERENCES conversations(id),
+        model            VARCHAR(50),
+        content          TEXT,
+        word_count       INTEGER DEFAULT 0,
+        char_count       INTEGER DEFAULT 0,
+        gen_time_ms      INTEGER,
+        created_at       DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+
 # ─── Templates ────────────────────────────────────────────────────────────────
 
 def template_list(conn: sqlite3.Connection) -> list[dict]:
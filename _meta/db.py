@@ -0,0 +1,138 @@
+"""
+Sdílená DB vrstva pro ~/.ai-agent/tokens.db.
+
+  connect()  — spojení z poolu (WAL, synchronous=NORMAL, busy_timeout);
+               close() ho vrátí do poolu místo zavření
+  migrate()  — verzované migrace per komponenta (billing, conversations, …),
+               stav v tabulce schema_version, v procesu proběhnou jen jednou
+
+Migrace = seznam kroků (SQL string nebo funkce(conn)); verze komponenty je
+počet aplikovaných kroků. Nové změny schématu se přidávají jen na konec.
+"""
+
+import sqlite3
+import threading
+from collections.abc import Callable
+from pathlib import Path
+
+# ─── Konfigurace ─────────────────────────────────────────────────────────────
+
+DB_DIR          = Path.home() / '.ai-agent'
+DB_PATH         = DB_DIR / 'tokens.db'
+BUSY_TIMEOUT_MS = 5000
+POOL_SIZE       = 8      # max. nečinných spojení na soubor
+
+Migration = str | Callable[[sqlite3.Connection], None]
+
+_pool: dict[Path, list['PooledConnection']] = {}
+_pool_lock = threading.Lock()
+_migrated: set[tuple[Path, str]] = set()
+_migrate_lock = threading.Lock()
+
+
+# ─── Pool ─────────────────────────────────────────────────────────────────────
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3.Connection, jejíž close() vrací spojení do poolu."""
+
+    _path: Path
+    _idle = False
+
+    def close(self) -> None:
+        if self._idle:
+            return  # dvojí close() nesmí spojení vrátit do poolu dvakrát
+        if self.in_transaction:
+            self.rollback()  # nedokončená transakce nesmí přejít k dalšímu volajícímu
+        with _pool_lock:
+            idle = _pool.setdefault(self._path, [])
+            if len(idle) < POOL_SIZE:
+                self._idle = True
+                idle.append(self)
+                return
+        super().close()
+
+    def _acquire(self) -> 'PooledConnection':
+        self._idle = False
+        return self
+
+
+def _open(path: Path) -> PooledConnection:
+    path.parent.mkdir(exist_ok=True)
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000,
+                           factory=PooledConnection, check_same_thread=False)
+    conn._path = path
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def connect(path: Path = DB_PATH) -> sqlite3.Connection:
+    """Vrátí spojení z poolu (nebo nové). Volající ho po použití zavře."""
+    with _pool_lock:
+        idle = _pool.get(path)
+        if idle:
+            return idle.pop()._acquire()
+    return _open(path)
+
+
+def close_all() -> None:
+    """Skutečně zavře všechna nečinná spojení (testy, konec procesu)."""
+    with _pool_lock:
+        conns = [c for idle in _pool.values() for c in idle]
+        _pool.clear()
+    for c in conns:
+        sqlite3.Connection.close(c)
+
+
+# ─── Migrace ──────────────────────────────────────────────────────────────────
+
+def migrate(conn: sqlite3.Connection, component: str, steps: list[Migration]) -> None:
+    """
+    Aplikuje chybějící kroky migrace komponenty. V procesu se DB kontroluje
+    jen poprvé; BEGIN IMMEDIATE serializuje souběžné procesy.
+    ALTER TABLE ADD COLUMN nad již existujícím sloupcem (DB vytvořená před
+    zavedením schema_version) se přeskočí.
+    """
+    key = (getattr(conn, '_path', DB_PATH), component)
+    if key in _migrated:
+        return
+    with _migrate_lock:
+        if key in _migrated:
+            return
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                component  VARCHAR(50) PRIMARY KEY,
+                version    INTEGER NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT version FROM schema_version WHERE component = ?", (component,)
+            ).fetchone()
+            version = row['version'] if row else 0
+            for step in steps[version:]:
+                if callable(step):
+                    step(conn)
+                    continue
+                try:
+                    conn.execute(step)
+                except sqlite3.OperationalError as e:
+                    if 'duplicate column' not in str(e):
+                        raise
+            if len(steps) > version:
+                conn.execute("""
+                    INSERT INTO schema_version (component, version) VALUES (?, ?)
+                    ON CONFLICT (component) DO UPDATE SET
+                        version = excluded.version, updated_at = CURRENT_TIMESTAMP
+                """, (component, len(steps)))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        _migrated.add(key)
@@ -0,0 +1,214 @@
+"""
+Embedding služba — sdílená pro semantic_cache i chroma_indexer.
+
+Dvouúrovňová cache klíčovaná (model, sha256(text)):
+  1. LRU v procesu   (EMBED_LRU_SIZE položek)
+  2. SQLite na disku ~/.ai-agent/embed_cache.db (max EMBED_DISK_ROWS řádků,
+     při překročení se mažou nejdéle nepoužité)
+
+Miss → Ollama (/api/embeddings pro jeden text, /api/embed pro batch) přes
+sdílený keep-alive klient ollama_http.
+Čítače hitů/missů: stats().
+"""
+
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from _meta import ollama_http
+
+# ─── Konfigurace ─────────────────────────────────────────────────────────────
+
+DB_DIR            = Path.home() / '.ai-agent'
+EMBED_DB_PATH     = DB_DIR / 'embed_cache.db'
+OLLAMA_EMBED_PATH = '/api/embeddings'
+OLLAMA_BATCH_PATH = '/api/embed'        # přijímá pole vstupů
+EMBED_MODEL       = 'nomic-embed-text'
+EMBED_LRU_SIZE    = 2048
+EMBED_DISK_ROWS   = 200_000
+EVICT_EVERY       = 500     # kontrola limitu na disku po tolika zápisech
+
+_lru: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+_lock  = threading.Lock()
+_local = threading.local()
+_stats = {'mem_hits': 0, 'disk_hits': 0, 'misses': 0}
+_writes_since_evict = 0
+
+
+# ─── DB ───────────────────────────────────────────────────────────────────────
+
+def _conn() -> sqlite3.Connection:
+    """Spojení na embed_cache.db — jedno na vlákno."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        DB_DIR.mkdir(exist_ok=True)
+        conn = sqlite3.connect(EMBED_DB_PATH, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS embed_cache (
+                model      TEXT NOT NULL,
+                text_hash  TEXT NOT NULL,
+                embedding  BLOB NOT NULL,
+                last_used  DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_embed_last_used ON embed_cache(last_used)")
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+# ─── Cache ────────────────────────────────────────────────────────────────────
+
+def _remember(key: tuple[str, str], vec: np.ndarray) -> None:
+    with _lock:
+        _lru[key] = vec
+        _lru.move_to_end(key)
+        while len(_lru) > EMBED_LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def _cached(keys: list[tuple[str, str]]) -> dict[tuple[str, str], np.ndarray]:
+    """Najde co nejvíc klíčů v LRU, zbytek jedním dotazem na disk."""
+    found: dict[tuple[str, str], np.ndarray] = {}
+    with _lock:
+        for k in keys:
+            if k in _lru:
+                _lru.move_to_end(k)
+                found[k] = _lru[k]
+        _stats['mem_hits'] += len(found)
+
+    rest = [k for k in keys if k not in found]
+    if not rest:
+        return found
+
+    conn  = _conn()
+    model = rest[0][0]
+    hashes = [h for _, h in rest]
+    rows = conn.execute(
+        f"SELECT text_hash, embedding FROM embed_cache "
+        f"WHERE model = ? AND text_hash IN ({','.join('?' * len(hashes))})",
+        [model, *hashes]
+    ).fetchall()
+    if rows:
+        conn.executemany(
+            "UPDATE embed_cache SET last_used = CURRENT_TIMESTAMP "
+            "WHERE model = ? AND text_hash = ?",
+            [(model, r['text_hash']) for r in rows]
+        )
+        conn.commit()
+    for r in rows:
+        key = (model, r['text_hash'])
+        vec = np.frombuffer(r['embedding'], dtype=np.float32)
+        found[key] = vec
+        _remember(key, vec)
+    with _lock:
+        _stats['disk_hits'] += len(rows)
+        _stats['misses']    += len(rest) - len(rows)
+    return found
+
+
+def _persist(items: list[tuple[tuple[str, str], np.ndarray]]) -> None:
+    global _writes_since_evict
+    conn = _conn()
+    conn.executemany(
+        "INSERT OR REPLACE INTO embed_cache (model, text_hash, embedding) VALUES (?, ?, ?)",
+        [(m, h, v.astype(np.float32).tobytes()) for (m, h), v in items]
+    )
+    conn.commit()
+    with _lock:
+        _writes_since_evict += len(items)
+        evict = _writes_since_evict >= EVICT_EVERY
+        if evict:
+            _writes_since_evict = 0
+    if evict:
+        _evict(conn)
+
+
+def _evict(conn: sqlite3.Connection) -> None:
+    """Smaže nejdéle nepoužité řádky nad limit EMBED_DISK_ROWS."""
+    n = conn.execute("SELECT COUNT(*) AS n FROM embed_cache").fetchone()['n']
+    if n > EMBED_DISK_ROWS:
+        conn.execute("""
+            DELETE FROM embed_cache WHERE rowid IN (
+                SELECT rowid FROM embed_cache ORDER BY last_used LIMIT ?
+            )
+        """, (n - EMBED_DISK_ROWS,))
+        conn.commit()
+
+
+def stats() -> dict:
+    """Čítače hitů/missů od startu procesu + velikost LRU."""
+    with _lock:
+        return {**_stats, 'lru_size': len(_lru)}
+
+
+def clear_memory() -> None:
+    with _lock:
+        _lru.clear()
+
+
+# ─── Ollama ───────────────────────────────────────────────────────────────────
+
+def _post(path: str, payload: dict, timeout: float) -> dict:
+    """RuntimeError = Ollama nedostupná, OllamaHTTPError = chyba vstupu."""
+    return ollama_http.post_json(path, ollama_http.with_keep_alive(payload), timeout)
+
+
+# ─── Veřejné API ──────────────────────────────────────────────────────────────
+
+def embed(text: str, model: str = EMBED_MODEL, timeout: float = 30,
+          cache: bool = True) -> np.ndarray:
+    """
+    Embedding jednoho textu. RuntimeError pokud Ollama nedostupná.
+    cache=False: obejde LRU i disk (nic nečte ani neukládá).
+    """
+    key = (model, text_hash(text))
+    if cache:
+        hit = _cached([key])
+        if key in hit:
+            return hit[key]
+
+    data = _post(OLLAMA_EMBED_PATH, {'model': model, 'prompt': text}, timeout)
+    vec  = np.array(data['embedding'], dtype=np.float32)
+    if cache:
+        _remember(key, vec)
+        _persist([(key, vec)])
+    return vec
+
+
+def embed_many(texts: list[str], model: str = EMBED_MODEL, timeout: float = 120,
+               cache: bool = True) -> list[np.ndarray]:
+    """
+    Batch embedding: známé texty z cache, zbytek jedním /api/embed requestem.
+    Pořadí výstupu odpovídá vstupu.
+    """
+    keys = [(model, text_hash(t)) for t in texts]
+    found = _cached(list(dict.fromkeys(keys))) if cache else {}
+
+    missing: dict[tuple[str, str], str] = {}
+    for k, t in zip(keys, texts):
+        if k not in found:
+            missing.setdefault(k, t)
+
+    if missing:
+        data = _post(OLLAMA_BATCH_PATH, {'model': model, 'input': list(missing.values())},
+                     timeout)
+        fresh = [(k, np.array(v, dtype=np.float32))
+                 for k, v in zip(missing, data['embeddings'])]
+        found.update(fresh)
+        if cache:
+            for k, v in fresh:
+                _remember(k, v)
+            _persist(fresh)
+
+    return [found[k] for k in keys]
@@ -0,0 +1,138 @@
+"""
+Health registry — cachovaná dostupnost backendů.
+
+select_backend() se neptá backendu přímo (Ollama HEAD až 2 s, `shutil.which`),
+ale čte stav z registru:
+  - první dotaz na backend ho synchronně otestuje a zaregistruje
+  - vlákno na pozadí pak registrované backendy testuje každých PROBE_INTERVAL s
+  - stav starší než HEALTH_TTL (např. po pádu vlákna) se otestuje znovu
+  - výpadek při execute (spojení, timeout, 5xx / přetížení) → mark_down()
+    okamžitě, další probe ho může vrátit; chyba requestu (4xx, špatný vstup,
+    bug volajícího) stav backendu nemění
+
+Klíčem je Backend.name — agent-ui vytváří víc instancí stejného backendu.
+"""
+
+from __future__ import annotations
+
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterator
+
+from _meta.plugins.base import BackendUnavailable
+
+if TYPE_CHECKING:
+    from _meta.plugins.base import Backend
+
+# ─── Konfigurace ─────────────────────────────────────────────────────────────
+
+PROBE_INTERVAL = 15.0   # s — interval testů na pozadí
+HEALTH_TTL     = 45.0   # s — po této době se stav bez čerstvého testu neuznává
+
+
+@dataclass
+class Status:
+    up: bool
+    checked: float          # time.monotonic() posledního testu / změny
+    reason: str = ''
+
+
+_backends: dict[str, Backend] = {}
+_status: dict[str, Status] = {}
+_lock = threading.Lock()
+_prober: threading.Thread | None = None
+
+
+def _probe(backend: Backend) -> Status:
+    try:
+        up, reason = bool(backend.is_available()), ''
+    except Exception as e:
+        up, reason = False, str(e)
+    status = Status(up=up, checked=time.monotonic(), reason=reason)
+    with _lock:
+        _status[backend.name] = status
+    return status
+
+
+def _probe_loop() -> None:
+    while True:
+        time.sleep(PROBE_INTERVAL)
+        with _lock:
+            backends = list(_backends.values())
+        for b in backends:
+            _probe(b)
+
+
+def _ensure_prober() -> None:
+    global _prober
+    with _lock:
+        if _prober is None or not _prober.is_alive():
+            _prober = threading.Thread(target=_probe_loop, name='health-probe',
+                                       daemon=True)
+            _prober.start()
+
+
+# ─── Veřejné API ──────────────────────────────────────────────────────────────
+
+def is_up(backend: Backend) -> bool:
+    """Dostupnost backendu z registru; bez čerstvého stavu ho otestuje hned."""
+    with _lock:
+        _backends.setdefault(backend.name, backend)
+        status = _status.get(backend.name)
+    if status is None or time.monotonic() - status.checked > HEALTH_TTL:
+        _ensure_prober()
+        status = _probe(backend)
+    return status.up
+
+
+def mark_down(backend: Backend | str, reason: str = '') -> None:
+    """Okamžitě označí backend jako nedostupný (do dalšího úspěšného testu)."""
+    name = backend if isinstance(backend, str) else backend.name
+    with _lock:
+        _status[name] = Status(up=False, checked=time.monotonic(), reason=reason)
+
+
+def is_outage(e: BaseException) -> bool:
+    """
+    Vypovídá chyba o dostupnosti backendu? BackendUnavailable z pluginů
+    (ollama_http, proces claude CLI), dále spojení, timeout a HTTP 5xx / 429
+    (OllamaHTTPError.status, anthropic status_code). Jiná RuntimeError
+    (např. is_error výsledek CLI na špatný request) výpadek není.
+    """
+    if isinstance(e, (BackendUnavailable, TimeoutError, ConnectionError,
+                      subprocess.TimeoutExpired)):
+        return True
+    status = getattr(e, 'status_code', None) or getattr(e, 'status', None)
+    if isinstance(status, int):
+        return status >= 500 or status == 429
+    try:
+        import anthropic
+    except ImportError:
+        return False
+    return isinstance(e, anthropic.APIConnectionError)   # vč. APITimeoutError
+
+
+@contextmanager
+def watch(backend: Backend) -> Iterator[None]:
+    """Výpadek uvnitř bloku (execute/stream) označí backend jako down (is_outage)."""
+    try:
+        yield
+    except Exception as e:
+        if is_outage(e):
+            mark_down(backend, str(e))
+        raise
+
+
+def snapshot() -> dict[str, Status]:
+    """Aktuální stavy (pro diagnostiku / UI)."""
+    with _lock:
+        return dict(_status)
+
+
+def reset() -> None:
+    with _lock:
+        _backends.clear()
+        _status.clear()
@@ -0,0 +1,223 @@
+"""
+Watch mode pro `agent index --watch` — průběžná inkrementální indexace.
+
+`agent index --diff` vidí jen `git diff HEAD`, takže mu unikají netrackované
+soubory i commity od poslední indexace. Watch mode po úvodní indexaci sleduje
+PROJECTS_ROOT (nebo jeden projekt) a změněné cesty posílá do run_pipeline:
+
+  - zdroj událostí: watchdog (inotify / FSEvents), pokud je nainstalovaný;
+    jinak polling — porovnání mtime snapshotu každých WATCH_POLL_INTERVAL s
+  - SKIP_DIRS, přípony a backup soubory jako u plné indexace (is_indexable)
+  - debounce: dávka se zpracuje po WATCH_DEBOUNCE s klidu, nejpozději
+    po WATCH_MAX_DELAY s od první události (git checkout, formátovač)
+  - smazaný / přesunutý soubor nebo adresář → chunky pryč z DB i z ANN indexu
+  - Ollama nedostupná / chyba I/O → dávka se vrátí do fronty a zkusí se znovu;
+    soubor smazaný během zpracování řeší run_pipeline (→ remove_files)
+  - po celou dobu sledování drží index_lock (vecs/ann v paměti) — jiný
+    `agent index` mezitím skončí hláškou místo zápisu do stejných souborů
+"""
+
+import argparse
+import threading
+import time
+from pathlib import Path
+
+from _meta.ann_index import IVFIndex
+from _meta.chroma_indexer import (
+    ANN_INDEX_PATH, EMBED_BATCH, EMBED_CONCURRENCY, INDEX_WORKERS, PROJECTS_ROOT,
+    SKIP_DIRS, C, D, G, R, Y, ann_is_fresh, bold, finish_index, init_index_db,
+    is_indexable, open_vectors, remove_files, run_pipeline, walk_files,
+)
+from _meta.vector_store import VectorFile
+
+# ─── Konfigurace ─────────────────────────────────────────────────────────────
+
+WATCH_DEBOUNCE      = 0.5    # s klidu před zpracováním dávky
+WATCH_MAX_DELAY     = 5.0    # s — nejdéle od první události v dávce
+WATCH_POLL_INTERVAL = 2.0    # s — interval snapshotu bez watchdogu
+WATCH_RETRY         = 10.0   # s — pauza po selhání dávky (Ollama nedostupná)
+
+
+# ─── Fronta změn ──────────────────────────────────────────────────────────────
+
+class _Pending:
+    """Změněné cesty čekající na debounce (plní je zdroj událostí z jiného vlákna)."""
+
+    def __init__(self) -> None:
+        self._paths: set[Path] = set()
+        self._first = 0.0
+        self._last  = 0.0
+        self._lock  = threading.Lock()
+
+    def add(self, *paths: Path) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if not self._paths:
+                self._first = now
+            self._paths.update(paths)
+            self._last = now
+
+    def take(self) -> set[Path]:
+        """Dávka k indexaci, pokud uplynul debounce (jinak prázdná množina)."""
+        now = time.monotonic()
+        with self._lock:
+            if not self._paths:
+                return set()
+            if now - self._last < WATCH_DEBOUNCE and now - self._first < WATCH_MAX_DELAY:
+                return set()
+            batch, self._paths = self._paths, set()
+            return batch
+
+
+# ─── Zdroje událostí ──────────────────────────────────────────────────────────
+
+def _skipped(path: Path) -> bool:
+    return any(skip in path.parts for skip in SKIP_DIRS)
+
+
+def _start_watchdog(root: Path, pending: _Pending):
+    """Observer watchdogu, nebo None pokud watchdog není nainstalovaný."""
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event) -> None:
+            if event.event_type not in ('created', 'modified', 'deleted', 'moved'):
+                return
+            paths = [Path(event.src_path)]
+            if getattr(event, 'dest_path', ''):
+                paths.append(Path(event.dest_path))
+            paths = [p for p in paths if not _skipped(p)]
+            if paths:
+                pending.add(*paths)
+
+    observer = Observer()
+    observer.schedule(Handler(), str(root), recursive=True)
+    observer.start()
+    return observer
+
+
+def _snapshot(root: Path, extensions: set) -> dict[Path, tuple[int, int]]:
+    """(velikost, mtime_ns) indexovatelných souborů pod root (SKIP_DIRS se neprochází)."""
+    return {p: (st.st_size, st.st_mtime_ns) for p, st in walk_files(root, extensions)}
+
+
+def _start_polling(root: Path, extensions: set, pending: _Pending,
+                   stop: threading.Event) -> threading.Thread:
+    """Vlákno, které porovnává snapshoty a rozdíly hlásí jako události."""
+    def loop() -> None:
+        prev = _snapshot(root, extensions)
+        while not stop.wait(WATCH_POLL_INTERVAL):
+            cur     = _snapshot(root, extensions)
+            changed = [p for p, m in cur.items() if prev.get(p) != m]
+            changed += [p for p in prev if p not in cur]
+            if changed:
+                pending.add(*changed)
+            prev = cur
+
+    t = threading.Thread(target=loop, name='index-watch-poll', daemon=True)
+    t.start()
+    return t
+
+
+# ─── Zpracování dávky ─────────────────────────────────────────────────────────
+
+def _split(batch: set[Path], extensions: set) -> tuple[list[Path], list[str]]:
+    """Dávka → (soubory k indexaci, relativní cesty ke smazání z indexu)."""
+    files: set[Path] = set()
+    gone:  set[str]  = set()
+    for p in batch:
+        try:
+            rel = str(p.relative_to(PROJECTS_ROOT))
+        except ValueError:
+            continue
+        if p.is_dir():
+            # Adresář přesunutý dovnitř / vytvořený s obsahem
+            files.update(f for f, _ in walk_files(p, extensions))
+        elif p.is_file():
+            if is_indexable(p, extensions):
+                files.add(p)
+        else:
+            gone.add(rel)   # soubor i celý adresář (remove_files maže i pod ním)
+    return sorted(files), sorted(gone)
+
+
+def _process(batch: set[Path], extensions: set, vecs: VectorFile, ann: IVFIndex | None,
+             args: argparse.Namespace) -> tuple[VectorFile, IVFIndex]:
+    files, gone = _split(batch, extensions)
+    if not files and not gone:
+        return vecs, ann
+
+    stamp = time.strftime('%H:%M:%S')
+    conn  = init_index_db()
+    try:
+        removed = remove_files(conn, gone, ann)
+        conn.commit()
+        total, _, reused = run_pipeline(
+            files, ann=ann, vecs=vecs,
+            workers     = getattr(args, 'workers', INDEX_WORKERS),
+            concurrency = getattr(args, 'concurrency', EMBED_CONCURRENCY),
+            batch_size  = getattr(args, 'batch_size', EMBED_BATCH),
+        ) if files else (0, 0, 0)
+        vecs, ann = finish_index(conn, vecs, ann)
+    finally:
+        conn.close()
+
+    if total or removed:
+        print(f"  {D}{stamp}{R}  {G}+{total}{R} {D}chunků ({reused} znovu použito){R}"
+              + (f"  {Y}-{removed}{R} {D}ze smazaných{R}" if removed else ''))
+    return vecs, ann
+
+
+# ─── Hlavní smyčka ────────────────────────────────────────────────────────────
+
+def watch(project: str | None, extensions: set, vecs: VectorFile | None,
+          ann: IVFIndex | None, args: argparse.Namespace) -> None:
+    """
+    Sleduje změny pod PROJECTS_ROOT (/ projektem) až do Ctrl+C.
+    vecs/ann z právě doběhlé indexace; None = otevřít (index byl aktuální).
+    """
+    root = PROJECTS_ROOT / project if project else PROJECTS_ROOT
+    if not root.is_dir():
+        print(f"{Y}Adresář {root} neexistuje — není co sledovat.{R}")
+        return
+    if vecs is None:
+        conn = init_index_db()
+        vecs = open_vectors(conn)
+        ann  = IVFIndex.load(ANN_INDEX_PATH)
+        if not ann_is_fresh(conn, ann):
+            ann = None   # finish_index ho po první dávce přestaví
+        conn.close()
+
+    pending  = _Pending()
+    stop     = threading.Event()
+    observer = _start_watchdog(root, pending)
+    if observer is None:
+        _start_polling(root, extensions, pending, stop)
+        source = f'polling {WATCH_POLL_INTERVAL:g} s (pip install watchdog pro inotify)'
+    else:
+        source = 'watchdog'
+
+    print(f"{bold('SLEDOVÁNÍ')}  {C}{root}{R}  {D}{source} — Ctrl+C ukončí{R}")
+    try:
+        while True:
+            time.sleep(WATCH_DEBOUNCE / 2)
+            batch = pending.take()
+            if not batch:
+                continue
+            try:
+                vecs, ann = _process(batch, extensions, vecs, ann, args)
+            except (RuntimeError, OSError) as e:
+                print(f"\033[91mChyba:{R} {e}  {D}(nový pokus za {WATCH_RETRY:g} s){R}")
+                pending.add(*batch)
+                time.sleep(WATCH_RETRY)
+    except KeyboardInterrupt:
+        print(f"\n{D}Sledování ukončeno.{R}")
+    finally:
+        stop.set()
+        if observer is not None:
+            observer.stop()
+            observer.join()
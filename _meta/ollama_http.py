@@ -0,0 +1,207 @@
+"""
+Sdílený HTTP klient pro Ollamu (localhost:11434) — plugin i embeddingy.
+
+  - pool keep-alive spojení (http.client) — indexace dělá tisíce krátkých
+    requestů, nové TCP spojení na každý je znát
+  - zvlášť timeout na připojení a na čtení odpovědi
+  - 503 (model se teprve načítá) → opakování s exponenciálním backoffem
+  - keep_alive v payloadu drží horké modely v paměti Ollamy
+
+Chyby:
+  BackendUnavailable — Ollama nedostupná (spojení, timeout, 503 po všech pokusech)
+  OllamaHTTPError    — Ollama odpověděla chybou (špatný vstup, neznámý model, …)
+"""
+
+import http.client
+import json
+import os
+import threading
+import time
+from collections.abc import Iterator
+from urllib.parse import urlparse
+
+from _meta.plugins.base import BackendUnavailable
+
+# ─── Konfigurace ─────────────────────────────────────────────────────────────
+
+OLLAMA_URL      = os.environ.get('OLLAMA_HOST', 'http://localhost:11434')
+CONNECT_TIMEOUT = 2.0     # s — navázání spojení
+READ_TIMEOUT    = 120.0   # s — výchozí čekání na odpověď
+POOL_SIZE       = 8       # max. nečinných keep-alive spojení
+RETRY_503       = 4       # pokusů navíc, když se model načítá
+BACKOFF_BASE    = 0.5     # s — 0.5, 1, 2, 4 …
+KEEP_ALIVE      = os.environ.get('OLLAMA_KEEP_ALIVE', '30m')   # jak dlouho držet model
+
+if '://' not in OLLAMA_URL:
+    OLLAMA_URL = f'http://{OLLAMA_URL}'
+_url  = urlparse(OLLAMA_URL)
+_host = _url.hostname or 'localhost'
+_port = _url.port or 11434
+
+_idle: list[http.client.HTTPConnection] = []
+_lock = threading.Lock()
+_stats = {'requests': 0, 'connects': 0, 'retries_503': 0}
+
+
+class OllamaHTTPError(Exception):
+    """Ollama vrátila chybový status (mimo 503 při načítání modelu)."""
+
+    def __init__(self, status: int, body: str) -> None:
+        super().__init__(f"Ollama HTTP {status}: {body[:300]}")
+        self.status = status
+        self.body   = body
+
+
+def _unavailable(e: BaseException) -> BackendUnavailable:
+    return BackendUnavailable(
+        f"Ollama nedostupná ({OLLAMA_URL}): {e}\n"
+        "  Spusť: ollama serve"
+    )
+
+
+# ─── Pool ─────────────────────────────────────────────────────────────────────
+
+def _checkout() -> tuple[http.client.HTTPConnection, bool]:
+    """Vrátí (spojení, reused). Nové spojení se připojuje s CONNECT_TIMEOUT."""
+    with _lock:
+        if _idle:
+            return _idle.pop(), True
+        _stats['connects'] += 1
+    conn = http.client.HTTPConnection(_host, _port, timeout=CONNECT_TIMEOUT)
+    conn.connect()
+    return conn, False
+
+
+def _checkin(conn: http.client.HTTPConnection) -> None:
+    with _lock:
+        if len(_idle) < POOL_SIZE:
+            _idle.append(conn)
+            return
+    conn.close()
+
+
+def close_all() -> None:
+    """Zavře nečinná spojení (testy, konec procesu)."""
+    with _lock:
+        conns = list(_idle)
+        _idle.clear()
+    for c in conns:
+        c.close()
+
+
+def stats() -> dict:
+    """Čítače od startu procesu: requesty, nová spojení, opakování po 503."""
+    with _lock:
+        return {**_stats, 'idle': len(_idle)}
+
+
+# ─── Requesty ─────────────────────────────────────────────────────────────────
+
+def _send(method: str, path: str, body: bytes | None,
+          timeout: float) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+    """
+    Pošle request přes pooled spojení. Spojení, které server mezitím zavřel
+    (idle keep-alive), se jednou zopakuje na čerstvém.
+    """
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    for attempt in (0, 1):
+        try:
+            conn, reused = _checkout()
+        except OSError as e:
+            raise _unavailable(e)
+        try:
+            conn.sock.settimeout(timeout)
+            conn.request(method, path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionError, BrokenPipeError) as e:
+            conn.close()
+            if reused and attempt == 0:
+                continue
+            raise _unavailable(e)
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            raise _unavailable(e)
+    raise AssertionError('unreachable')
+
+
+def _open(path: str, payload: dict,
+          timeout: float) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+    """POST s opakováním po 503; vrací spojení + odpověď se statusem 200."""
+    body = json.dumps(payload).encode()
+    with _lock:
+        _stats['requests'] += 1
+    for attempt in range(RETRY_503 + 1):
+        conn, r = _send('POST', path, body, timeout)
+        if r.status == 200:
+            return conn, r
+        text = r.read().decode(errors='replace')
+        _release(conn, r)
+        if r.status != 503:
+            raise OllamaHTTPError(r.status, text)
+        if attempt < RETRY_503:
+            with _lock:
+                _stats['retries_503'] += 1
+            time.sleep(BACKOFF_BASE * 2 ** attempt)
+    raise _unavailable(OllamaHTTPError(503, text))
+
+
+def _release(conn: http.client.HTTPConnection, r: http.client.HTTPResponse) -> None:
+    """Dočtená odpověď → spojení zpět do poolu, jinak zavřít."""
+    if r.isclosed() and not r.will_close:
+        _checkin(conn)
+    else:
+        conn.close()
+
+
+def with_keep_alive(payload: dict) -> dict:
+    """Doplní keep_alive, pokud ho volající nenastavil."""
+    if KEEP_ALIVE and 'keep_alive' not in payload:
+        payload = {**payload, 'keep_alive': KEEP_ALIVE}
+    return payload
+
+
+def post_json(path: str, payload: dict, timeout: float = READ_TIMEOUT) -> dict:
+    """POST JSON → JSON odpověď."""
+    conn, r = _open(path, payload, timeout)
+    try:
+        data = r.read()
+    except (OSError, http.client.HTTPException) as e:
+        conn.close()
+        raise _unavailable(e)
+    _release(conn, r)
+    return json.loads(data)
+
+
+def stream_json(path: str, payload: dict, timeout: float = READ_TIMEOUT) -> Iterator[dict]:
+    """POST JSON → NDJSON stream (jeden objekt na řádek)."""
+    conn, r = _open(path, payload, timeout)
+    done = False
+    try:
+        for line in r:
+            if line.strip():
+                yield json.loads(line)
+        done = True
+    except (OSError, http.client.HTTPException) as e:
+        raise _unavailable(e)
+    finally:
+        # Nedočtený stream (konzument skončil dřív) spojení znehodnotí
+        if done:
+            _release(conn, r)
+        else:
+            conn.close()
+
+
+def ping(timeout: float = CONNECT_TIMEOUT) -> bool:
+    """HEAD / — běží Ollama?"""
+    try:
+        conn, r = _send('HEAD', '/', None, timeout)
+    except RuntimeError:
+        return False
+    r.read()
+    _release(conn, r)
+    return r.status == 200
+
+
+def url(path: str) -> str:
+    """Plná URL (pro chybové hlášky / httpx)."""
+    return f'{OLLAMA_URL.rstrip("/")}{path}'
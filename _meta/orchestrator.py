@@ -4,21 +4,117 @@ Orchestrator — centrální entry point pro AI requesty.
 Postup:
   1. Sémantická cache lookup
   2. Hash cache lookup
-  3. Výběr backendu (router)
-  4. Vykonání (backend.execute)
-  5. Billing log + cache store
-  6. Vrátí Response
+  3. Single-flight — stejný prompt + model už běží → počkat na jeho výsledek
+  4. Výběr backendu (router)
+  5. Slot ve scheduleru (limit per backend, priorita) + vykonání (backend.execute);
+     když primární backend neodpoví do hedge_delay (percentil jeho latence)
+     nebo selže, stejný request běží i na dalším kandidátovi — vyhrává první
+     úspěšná odpověď. Celý request má deadline (TimeoutError).
+  6. Billing log + cache store
+  7. Vrátí Response
+
+request() je synchronní, arequest() je async varianta se stejnými kroky:
+cache/SQLite/embedding běží v thread poolu (asyncio.to_thread), slot ve
+scheduleru se čeká v event loopu (scheduler.aacquire), backend přes
+Backend.aexecute() — jeden proces tak obslouží mnoho souběžných requestů
+bez vlákna na request.
+
+stream_request() yielduje textové delty z Backend.stream(); do cache se
+odpověď zapíše až po úspěšném dokončení streamu.
 """
 
+import asyncio
+import threading
+import time
+from collections.abc import Generator, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import partial
+
+from _meta import health, scheduler
 from _meta.plugins.base import Backend, Response
 from _meta.billing import (
     init_db, hash_prompt, calc_cost,
     cache_lookup, cache_store, log_cache_hit,
 )
-from _meta.router import resolve_model, select_backend, get_cache_ttl, LOCAL_MODEL
+from _meta.scheduler import PRIORITY_NORMAL
+from _meta.router import (
+    resolve_model, select_backend, get_cache_ttl, exec_model_for, track, Execution,
+    hedge_delay, serves_model,
+)
 import _meta.semantic_cache as sem_cache
 
 
+def _prompt_text(messages: list[dict]) -> str:
+    """Prompt jako text pro sémantické vyhledávání."""
+    return ' '.join(
+        m.get('content', '') for m in messages if isinstance(m.get('content'), str)
+    )
+
+
+# ─── Single-flight ────────────────────────────────────────────────────────────
+# Rozpracované requesty klíčované (hash_prompt, resolved model). Sdílené
+# napříč instancemi Orchestratoru (agent-ui si je vytváří per request).
+# Future je concurrent.futures — čeká se na ni z vláken i z asyncio.
+
+_inflight: dict[tuple[str, str], Future] = {}
+_inflight_lock = threading.Lock()
+
+
+class _LeaderGone(Exception):
+    """Leader streamu skončil bez výsledku (klient odešel) — čekající to zkusí znovu."""
+
+
+def _join_inflight(key: tuple[str, str]) -> tuple[Future, bool]:
+    """Vrátí (future, leader). leader=True → volající request vykoná sám."""
+    with _inflight_lock:
+        fut = _inflight.get(key)
+        if fut is not None:
+            return fut, False
+        fut = _inflight[key] = Future()
+        fut.set_running_or_notify_cancel()  # zrušení čekajícího nesmí zrušit leadera
+        return fut, True
+
+
+def _finish_inflight(key: tuple[str, str], fut: Future,
+                     resp: Response | None, exc: BaseException | None) -> None:
+    """Předá výsledek leadera čekajícím a uvolní klíč."""
+    if exc is not None:
+        fut.set_exception(exc)
+    else:
+        fut.set_result(resp)
+    with _inflight_lock:
+        if _inflight.get(key) is fut:
+            del _inflight[key]
+
+
+# ─── Vykonání na backendu ─────────────────────────────────────────────────────
+# Sync request běží ve vlákně z _pool, aby šel hlídat deadline a hedge.
+# Blokující execute (subprocess, urllib) nejde zvenku přerušit — poražený
+# hedge doběhne na pozadí (do timeoutu backendu) a zaloguje se jen do billingu.
+
+_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix='orchestrator')
+
+
+def _remaining(t_end: float | None) -> float | None:
+    return None if t_end is None else max(0.0, t_end - time.monotonic())
+
+
+@contextmanager
+def _execution(backend: Backend, exec_model: str,
+               slot: scheduler.Slot | None = None,
+               priority: int = PRIORITY_NORMAL,
+               timeout: float | None = None) -> Iterator[Execution]:
+    """
+    Běh na backendu: slot ze scheduleru (pokud ho async cesta nezískala
+    předem), health (chyba → down) a statistiky latence pro router.
+    """
+    if slot is None:
+        slot = scheduler.acquire(backend.name, exec_model, priority, timeout)
+    with slot, health.watch(backend), track(backend.name, exec_model) as ex:
+        yield ex
+
+
 class Orchestrator:
     def __init__(self) -> None:
         self.backends: list[Backend] = []
@@ -26,36 +122,21 @@ class Orchestrator:
     def register(self, backend: Backend) -> None:
         self.backends.append(backend)
 
-    def request(self, messages: list[dict], operation: str, project: str,
-                model: str = 'auto', system: str | None = None,
-                max_tokens: int = 4096, notes: str = '') -> Response:
-        """
-        Zpracuje request: cache → routing → execute → log → return.
-        """
-        # Prompt jako text pro sémantické vyhledávání
-        prompt_text = ' '.join(
-            m.get('content', '') for m in messages if isinstance(m.get('content'), str)
-        )
+    # ── Kroky sdílené sync i async cestou ────────────────────────────────────
+
+    def _from_cache(self, messages: list[dict], operation: str, project: str,
+                    model: str, system: str | None) -> Response | None:
+        """Kroky 1–2: sémantická a hash cache. Hit se rovnou zaloguje."""
+        prompt_text = _prompt_text(messages)
+        phash       = hash_prompt(messages, system)
 
         # ── 1. Sémantická cache ──────────────────────────────────────────────
-        sem_hit = sem_cache.lookup(prompt_text, operation)
-        if sem_hit:
-            full_model = resolve_model(operation, model)
-            conn = init_db()
-            phash = hash_prompt(messages, system)
-            log_cache_hit(conn, project, operation, full_model, phash)
-            conn.close()
-            return Response(
-                text=sem_hit,
-                tokens_in=0, tokens_out=0,
-                model=full_model, cost=0.0,
-            )
+        cached = sem_cache.lookup(prompt_text, operation)
 
         # ── 2. Hash cache ────────────────────────────────────────────────────
-        phash = hash_prompt(messages, system)
-        ttl   = get_cache_ttl(operation)
-        conn  = init_db()
-        cached = cache_lookup(conn, phash, operation, ttl)
+        conn = init_db()
+        if not cached:
+            cached = cache_lookup(conn, phash, operation, get_cache_ttl(operation))
         if cached:
             full_model = resolve_model(operation, model)
             log_cache_hit(conn, project, operation, full_model, phash)
@@ -66,31 +147,307 @@ class Orchestrator:
                 model=full_model, cost=0.0,
             )
         conn.close()
+        return None
+
+    def _flight_key(self, messages: list[dict], operation: str, model: str,
+                    system: str | None) -> tuple[str, str]:
+        return hash_prompt(messages, system), resolve_model(operation, model)
+
+    def _follower(self, messages: list[dict], operation: str, project: str,
+                  system: str | None, resp: Response) -> Response:
+        """Krok 3: výsledek převzatý od leadera — logován jako cache hit."""
+        conn = init_db()
+        log_cache_hit(conn, project, operation, resp.model, hash_prompt(messages, system))
+        conn.close()
+        return Response(
+            text=resp.text,
+            tokens_in=0, tokens_out=0,
+            model=resp.model, cost=0.0,
+        )
 
-        # ── 3. Výběr backendu ────────────────────────────────────────────────
+    def _route(self, operation: str, model: str) -> tuple[Backend, str]:
+        """Kroky 4–5: výběr backendu a modelu, na kterém se request vykoná."""
+        full_model = resolve_model(operation, model)
+        backend    = select_backend(operation, self.backends, model_hint=full_model,
+                                    explicit=model != 'auto')
+        return backend, exec_model_for(backend.name, full_model)
+
+    def _alternate(self, operation: str, model: str,
+                   primary: Backend) -> tuple[Backend, str] | None:
+        """
+        Cíl pro hedge — nejlepší rovnocenný kandidát kromě primárního, jinak
+        None. Cloud model se nehedguje na Ollamu (rychlejší lokální odpověď
+        by vyhrála místo požadovaného modelu).
+        """
         full_model = resolve_model(operation, model)
-        backend    = select_backend(operation, self.backends, model_hint=full_model)
+        try:
+            backend = select_backend(operation, self.backends, model_hint=full_model,
+                                     explicit=model != 'auto', exclude=(primary.name,),
+                                     allow_downgrade=False)
+        except RuntimeError:
+            return None
+        return backend, exec_model_for(backend.name, full_model)
+
+    def _run(self, backend: Backend, exec_model: str, messages: list[dict],
+             system: str | None, max_tokens: int, priority: int,
+             timeout: float | None) -> tuple[Response, int | None]:
+        """Krok 5 na jednom backendu; vrací (Response, latence v ms)."""
+        with _execution(backend, exec_model, priority=priority, timeout=timeout) as ex:
+            resp = backend.execute(messages, exec_model, system, max_tokens)
+        return resp, ex.latency_ms
+
+    async def _arun(self, backend: Backend, exec_model: str, messages: list[dict],
+                    system: str | None, max_tokens: int, priority: int,
+                    timeout: float | None) -> tuple[Response, int | None]:
+        slot = await scheduler.aacquire(backend.name, exec_model, priority, timeout)
+        with _execution(backend, exec_model, slot) as ex:
+            resp = await backend.aexecute(messages, exec_model, system, max_tokens)
+        return resp, ex.latency_ms
+
+    def _execute(self, messages: list[dict], operation: str, project: str,
+                 model: str, system: str | None, max_tokens: int, notes: str,
+                 priority: int, deadline: float | None) -> tuple[Response, int | None]:
+        """
+        Kroky 4–5 s hedgingem. Primární backend dostane hedge_delay; když do
+        té doby neodpoví (nebo selže), stejný request se spustí i na dalším
+        kandidátovi. Vrací první úspěšný výsledek, po `deadline` s TimeoutError.
+        """
+        t_end = time.monotonic() + deadline if deadline else None
+        run   = partial(self._run, messages=messages, system=system,
+                        max_tokens=max_tokens, priority=priority)
+        backend, exec_model = self._route(operation, model)
+        t_hedge = time.monotonic() + hedge_delay(operation, backend.name, exec_model)
+
+        runs   = {_pool.submit(run, backend, exec_model, timeout=_remaining(t_end))}
+        hedged = False
+        error: BaseException | None = None
+        loser  = partial(self._record_loser, messages, operation, project, system, notes)
+        while runs:
+            marks   = [t for t in (t_end, None if hedged else t_hedge) if t is not None]
+            timeout = max(0.0, min(marks) - time.monotonic()) if marks else None
+            done, runs = wait(runs, timeout, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    for other in runs:
+                        other.add_done_callback(loser)
+                    return f.result()
+                error = f.exception()
+            if t_end is not None and time.monotonic() >= t_end:
+                break
+            if not hedged and (error is not None or time.monotonic() >= t_hedge):
+                hedged = True
+                alt = self._alternate(operation, model, backend)
+                if alt:
+                    runs.add(_pool.submit(run, *alt, timeout=_remaining(t_end)))
+
+        if runs or error is None:
+            for other in runs:
+                other.add_done_callback(loser)
+            raise TimeoutError(f"Request '{operation}' nedokončen do {deadline}s")
+        raise error
+
+    async def _aexecute(self, messages: list[dict], operation: str, model: str,
+                        system: str | None, max_tokens: int, priority: int,
+                        deadline: float | None) -> tuple[Response, int | None]:
+        """Async _execute(); poražený hedge se zruší (aexecute je přerušitelné)."""
+        t_end = time.monotonic() + deadline if deadline else None
+        run   = partial(self._arun, messages=messages, system=system,
+                        max_tokens=max_tokens, priority=priority)
+        backend, exec_model = await asyncio.to_thread(self._route, operation, model)
+        t_hedge = time.monotonic() + hedge_delay(operation, backend.name, exec_model)
+
+        runs   = {asyncio.ensure_future(run(backend, exec_model, timeout=_remaining(t_end)))}
+        hedged = False
+        error: BaseException | None = None
+        try:
+            while runs:
+                marks   = [t for t in (t_end, None if hedged else t_hedge) if t is not None]
+                timeout = max(0.0, min(marks) - time.monotonic()) if marks else None
+                done, runs = await asyncio.wait(runs, timeout=timeout,
+                                                return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        return t.result()
+                    error = t.exception()
+                if t_end is not None and time.monotonic() >= t_end:
+                    break
+                if not hedged and (error is not None or time.monotonic() >= t_hedge):
+                    hedged = True
+                    alt = await asyncio.to_thread(self._alternate, operation, model, backend)
+                    if alt:
+                        runs.add(asyncio.ensure_future(
+                            run(*alt, timeout=_remaining(t_end))
+                        ))
+        finally:
+            for t in runs:
+                t.cancel()
 
-        # ── 4. Přiřazení exec_model ──────────────────────────────────────────
-        if backend.name == 'ollama' and not full_model.startswith('ollama/'):
-            # Fallback: Ollama vybrána pro cloud model → přepni na LOCAL_MODEL
-            exec_model = f'ollama/{LOCAL_MODEL}'
-            full_model = exec_model
-        else:
-            exec_model = full_model
+        if runs or error is None:
+            raise TimeoutError(f"Request '{operation}' nedokončen do {deadline}s")
+        raise error
 
-        # ── 5. Execute ───────────────────────────────────────────────────────
-        resp = backend.execute(messages, exec_model, system, max_tokens)
+    def _cacheable(self, operation: str, model: str, resp: Response) -> bool:
+        """Odpověď z downgradovaného backendu (cloud model → Ollama) necachovat."""
+        served = 'ollama' if resp.model.startswith('ollama/') else 'cloud'
+        return serves_model(served, resolve_model(operation, model))
 
-        # ── 6. Billing log + hash cache ──────────────────────────────────────
+    def _record(self, messages: list[dict], operation: str, project: str,
+                system: str | None, resp: Response, notes: str,
+                latency_ms: int | None = None, cache: bool = True) -> None:
+        """Krok 6: billing log + hash cache + sémantická cache (cache=False jen billing)."""
+        ttl  = get_cache_ttl(operation) if cache else 0
         conn = init_db()
         cache_store(conn, project, operation, resp.model,
                     resp.tokens_in, resp.tokens_out, resp.cost,
-                    phash, resp.text, notes)
+                    hash_prompt(messages, system), resp.text, notes, ttl=ttl,
+                    latency_ms=latency_ms, cache_read=resp.cache_read,
+                    cache_write=resp.cache_write)
         conn.close()
 
-        # ── 6b. Sémantická cache store ───────────────────────────────────────
         if ttl > 0:
-            sem_cache.store(prompt_text, resp.text, operation, resp.model)
+            sem_cache.store(_prompt_text(messages), resp.text, operation, resp.model)
+
+    def _record_loser(self, messages: list[dict], operation: str, project: str,
+                      system: str | None, notes: str, fut: Future) -> None:
+        """Poražený hedge doběhl — tokeny se zaplatily, do cache už nic."""
+        if fut.exception() is not None:
+            return
+        resp, latency_ms = fut.result()
+        self._record(messages, operation, project, system, resp,
+                     f'{notes} [hedge]'.strip(), latency_ms, cache=False)
+
+    # ── Veřejné API ──────────────────────────────────────────────────────────
+
+    def request(self, messages: list[dict], operation: str, project: str,
+                model: str = 'auto', system: str | None = None,
+                max_tokens: int = 4096, notes: str = '',
+                priority: int = PRIORITY_NORMAL,
+                deadline: float | None = None) -> Response:
+        """
+        Zpracuje request: cache → routing → execute → log → return.
+        priority: pořadí ve frontě scheduleru, pokud je backend plný.
+        deadline: celkový limit v s (čekání ve frontě + hedge); None = bez limitu
+                  (výchozí — interaktivní volající posílají REQUEST_DEADLINE).
+        """
+        # ── 1.–2. Cache ──────────────────────────────────────────────────────
+        hit = self._from_cache(messages, operation, project, model, system)
+        if hit:
+            return hit
+
+        # ── 3. Single-flight ─────────────────────────────────────────────────
+        key = self._flight_key(messages, operation, model, system)
+        fut, leader = _join_inflight(key)
+        if not leader:
+            try:
+                return self._follower(messages, operation, project, system, fut.result())
+            except _LeaderGone:
+                return self.request(messages, operation, project, model, system,
+                                    max_tokens, notes, priority, deadline)
+
+        resp, exc = None, None
+        try:
+            # ── 4.–5. Výběr backendu + execute (s hedgingem) ─────────────────
+            resp, latency_ms = self._execute(messages, operation, project, model, system,
+                                             max_tokens, notes, priority, deadline)
+
+            # ── 6. Billing log + cache store ─────────────────────────────────
+            self._record(messages, operation, project, system, resp, notes, latency_ms,
+                         cache=self._cacheable(operation, model, resp))
+            return resp
+        except BaseException as e:
+            exc = e
+            raise
+        finally:
+            _finish_inflight(key, fut, resp, exc)
+
+    def stream_request(self, messages: list[dict], operation: str, project: str,
+                       model: str = 'auto', system: str | None = None,
+                       max_tokens: int = 4096, notes: str = '',
+                       priority: int = PRIORITY_NORMAL,
+                       deadline: float | None = None) -> Generator[str, None, Response]:
+        """
+        Streamovaná varianta request(): yielduje textové delty, kompletní
+        Response vrátí jako návratovou hodnotu generátoru (StopIteration.value).
+        Cache hit / převzatý výsledek přijde jako jediná delta.
+        Bez hedgingu (delty už odešly klientovi); deadline omezuje čekání na slot.
+        """
+        hit = self._from_cache(messages, operation, project, model, system)
+        if hit:
+            yield hit.text
+            return hit
+
+        key = self._flight_key(messages, operation, model, system)
+        fut, leader = _join_inflight(key)
+        if not leader:
+            try:
+                resp = self._follower(messages, operation, project, system, fut.result())
+            except _LeaderGone:
+                return (yield from self.stream_request(messages, operation, project, model,
+                                                       system, max_tokens, notes, priority,
+                                                       deadline))
+            yield resp.text
+            return resp
 
-        return resp
+        resp, exc = None, None
+        try:
+            backend, exec_model = self._route(operation, model)
+            with _execution(backend, exec_model, priority=priority, timeout=deadline) as ex:
+                resp = yield from backend.stream(messages, exec_model, system, max_tokens)
+
+            # Stream doběhl celý → teprve teď billing + cache
+            self._record(messages, operation, project, system, resp, notes, ex.latency_ms,
+                         cache=self._cacheable(operation, model, resp))
+            return resp
+        except GeneratorExit:
+            # Konzument stream opustil — neúplnou odpověď necachovat,
+            # čekající si request vykonají znovu
+            exc = _LeaderGone()
+            raise
+        except BaseException as e:
+            exc = e
+            raise
+        finally:
+            _finish_inflight(key, fut, resp, exc)
+
+    async def arequest(self, messages: list[dict], operation: str, project: str,
+                       model: str = 'auto', system: str | None = None,
+                       max_tokens: int = 4096, notes: str = '',
+                       priority: int = PRIORITY_NORMAL,
+                       deadline: float | None = None) -> Response:
+        """
+        Async varianta request(). Blokující kroky (SQLite, embedding,
+        is_available) běží v thread poolu, backend přes aexecute().
+        """
+        hit = await asyncio.to_thread(
+            self._from_cache, messages, operation, project, model, system
+        )
+        if hit:
+            return hit
+
+        key = self._flight_key(messages, operation, model, system)
+        fut, leader = _join_inflight(key)
+        if not leader:
+            try:
+                shared = await asyncio.wrap_future(fut)
+            except _LeaderGone:
+                return await self.arequest(messages, operation, project, model, system,
+                                           max_tokens, notes, priority, deadline)
+            return await asyncio.to_thread(
+                self._follower, messages, operation, project, system, shared
+            )
+
+        resp, exc = None, None
+        try:
+            resp, latency_ms = await self._aexecute(messages, operation, model, system,
+                                                    max_tokens, priority, deadline)
+
+            await asyncio.to_thread(
+                self._record, messages, operation, project, system, resp, notes,
+                latency_ms, self._cacheable(operation, model, resp)
+            )
+            return resp
+        except BaseException as e:
+            exc = e
+            raise
+        finally:
+            _finish_inflight(key, fut, resp, exc)
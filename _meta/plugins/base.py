@@ -1,9 +1,18 @@
 """Backend ABC interface pro orchestrátor."""
 
+import asyncio
 from abc import ABC, abstractmethod
+from collections.abc import Generator
 from dataclasses import dataclass
 
 
+class BackendUnavailable(RuntimeError):
+    """
+    Backend není dostupný (spojení, proces CLI, model se nenačetl) — na rozdíl
+    od chyby samotného requestu vede k health.mark_down().
+    """
+
+
 @dataclass
 class Response:
     text: str
@@ -11,6 +20,8 @@ class Response:
     tokens_out: int
     model: str
     cost: float
+    cache_read: int = 0    # vstupní tokeny přečtené z prompt cache backendu
+    cache_write: int = 0   # vstupní tokeny zapsané do prompt cache
 
 
 class Backend(ABC):
@@ -21,6 +32,22 @@ class Backend(ABC):
     def execute(self, messages: list[dict], model: str,
                 system: str | None = None, max_tokens: int = 4096) -> Response: ...
 
+    async def aexecute(self, messages: list[dict], model: str,
+                       system: str | None = None, max_tokens: int = 4096) -> Response:
+        """Async varianta execute(). Výchozí: sync execute v thread poolu."""
+        return await asyncio.to_thread(self.execute, messages, model, system, max_tokens)
+
+    def stream(self, messages: list[dict], model: str, system: str | None = None,
+               max_tokens: int = 4096) -> Generator[str, None, Response]:
+        """
+        Streamovaná varianta execute(): yielduje textové delty, po skončení
+        vrátí (StopIteration.value) kompletní Response.
+        Výchozí: celá odpověď z execute() jako jediná delta.
+        """
+        resp = self.execute(messages, model, system, max_tokens)
+        yield resp.text
+        return resp
+
     @abstractmethod
     def is_available(self) -> bool: ...
 
@@ -1,9 +1,98 @@
-"""Claude (Anthropic) backend plugin."""
+"""
+Claude (Anthropic) backend plugin.
 
+Jeden Anthropic klient na proces (drží httpx connection pool), async
+klient per event loop. Stabilní prefixy promptu se značí cache_control
+(server-side prompt caching):
+  - system prompt (včetně obsahu šablony bez konverzace)
+  - první zpráva konverzace (šablona / kontext ze souhrnu)
+  - historie až po poslední odpověď — v dalším kole se přečte z cache
+Značí se jen prefixy nad PROMPT_CACHE_MIN_CHARS (kratší API stejně necachuje).
+"""
+
+import asyncio
 import os
+import threading
+import weakref
+from collections.abc import Generator
 from _meta.plugins.base import Backend, Response
 from _meta.billing import MODEL_PRICES, MODEL_ALIASES, normalize_model, calc_cost
 
+PROMPT_CACHE           = True
+PROMPT_CACHE_MIN_CHARS = 4096    # ≈ 1024 tokenů — minimum cachovatelného prefixu
+
+_CACHE_CONTROL = {'type': 'ephemeral'}
+
+# Sync klient — jeden na proces
+_client = None
+_client_lock = threading.Lock()
+
+# Async klient — AsyncAnthropic drží httpx pool vázaný na event loop
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _import_anthropic():
+    try:
+        import anthropic as ant
+    except ImportError:
+        raise ImportError(
+            "Chybí balíček 'anthropic'.\n"
+            "  pip install anthropic\n"
+            "  export ANTHROPIC_API_KEY=sk-ant-..."
+        )
+    return ant
+
+
+def _sync_client():
+    global _client
+    if _client is None:
+        ant = _import_anthropic()
+        with _client_lock:
+            if _client is None:
+                _client = ant.Anthropic()
+    return _client
+
+
+def _text_len(content) -> int:
+    if isinstance(content, str):
+        return len(content)
+    return sum(len(b.get('text', '')) for b in content if isinstance(b, dict))
+
+
+def _mark_cached(message: dict) -> dict:
+    """Kopie zprávy s cache_control na posledním bloku obsahu."""
+    content = message['content']
+    if isinstance(content, str):
+        blocks = [{'type': 'text', 'text': content}]
+    else:
+        blocks = [dict(b) for b in content]
+    blocks[-1]['cache_control'] = _CACHE_CONTROL
+    return {**message, 'content': blocks}
+
+
+def _with_cache_control(messages: list[dict],
+                        system: str | None) -> tuple[list[dict], str | list[dict] | None]:
+    """Doplní cache breakpointy (max. 3 z povolených 4) na stabilní prefixy."""
+    if not PROMPT_CACHE:
+        return messages, system
+
+    prefix = 0
+    if system:
+        prefix = len(system)
+        if prefix >= PROMPT_CACHE_MIN_CHARS:
+            system = [{'type': 'text', 'text': system, 'cache_control': _CACHE_CONTROL}]
+
+    if len(messages) < 2:
+        return messages, system   # jednorázový prompt — zápis do cache by se nevrátil
+
+    out   = list(messages)
+    marks = {0, len(out) - 2}     # začátek konverzace + historie před novým promptem
+    for i, m in enumerate(out[:-1]):
+        prefix += _text_len(m['content'])
+        if i in marks and prefix >= PROMPT_CACHE_MIN_CHARS:
+            out[i] = _mark_cached(m)
+    return out, system
+
 
 class ClaudeBackend(Backend):
     name = 'claude'
@@ -19,29 +108,25 @@ class ClaudeBackend(Backend):
         full = normalize_model(model)
         return MODEL_PRICES.get(full) or MODEL_PRICES.get(model) or {'in': 0.0, 'out': 0.0}
 
-    def execute(self, messages: list[dict], model: str,
-                system: str | None = None, max_tokens: int = 4096) -> Response:
-        try:
-            import anthropic as ant
-        except ImportError:
-            raise ImportError(
-                "Chybí balíček 'anthropic'.\n"
-                "  pip install anthropic\n"
-                "  export ANTHROPIC_API_KEY=sk-ant-..."
-            )
-
-        full_model = normalize_model(model)
-        kwargs: dict = dict(model=full_model, max_tokens=max_tokens, messages=messages)
+    @staticmethod
+    def _kwargs(messages: list[dict], model: str, system: str | None,
+                max_tokens: int) -> dict:
+        messages, system = _with_cache_control(messages, system)
+        kwargs: dict = dict(model=normalize_model(model), max_tokens=max_tokens,
+                            messages=messages)
         if system:
             kwargs['system'] = system
+        return kwargs
 
-        client   = ant.Anthropic()
-        response = client.messages.create(**kwargs)
-
-        text       = response.content[0].text
-        tokens_in  = response.usage.input_tokens
-        tokens_out = response.usage.output_tokens
-        cost       = calc_cost(full_model, tokens_in, tokens_out)
+    @staticmethod
+    def _to_response(response, full_model: str) -> Response:
+        usage       = response.usage
+        text        = response.content[0].text
+        tokens_in   = usage.input_tokens
+        tokens_out  = usage.output_tokens
+        cache_read  = getattr(usage, 'cache_read_input_tokens', None) or 0
+        cache_write = getattr(usage, 'cache_creation_input_tokens', None) or 0
+        cost        = calc_cost(full_model, tokens_in, tokens_out, cache_read, cache_write)
 
         return Response(
             text=text,
@@ -49,4 +134,32 @@ class ClaudeBackend(Backend):
             tokens_out=tokens_out,
             model=full_model,
             cost=cost,
+            cache_read=cache_read,
+            cache_write=cache_write,
         )
+
+    def execute(self, messages: list[dict], model: str,
+                system: str | None = None, max_tokens: int = 4096) -> Response:
+        kwargs   = self._kwargs(messages, model, system, max_tokens)
+        response = _sync_client().messages.create(**kwargs)
+        return self._to_response(response, kwargs['model'])
+
+    def stream(self, messages: list[dict], model: str, system: str | None = None,
+               max_tokens: int = 4096) -> Generator[str, None, Response]:
+        kwargs = self._kwargs(messages, model, system, max_tokens)
+        with _sync_client().messages.stream(**kwargs) as s:
+            yield from s.text_stream
+            final = s.get_final_message()
+        return self._to_response(final, kwargs['model'])
+
+    async def aexecute(self, messages: list[dict], model: str,
+                       system: str | None = None, max_tokens: int = 4096) -> Response:
+        ant    = _import_anthropic()
+        kwargs = self._kwargs(messages, model, system, max_tokens)
+
+        loop   = asyncio.get_running_loop()
+        client = _async_clients.get(loop)
+        if client is None:
+            client = _async_clients[loop] = ant.AsyncAnthropic()
+        response = await client.messages.create(**kwargs)
+        return self._to_response(response, kwargs['model'])
@@ -1,15 +1,24 @@
 """Claude Code CLI backend plugin (Pro/Max licence).
 
 Volá `claude -p` jako subprocess — nepotřebuje ANTHROPIC_API_KEY.
+V dlouho běžícím procesu s předehřátým poolem (claude_cli_pool.prewarm)
+jde request na proces z claude_cli_pool (stream-json přes stdin/stdout),
+jinak nový proces na každý request.
 Tokeny jsou odhadovány (1 slovo ≈ 1.35 tok, 1 znak ≈ 1/3.8 tok).
 Cena je orientační dle API ceníku (Pro = paušál, ale pro porovnání).
 """
 
-import os
+import asyncio
+import json
 import shutil
 import subprocess
+import tempfile
+import threading
+from collections.abc import Generator, Iterable, Iterator
 
-from _meta.plugins.base import Backend, Response
+from _meta import claude_cli_pool
+from _meta.claude_cli_pool import STREAM_FLAGS, cli_env
+from _meta.plugins.base import Backend, BackendUnavailable, Response
 from _meta.billing import calc_cost, normalize_model
 
 
@@ -22,6 +31,43 @@ def _estimate_tokens(text: str) -> int:
     return max(1, (by_words + by_chars) // 2)
 
 
+def _json_lines(lines: Iterable[str]) -> Iterator[dict]:
+    for line in lines:
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue
+
+
+def _deltas(events: Iterable[dict], parts: list[str]) -> Generator[str, None, str | None]:
+    """
+    Textové delty ze stream-json událostí (zároveň je přidává do parts);
+    vrací text z události 'result'.
+    """
+    result = None
+    for event in events:
+        if event.get('type') == 'stream_event':
+            delta = event.get('event', {}).get('delta', {})
+            if delta.get('type') == 'text_delta' and delta.get('text'):
+                parts.append(delta['text'])
+                yield delta['text']
+        elif event.get('type') == 'result':
+            if event.get('is_error'):
+                # Chyba requestu (CLI běží a odpovědělo) — ne výpadek backendu
+                raise RuntimeError(f"claude CLI selhal: {event.get('result')}")
+            result = event.get('result')
+    return result
+
+
+def _drain(gen: Generator[str, None, Response]) -> Response:
+    """Dočte stream() a vrátí jeho Response."""
+    while True:
+        try:
+            next(gen)
+        except StopIteration as stop:
+            return stop.value
+
+
 class ClaudeCodeBackend(Backend):
     name = 'claude-code'
     models = [
@@ -37,8 +83,10 @@ class ClaudeCodeBackend(Backend):
         full = normalize_model(model)
         return MODEL_PRICES.get(full) or MODEL_PRICES.get(model) or {'in': 0.0, 'out': 0.0}
 
-    def execute(self, messages: list[dict], model: str,
-                system: str | None = None, max_tokens: int = 4096) -> Response:
+    @staticmethod
+    def _build(messages: list[dict], model: str,
+               system: str | None) -> tuple[list[str], str, dict]:
+        """Vrátí (argv, prompt, env) pro `claude -p`."""
         # Sestavení promptu
         parts = []
         if system:
@@ -52,23 +100,16 @@ class ClaudeCodeBackend(Backend):
                 parts.append(f'[Assistant: {content}]')
         prompt = '\n'.join(parts)
 
-        # Prostředí bez CLAUDECODE (umožní nested session)
-        env = {k: v for k, v in os.environ.items() if k != 'CLAUDECODE'}
+        env = cli_env()
 
         # Model pro CLI (full name)
         cli_model = model if model.startswith('claude-') else normalize_model(model)
 
-        result = subprocess.run(
-            ['claude', '-p', '--model', cli_model, '--no-session-persistence', prompt],
-            env=env, capture_output=True, text=True, timeout=120,
-        )
-
-        if result.returncode != 0:
-            err = result.stderr.strip() or result.stdout.strip()
-            raise RuntimeError(f"claude CLI selhal (kód {result.returncode}): {err}")
-
-        text = result.stdout.strip()
+        argv = ['claude', '-p', '--model', cli_model, '--no-session-persistence', prompt]
+        return argv, prompt, env
 
+    @staticmethod
+    def _to_response(prompt: str, text: str, cli_model: str) -> Response:
         # Odhad tokenů a orientační cena dle API ceníku
         tokens_in  = _estimate_tokens(prompt)
         tokens_out = _estimate_tokens(text)
@@ -81,3 +122,83 @@ class ClaudeCodeBackend(Backend):
             model=f'claude-code/{cli_model}',
             cost=cost,
         )
+
+    def execute(self, messages: list[dict], model: str,
+                system: str | None = None, max_tokens: int = 4096) -> Response:
+        if claude_cli_pool.enabled():
+            return _drain(self.stream(messages, model, system, max_tokens))
+
+        argv, prompt, env = self._build(messages, model, system)
+        result = subprocess.run(argv, env=env, capture_output=True, text=True, timeout=120)
+
+        if result.returncode != 0:
+            err = result.stderr.strip() or result.stdout.strip()
+            raise BackendUnavailable(f"claude CLI selhal (kód {result.returncode}): {err}")
+
+        return self._to_response(prompt, result.stdout.strip(), argv[3])
+
+    def stream(self, messages: list[dict], model: str, system: str | None = None,
+               max_tokens: int = 4096) -> Generator[str, None, Response]:
+        """
+        `claude -p --output-format stream-json --include-partial-messages`:
+        JSON řádky, textové delty v content_block_delta, výsledek v 'result'.
+        """
+        argv, prompt, env = self._build(messages, model, system)
+        parts: list[str] = []
+
+        if claude_cli_pool.enabled():
+            result = yield from _deltas(claude_cli_pool.run(argv[3], prompt), parts)
+        else:
+            argv = argv[:-1] + [*STREAM_FLAGS, argv[-1]]
+            # stderr do souboru — nečtená roura by se zaplnila a CLI zablokovala
+            with tempfile.TemporaryFile('w+') as stderr:
+                proc  = subprocess.Popen(argv, env=env, stdout=subprocess.PIPE,
+                                         stderr=stderr, text=True)
+                timer = threading.Timer(120, proc.kill)
+                timer.start()
+                try:
+                    result = yield from _deltas(_json_lines(proc.stdout), parts)
+                    proc.wait()
+                finally:
+                    timer.cancel()
+                    if proc.poll() is None:
+                        proc.kill()
+                        proc.wait()
+                    proc.stdout.close()
+
+                if proc.returncode != 0:
+                    stderr.seek(0)
+                    err = stderr.read().strip() or ''.join(parts)
+                    raise BackendUnavailable(f"claude CLI selhal (kód {proc.returncode}): {err}")
+
+        text = ''.join(parts)
+        if result and not text:
+            # Starší CLI bez partial messages — celý text až ve výsledku
+            text = result
+            yield text
+        return self._to_response(prompt, text.strip(), argv[3])
+
+    async def aexecute(self, messages: list[dict], model: str,
+                       system: str | None = None, max_tokens: int = 4096) -> Response:
+        if claude_cli_pool.enabled():
+            # Worker z poolu je blokující pipe — v thread poolu
+            return await super().aexecute(messages, model, system, max_tokens)
+
+        argv, prompt, env = self._build(messages, model, system)
+        proc = await asyncio.create_subprocess_exec(
+            *argv, env=env,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            out, err = await asyncio.wait_for(proc.communicate(), timeout=120)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise subprocess.TimeoutExpired(argv, 120)
+
+        stdout = out.decode(errors='replace').strip()
+        if proc.returncode != 0:
+            msg = err.decode(errors='replace').strip() or stdout
+            raise BackendUnavailable(f"claude CLI selhal (kód {proc.returncode}): {msg}")
+
+        return self._to_response(prompt, stdout, argv[3])
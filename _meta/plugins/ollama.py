@@ -1,32 +1,49 @@
-"""Ollama backend plugin."""
+"""Ollama backend plugin — HTTP přes sdílený keep-alive klient ollama_http."""
 
-import json
-import urllib.request
-import urllib.error
-from _meta.plugins.base import Backend, Response
+import asyncio
+import weakref
+from collections.abc import Generator
+from _meta import ollama_http
+from _meta.plugins.base import Backend, BackendUnavailable, Response
 from _meta.router import OLLAMA_CHAT_URL, LOCAL_MODEL
 
+CHAT_PATH = '/api/chat'
+
+# Async klient (httpx) — jeden pooled klient na event loop
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _async_client():
+    """Vrátí httpx.AsyncClient pro běžící loop, None pokud httpx chybí."""
+    try:
+        import httpx
+    except ImportError:
+        return None
+    loop   = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(ollama_http.READ_TIMEOUT,
+                                  connect=ollama_http.CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_keepalive_connections=8),
+        )
+        _async_clients[loop] = client
+    return client
+
 
 class OllamaBackend(Backend):
     name = 'ollama'
     models: list[str] = []  # dynamicky doplňováno přes is_available / list
 
     def is_available(self) -> bool:
-        try:
-            req = urllib.request.Request(
-                'http://localhost:11434/',
-                method='HEAD'
-            )
-            with urllib.request.urlopen(req, timeout=2):
-                return True
-        except Exception:
-            return False
+        return ollama_http.ping()
 
     def get_pricing(self, model: str) -> dict[str, float]:
         return {'in': 0.0, 'out': 0.0}
 
-    def execute(self, messages: list[dict], model: str,
-                system: str | None = None, max_tokens: int = 4096) -> Response:
+    @staticmethod
+    def _payload(messages: list[dict], model: str, system: str | None,
+                 max_tokens: int) -> tuple[str, dict]:
         # model může být 'local', 'ollama/<název>' nebo přímo '<název>'
         if model == 'local':
             model_name = LOCAL_MODEL
@@ -40,34 +57,75 @@ class OllamaBackend(Backend):
             ollama_messages.append({'role': 'system', 'content': system})
         ollama_messages.extend(messages)
 
-        payload = json.dumps({
+        return model_name, ollama_http.with_keep_alive({
             'model':    model_name,
             'messages': ollama_messages,
             'stream':   False,
             'options':  {'num_predict': max_tokens},
-        }).encode()
-
-        req = urllib.request.Request(
-            OLLAMA_CHAT_URL, data=payload,
-            headers={'Content-Type': 'application/json'}
-        )
-        try:
-            with urllib.request.urlopen(req, timeout=120) as r:
-                data = json.loads(r.read())
-        except urllib.error.URLError as e:
-            raise RuntimeError(
-                f"Ollama nedostupná ({OLLAMA_CHAT_URL}): {e}\n"
-                "  Spusť: ollama serve"
-            )
-
-        text       = data['message']['content']
-        tokens_in  = data.get('prompt_eval_count', 0)
-        tokens_out = data.get('eval_count', 0)
+        })
 
+    @staticmethod
+    def _to_response(data: dict, model_name: str) -> Response:
         return Response(
-            text=text,
-            tokens_in=tokens_in,
-            tokens_out=tokens_out,
+            text=data['message']['content'],
+            tokens_in=data.get('prompt_eval_count', 0),
+            tokens_out=data.get('eval_count', 0),
             model=f'ollama/{model_name}',
             cost=0.0,
         )
+
+    def execute(self, messages: list[dict], model: str,
+                system: str | None = None, max_tokens: int = 4096) -> Response:
+        model_name, payload = self._payload(messages, model, system, max_tokens)
+        data = ollama_http.post_json(CHAT_PATH, payload)
+        return self._to_response(data, model_name)
+
+    def stream(self, messages: list[dict], model: str, system: str | None = None,
+               max_tokens: int = 4096) -> Generator[str, None, Response]:
+        """NDJSON stream z /api/chat — jeden řádek = jedna delta, poslední má done=true."""
+        model_name, payload = self._payload(messages, model, system, max_tokens)
+        payload['stream'] = True
+
+        parts: list[str] = []
+        final: dict = {}
+        # Stream se dočte do konce (za done=true už nic nepřijde), aby se
+        # spojení vrátilo do poolu
+        for data in ollama_http.stream_json(CHAT_PATH, payload):
+            delta = data.get('message', {}).get('content', '')
+            if delta:
+                parts.append(delta)
+                yield delta
+            if data.get('done'):
+                final = data
+
+        final['message'] = {'content': ''.join(parts)}
+        return self._to_response(final, model_name)
+
+    async def aexecute(self, messages: list[dict], model: str,
+                       system: str | None = None, max_tokens: int = 4096) -> Response:
+        client = _async_client()
+        if client is None:
+            return await super().aexecute(messages, model, system, max_tokens)
+
+        import httpx
+        model_name, payload = self._payload(messages, model, system, max_tokens)
+        for attempt in range(ollama_http.RETRY_503 + 1):
+            try:
+                r = await client.post(OLLAMA_CHAT_URL, json=payload)
+            except httpx.HTTPError as e:
+                raise BackendUnavailable(
+                    f"Ollama nedostupná ({OLLAMA_CHAT_URL}): {e}\n"
+                    "  Spusť: ollama serve"
+                )
+            if r.status_code != 503:
+                break
+            if attempt < ollama_http.RETRY_503:
+                await asyncio.sleep(ollama_http.BACKOFF_BASE * 2 ** attempt)
+        else:
+            raise BackendUnavailable(
+                f"Ollama nedostupná ({OLLAMA_CHAT_URL}): model se nenačetl (503)\n"
+                "  Spusť: ollama serve"
+            )
+        if r.status_code != 200:
+            raise ollama_http.OllamaHTTPError(r.status_code, r.text)
+        return self._to_response(r.json(), model_name)
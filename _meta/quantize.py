@@ -0,0 +1,103 @@
+"""
+Kvantizace embeddingů pro úložiště (code_index .vec soubor, cache_embeddings).
+
+  float32 — 4 B/dim, beze ztráty
+  float16 — 2 B/dim, relativní chyba ~1e-3 (pro kosínus zanedbatelná)
+  int8    — 1 B/dim + float32 měřítko na vektor (symetricky, max|x| → 127)
+
+Výpočty (skóre, ANN, re-ranking) běží vždy ve float32 — řádky se
+dekvantizují po blocích. BLOB v SQLite se pozná podle délky
+(dim×4 / dim×2 / dim+4), staré float32 BLOBy se tak čtou beze změny.
+"""
+
+import numpy as np
+
+FORMATS = ('float32', 'float16', 'int8')
+
+
+def _check(fmt: str) -> None:
+    if fmt not in FORMATS:
+        raise ValueError(f"Neznámý formát vektorů '{fmt}' (povolené: {', '.join(FORMATS)})")
+
+
+def row_dtype(dim: int, fmt: str) -> np.dtype:
+    """dtype jednoho uloženého řádku (pro np.memmap / np.frombuffer)."""
+    _check(fmt)
+    if fmt == 'int8':
+        return np.dtype([('scale', '<f4'), ('q', 'i1', (dim,))])
+    return np.dtype(('<f4' if fmt == 'float32' else '<f2', (dim,)))
+
+
+def row_bytes(dim: int, fmt: str) -> int:
+    return row_dtype(dim, fmt).itemsize
+
+
+# ─── Matice ───────────────────────────────────────────────────────────────────
+
+def encode_rows(m: np.ndarray, fmt: str) -> np.ndarray:
+    """float32 matice (n × dim) → pole řádků v daném formátu (tobytes() = zápis)."""
+    m   = np.ascontiguousarray(m, dtype=np.float32)
+    m   = m.reshape(-1, m.shape[-1])
+    out = np.empty(len(m), dtype=row_dtype(m.shape[1], fmt))
+    if fmt == 'int8':
+        scale = np.abs(m).max(axis=1) / 127.0
+        scale[scale == 0] = 1.0
+        out['scale'] = scale
+        out['q']     = np.clip(np.rint(m / scale[:, None]), -127, 127)
+    else:
+        out[:] = m
+    return out
+
+
+def decode_rows(raw: np.ndarray, fmt: str) -> np.ndarray:
+    """Pole řádků (z encode_rows / memmapu) → float32 matice."""
+    if fmt == 'int8':
+        return raw['q'].astype(np.float32) * raw['scale'][:, None]
+    return np.asarray(raw, dtype=np.float32)
+
+
+# ─── BLOB (SQLite) ────────────────────────────────────────────────────────────
+
+def encode(v: np.ndarray, fmt: str) -> bytes:
+    """Jeden vektor → BLOB."""
+    return encode_rows(v, fmt).tobytes()
+
+
+def blob_format(blob: bytes, dim: int) -> str:
+    for fmt in FORMATS:
+        if len(blob) == row_bytes(dim, fmt):
+            return fmt
+    raise ValueError(f"BLOB délky {len(blob)} neodpovídá žádnému formátu pro dim={dim}")
+
+
+def decode(blob: bytes, dim: int) -> np.ndarray:
+    """BLOB (libovolný z FORMATS) → float32 vektor."""
+    fmt = blob_format(blob, dim)
+    return decode_rows(np.frombuffer(blob, dtype=row_dtype(dim, fmt)), fmt)[0]
+
+
+# ─── Kontrola kvality ─────────────────────────────────────────────────────────
+
+def recall_at_k(ref: np.ndarray, fmt: str, k: int = 5, queries: int = 200,
+                seed: int = 0) -> float:
+    """
+    Recall@k kvantizovaných vektorů vůči referenci: dotazy = náhodné řádky
+    reference (samy sebe nepočítají), odpověď = top-k podle kosínu.
+    Vrací průměrný podíl referenčních top-k nalezených i po kvantizaci.
+    """
+    ref = np.asarray(ref, dtype=np.float32)
+    n   = len(ref)
+    if n <= k:
+        return 1.0
+    ref  = ref / (np.linalg.norm(ref, axis=1, keepdims=True) + 1e-10)
+    quan = decode_rows(encode_rows(ref, fmt), fmt)
+    pick = np.random.default_rng(seed).choice(n, min(queries, n), replace=False)
+
+    hits = 0
+    for i in pick:
+        s_ref, s_q = ref @ ref[i], quan @ ref[i]
+        s_ref[i] = s_q[i] = -np.inf
+        top_ref = np.argpartition(s_ref, -k)[-k:]
+        top_q   = np.argpartition(s_q, -k)[-k:]
+        hits   += len(np.intersect1d(top_ref, top_q))
+    return hits / (len(pick) * k)
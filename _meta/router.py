@@ -5,9 +5,17 @@ Extrahováno z token_tracker.py.
 """
 
 from __future__ import annotations
-from typing import TYPE_CHECKING
 
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator
+
+from _meta import health, scheduler
 from _meta.billing import normalize_model
+from _meta.ollama_http import OLLAMA_URL
 
 if TYPE_CHECKING:
     from _meta.plugins.base import Backend
@@ -16,7 +24,7 @@ if TYPE_CHECKING:
 
 LOCAL_MODEL      = 'qwen2.5-coder:14b'
 DEEPSEEK_MODEL   = 'deepseek-coder:33b'
-OLLAMA_CHAT_URL  = 'http://localhost:11434/api/chat'
+OLLAMA_CHAT_URL  = f'{OLLAMA_URL}/api/chat'
 
 ROUTING_RULES: dict[str, str] = {
     'doc_update':    'local',
@@ -40,6 +48,32 @@ CACHE_TTL: dict[str, int] = {
     '_default':     24,
 }
 
+# Latency budget (s) — LatencyAwarePolicy vyřadí backend, jehož odhad latence
+# (p50 × fronta před ním) budget překročí
+LATENCY_BUDGET: dict[str, float] = {
+    'doc_update':    180,
+    'boilerplate':   180,
+    'info_sync':     180,
+    'code_review':    90,
+    'architecture':  180,
+    'debug_complex':  60,
+    'deepseek':      180,
+    '_default':       60,
+}
+
+# Mezní cena backendu; None = dle MODEL_PRICES (claude-code je v paušálu Pro)
+MARGINAL_COST: dict[str, float | None] = {'ollama': 0.0, 'claude-code': 0.0, 'claude': None}
+
+STATS_WINDOW      = 100    # posledních N volání pro p50/p95 a error rate
+STATS_MIN_SAMPLES = 5      # pod tímto počtem se statistikám nevěří
+MAX_ERROR_RATE    = 0.5
+
+# Hedging — primární backend neodpověděl do HEDGE_PERCENTILE své historické
+# latence → stejný request i na dalším kandidátovi; bez dat = latency budget
+HEDGE_PERCENTILE  = 0.95
+HEDGE_MIN_DELAY   = 2.0    # s — dřív se nehedguje ani u rychlých backendů
+REQUEST_DEADLINE  = 180.0  # s — celkový limit interaktivního requestu (agent-ui)
+
 
 # ─── Funkce ───────────────────────────────────────────────────────────────────
 
@@ -68,49 +102,293 @@ def resolve_model(operation: str, model: str) -> str:
     return normalize_model(dest)
 
 
+def exec_model_for(backend_name: str, full_model: str) -> str:
+    """Model, na kterém se request na daném backendu opravdu vykoná."""
+    if backend_name == 'ollama' and not full_model.startswith('ollama/'):
+        # Fallback: Ollama vybrána pro cloud model → LOCAL_MODEL
+        return f'ollama/{LOCAL_MODEL}'
+    if backend_name != 'ollama' and full_model.startswith('ollama/'):
+        # Lokální operace odkloněná na cloud → výchozí cloud model
+        return normalize_model(ROUTING_RULES['_default'])
+    return full_model
+
+
+def serves_model(backend_name: str, full_model: str) -> bool:
+    """
+    Obslouží backend model ve stejné třídě? Cloud model na Ollamě je
+    downgrade na LOCAL_MODEL; lokální model na cloudu je upgrade (v pořádku).
+    """
+    return backend_name != 'ollama' or full_model.startswith('ollama/')
+
+
+def stats_key(backend_name: str, exec_model: str) -> str:
+    """Klíč statistik = Response.model daného backendu (shodný s token_log.model)."""
+    if backend_name == 'claude-code':
+        return f'claude-code/{normalize_model(exec_model)}'
+    if backend_name == 'claude':
+        return normalize_model(exec_model)
+    return exec_model
+
+
+# ─── Statistiky backendů ──────────────────────────────────────────────────────
+# Klouzavé okno latencí a chyb per (backend, model) z běhů Orchestratoru.
+# Latence se při prvním použití dosejí z token_log.latency_ms, aby měl
+# i krátce žijící CLI proces (agent route --show) reálná data.
+
+class BackendStats:
+    def __init__(self) -> None:
+        self.latencies: deque[float] = deque(maxlen=STATS_WINDOW)   # s, jen úspěšné
+        self.outcomes:  deque[bool]  = deque(maxlen=STATS_WINDOW)   # True = chyba
+        self.inflight = 0
+
+    def percentile(self, q: float) -> float | None:
+        if len(self.latencies) < STATS_MIN_SAMPLES:
+            return None
+        data = sorted(self.latencies)
+        return data[min(len(data) - 1, int(q * len(data)))]
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+
+_stats: dict[str, BackendStats] = {}
+_stats_lock = threading.Lock()
+_seeded = False
+
+
+def _ensure_seeded() -> None:
+    global _seeded
+    if _seeded:
+        return
+    _seeded = True
+    from _meta.billing import init_db   # lazy — billing ↔ router
+    try:
+        conn = init_db()
+        rows = conn.execute("""
+            SELECT model, latency_ms FROM token_log
+            WHERE latency_ms IS NOT NULL AND (cache_hit = 0 OR cache_hit IS NULL)
+              AND id > (SELECT COALESCE(MAX(id), 0) FROM token_log) - 5000
+            ORDER BY id
+        """).fetchall()
+        conn.close()
+    except Exception:
+        return
+    with _stats_lock:
+        for r in rows:
+            st = _stats.setdefault(r['model'], BackendStats())
+            st.latencies.append(r['latency_ms'] / 1000)
+            st.outcomes.append(False)
+
+
+def _get_stats(key: str) -> BackendStats:
+    with _stats_lock:
+        return _stats.setdefault(key, BackendStats())
+
+
+def _backend_inflight(backend_name: str) -> int:
+    """Běžící + ve scheduleru čekající requesty na backend."""
+    prefix = {'claude-code': 'claude-code/', 'ollama': 'ollama/'}.get(backend_name)
+    with _stats_lock:
+        running = sum(st.inflight for k, st in _stats.items()
+                      if (k.startswith(prefix) if prefix else
+                          not k.startswith(('claude-code/', 'ollama/'))))
+    return running + scheduler.depth(backend_name)
+
+
+class Execution:
+    """Výsledek track(): latence po skončení bloku."""
+    latency_ms: int | None = None
+
+
+@contextmanager
+def track(backend_name: str, exec_model: str) -> Iterator[Execution]:
+    """Započítá in-flight request a po skončení latenci / chybu do statistik."""
+    _ensure_seeded()
+    st  = _get_stats(stats_key(backend_name, exec_model))
+    ex  = Execution()
+    t0  = time.monotonic()
+    with _stats_lock:
+        st.inflight += 1
+    failed, cancelled = True, False
+    try:
+        yield ex
+        failed = False
+    except asyncio.CancelledError:
+        cancelled = True   # zrušený hedge není chyba backendu
+        raise
+    finally:
+        elapsed = time.monotonic() - t0
+        ex.latency_ms = int(elapsed * 1000)
+        with _stats_lock:
+            st.inflight -= 1
+            if not cancelled:
+                st.outcomes.append(failed)
+            if not failed:
+                st.latencies.append(elapsed)
+
+
+def hedge_delay(operation: str, backend_name: str, exec_model: str) -> float:
+    """
+    Za kolik s od startu spustit záložní request: HEDGE_PERCENTILE latence
+    backendu (min. HEDGE_MIN_DELAY), nejvýš latency budget operace.
+    """
+    _ensure_seeded()
+    budget = LATENCY_BUDGET.get(operation, LATENCY_BUDGET['_default'])
+    st = _get_stats(stats_key(backend_name, exec_model))
+    with _stats_lock:
+        p = st.percentile(HEDGE_PERCENTILE)
+    if p is None:
+        return budget
+    return min(max(p, HEDGE_MIN_DELAY), budget)
+
+
+def stats_snapshot() -> list[dict]:
+    """Živé statistiky pro `agent route --show`."""
+    _ensure_seeded()
+    with _stats_lock:
+        items = list(_stats.items())
+    out = []
+    for key, st in sorted(items):
+        out.append({
+            'key':        key,
+            'samples':    len(st.latencies),
+            'p50':        st.percentile(0.5),
+            'p95':        st.percentile(0.95),
+            'error_rate': st.error_rate,
+            'inflight':   st.inflight,
+        })
+    return out
+
+
+# ─── Routing policy ───────────────────────────────────────────────────────────
+
+class RoutingPolicy:
+    """
+    Vybírá z dostupných kandidátů (již seřazených dle priority backendů).
+    Vlastní politiku lze nastavit přes set_policy().
+    """
+
+    def choose(self, operation: str, candidates: list['Backend'],
+               full_model: str) -> 'Backend':
+        return candidates[0]
+
+
+class PriorityPolicy(RoutingPolicy):
+    """Původní chování — první dostupný backend v pořadí priority."""
+
+
+class LatencyAwarePolicy(RoutingPolicy):
+    """
+    Nejlevnější kandidát, který splní latency budget operace a nemá vysokou
+    chybovost. Odhad latence = p50 × (1 + požadavky před ním / limit backendu
+    ve scheduleru);
+    bez dostatku dat se backendu věří. Když budget nesplní nikdo, vezme
+    se kandidát s nejnižším odhadem.
+    """
+
+    def estimate(self, backend: 'Backend', full_model: str) -> float | None:
+        st  = _get_stats(stats_key(backend.name, exec_model_for(backend.name, full_model)))
+        p50 = st.percentile(0.5)
+        if p50 is None:
+            return None
+        capacity = scheduler.MAX_INFLIGHT.get(backend.name)
+        queue    = _backend_inflight(backend.name) // capacity if capacity else 0
+        return p50 * (1 + queue)
+
+    def cost(self, backend: 'Backend', full_model: str) -> float:
+        fixed = MARGINAL_COST.get(backend.name)
+        if fixed is not None:
+            return fixed
+        prices = backend.get_pricing(exec_model_for(backend.name, full_model))
+        return prices['in'] + prices['out']
+
+    def choose(self, operation: str, candidates: list['Backend'],
+               full_model: str) -> 'Backend':
+        _ensure_seeded()
+        budget = LATENCY_BUDGET.get(operation, LATENCY_BUDGET['_default'])
+        scored = []
+        for rank, b in enumerate(candidates):
+            st = _get_stats(stats_key(b.name, exec_model_for(b.name, full_model)))
+            if len(st.outcomes) >= STATS_MIN_SAMPLES and st.error_rate > MAX_ERROR_RATE:
+                continue
+            est = self.estimate(b, full_model)
+            if est is None:
+                capacity = scheduler.MAX_INFLIGHT.get(b.name)
+                if capacity and _backend_inflight(b.name) >= capacity and len(candidates) > 1:
+                    continue  # plný backend bez dat o latenci — raději jiný
+            elif est > budget:
+                continue
+            scored.append((self.cost(b, full_model), rank, b))
+        if scored:
+            return min(scored, key=lambda t: t[:2])[2]
+
+        # Nikdo nesplnil budget → nejnižší odhad (neznámý odhad = priorita)
+        ests = [(self.estimate(b, full_model), rank, b) for rank, b in enumerate(candidates)]
+        return min(ests, key=lambda t: (t[0] if t[0] is not None else float('inf'), t[1]))[2]
+
+
+_policy: RoutingPolicy = LatencyAwarePolicy()
+
+
+def set_policy(policy: RoutingPolicy) -> None:
+    global _policy
+    _policy = policy
+
+
+def get_policy() -> RoutingPolicy:
+    return _policy
+
+
 def select_backend(operation: str, backends: list['Backend'],
-                   model_hint: str = '') -> 'Backend':
+                   model_hint: str = '', explicit: bool = True,
+                   exclude: tuple[str, ...] = (),
+                   allow_downgrade: bool = True) -> 'Backend':
     """
-    Vybere dostupný backend dle routing pravidel.
+    Vybere dostupný backend dle routing pravidel a routing policy.
 
     Priorita pro cloud modely: claude-code (Pro, zdarma) → claude API → Ollama
     Priorita pro lokální modely: Ollama → claude-code → claude API
-    model_hint: pokud začíná 'ollama/', vynutí Ollama backend.
+    model_hint: pokud začíná 'ollama/' a explicit=True, vynutí Ollama backend;
+    s explicit=False (model 'auto') smí policy lokální operaci odklonit na cloud.
+    Dostupnost se čte z health registru (cache + testy na pozadí).
+    Policy (cena, latence) vybírá jen mezi backendy, které model obslouží
+    (serves_model) — cloud model jde na Ollamu až když žádný cloud backend
+    není dostupný.
+    exclude: jména backendů, které nebrat (hedge na jiný backend než primární).
+    allow_downgrade=False: ani jako poslední záchrana ne backend, který model
+    neobslouží (hedge — rychlejší horší odpověď by vyhrála a zůstala v cache).
     """
     dest = ROUTING_RULES.get(operation, ROUTING_RULES['_default'])
+    available = [b for b in backends if b.name not in exclude and health.is_up(b)]
 
-    # Explicitní Ollama model (z resolve_model)
-    if model_hint.startswith('ollama/'):
-        for b in backends:
-            if b.name == 'ollama' and b.is_available():
-                return b
-        raise RuntimeError(
-            f"Ollama backend nedostupný (model: {model_hint})\n"
-            "  Spusť: ollama serve"
-        )
+    def ordered(names: tuple[str, ...]) -> list['Backend']:
+        return [b for name in names for b in available if b.name == name]
 
-    if dest in ('local', 'deepseek'):
+    # Explicitní Ollama model (z resolve_model)
+    if model_hint.startswith('ollama/') and explicit:
+        candidates = ordered(('ollama',))
+        if not candidates:
+            raise RuntimeError(
+                f"Ollama backend nedostupný (model: {model_hint})\n"
+                "  Spusť: ollama serve"
+            )
+    elif dest in ('local', 'deepseek') or model_hint.startswith('ollama/'):
         # Lokální model přes Ollamu, fallback na cloud
-        for b in backends:
-            if b.name == 'ollama' and b.is_available():
-                return b
-        for name in ('claude-code', 'claude'):
-            for b in backends:
-                if b.name == name and b.is_available():
-                    return b
+        candidates = ordered(('ollama', 'claude-code', 'claude'))
     else:
         # Cloud model: claude-code (Pro) → claude API → Ollama (fallback)
-        for name in ('claude-code', 'claude', 'ollama'):
-            for b in backends:
-                if b.name == name and b.is_available():
-                    return b
+        candidates = ordered(('claude-code', 'claude', 'ollama'))
 
     # Poslední záchrana — první dostupný
-    for b in backends:
-        if b.is_available():
-            return b
-
-    raise RuntimeError(
-        f"Žádný backend není dostupný pro operaci '{operation}'.\n"
-        "  Zkontroluj ANTHROPIC_API_KEY nebo spusť: ollama serve"
-    )
+    candidates = candidates or available[:1]
+    if not candidates:
+        raise RuntimeError(
+            f"Žádný backend není dostupný pro operaci '{operation}'.\n"
+            "  Zkontroluj ANTHROPIC_API_KEY nebo spusť: ollama serve"
+        )
+    full_model = model_hint or resolve_model(operation, 'auto')
+    capable    = [b for b in candidates if serves_model(b.name, full_model)]
+    if not capable and not allow_downgrade:
+        raise RuntimeError(f"Žádný rovnocenný backend pro model {full_model}")
+    return _policy.choose(operation, capable or candidates, full_model)
@@ -0,0 +1,230 @@
+"""
+Scheduler — limit souběžných requestů per backend / model + prioritní fronta.
+
+Orchestrator si před execute vezme slot (acquire) a po doběhnutí ho vrátí.
+Když je backend (nebo model) plný, request čeká ve frontě seřazené dle
+priority, při shodě FIFO:
+  PRIORITY_INTERACTIVE  — /ask z agent-ui, CLI `agent ask`
+  PRIORITY_NORMAL       — výchozí (skripty, call_api)
+  PRIORITY_BACKGROUND   — souhrny konverzací, auto-názvy
+
+Fronta je sdílená v procesu (agent-ui vytváří Orchestrator per request).
+acquire() čeká blokujícím způsobem (vlákna), aacquire() v event loopu —
+async čekatel nedrží vlákno, probudí ho release přes call_soon_threadsafe.
+metrics() vrací hloubku fronty, běžící requesty a dobu čekání.
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+# ─── Konfigurace ─────────────────────────────────────────────────────────────
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL      = 5
+PRIORITY_BACKGROUND  = 10
+
+# Max. souběžných requestů per backend; chybějící backend = bez limitu
+MAX_INFLIGHT: dict[str, int] = {
+    'ollama':      1,     # jedna GPU — další model by se jen swapoval
+    'claude-code': 4,
+    'claude':      8,
+}
+# Volitelné limity per model (klíč = exec model), platí navíc k backendu
+MAX_INFLIGHT_MODEL: dict[str, int] = {}
+
+WAIT_WINDOW = 200   # posledních N čekání pro metriky
+
+
+@dataclass
+class _Gate:
+    limit: int
+    inflight: int = 0
+    acquired: int = 0
+    waits: deque = field(default_factory=lambda: deque(maxlen=WAIT_WINDOW))
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    gates: tuple = field(compare=False)
+    # async čekatel: event loop + Event, který release nastaví
+    loop:  asyncio.AbstractEventLoop | None = field(default=None, compare=False)
+    event: asyncio.Event | None = field(default=None, compare=False)
+
+
+_cond    = threading.Condition()
+_gates: dict[str, _Gate] = {}
+_waiting: list[_Waiter] = []
+_seq     = itertools.count()
+
+
+def _gate_keys(backend: str, model: str) -> tuple[str, ...]:
+    keys = []
+    if backend in MAX_INFLIGHT:
+        keys.append(backend)
+    if model in MAX_INFLIGHT_MODEL:
+        keys.append(f'{backend}:{model}')
+    return tuple(keys)
+
+
+def _gate(key: str) -> _Gate:
+    g = _gates.get(key)
+    if g is None:
+        backend, _, model = key.partition(':')
+        limit = MAX_INFLIGHT_MODEL[model] if model else MAX_INFLIGHT[backend]
+        g = _gates[key] = _Gate(limit=limit)
+    return g
+
+
+def _notify() -> None:
+    """Probudí sync i async čekatele (volat pod _cond)."""
+    _cond.notify_all()
+    for w in _waiting:
+        if w.loop is not None:
+            try:
+                w.loop.call_soon_threadsafe(w.event.set)
+            except RuntimeError:
+                pass   # loop už neběží — čekatel se uklidí sám
+
+
+def _take(w: _Waiter, waited: float) -> None:
+    """Obsadí brány čekatele (volat pod _cond, po _can_run)."""
+    for k in w.gates:
+        g = _gate(k)
+        g.inflight += 1
+        g.acquired += 1
+        g.waits.append((w.priority, waited))
+
+
+def _can_run(w: _Waiter) -> bool:
+    """Volno ve všech branách a žádný přednostní čekatel na stejné bráně."""
+    if any(_gate(k).inflight >= _gate(k).limit for k in w.gates):
+        return False
+    return not any(o < w and set(o.gates) & set(w.gates) for o in _waiting)
+
+
+# ─── Slot ─────────────────────────────────────────────────────────────────────
+
+class Slot:
+    """Přidělené místo na backendu; release() ho vrátí (i opakovaně bezpečně)."""
+
+    def __init__(self, gates: tuple[str, ...], waited: float) -> None:
+        self.gates  = gates
+        self.waited = waited
+        self._released = False
+
+    def release(self) -> None:
+        with _cond:
+            if self._released:
+                return
+            self._released = True
+            for k in self.gates:
+                _gate(k).inflight -= 1
+            _notify()
+
+    def __enter__(self) -> 'Slot':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+def acquire(backend: str, model: str, priority: int = PRIORITY_NORMAL,
+            timeout: float | None = None) -> Slot:
+    """
+    Počká na volný slot pro (backend, model). TimeoutError po `timeout` s.
+    Backend bez limitu vrátí slot okamžitě.
+    """
+    gates = _gate_keys(backend, model)
+    if not gates:
+        return Slot((), 0.0)
+
+    w  = _Waiter(priority, next(_seq), gates)
+    t0 = time.monotonic()
+    with _cond:
+        _waiting.append(w)
+        try:
+            while not _can_run(w):
+                left = None if timeout is None else timeout - (time.monotonic() - t0)
+                if left is not None and left <= 0:
+                    raise TimeoutError(
+                        f"Scheduler: {backend}/{model} — čekání na slot > {timeout}s"
+                    )
+                _cond.wait(left)
+        finally:
+            _waiting.remove(w)
+            _notify()   # další čekatel mohl právě získat přednost
+        waited = time.monotonic() - t0
+        _take(w, waited)
+    return Slot(gates, waited)
+
+
+async def aacquire(backend: str, model: str, priority: int = PRIORITY_NORMAL,
+                   timeout: float | None = None) -> Slot:
+    """
+    acquire() pro asyncio — čeká na Event v event loopu, ne ve vlákně.
+    Zrušení tasku během čekání slot nezabere.
+    """
+    gates = _gate_keys(backend, model)
+    if not gates:
+        return Slot((), 0.0)
+
+    w  = _Waiter(priority, next(_seq), gates,
+                 loop=asyncio.get_running_loop(), event=asyncio.Event())
+    t0 = time.monotonic()
+    with _cond:
+        _waiting.append(w)
+    try:
+        while True:
+            with _cond:
+                if _can_run(w):
+                    waited = time.monotonic() - t0
+                    _take(w, waited)
+                    return Slot(gates, waited)
+                w.event.clear()   # pod zámkem — release po tomhle Event znovu nastaví
+            left = None if timeout is None else timeout - (time.monotonic() - t0)
+            if left is not None and left <= 0:
+                raise TimeoutError(
+                    f"Scheduler: {backend}/{model} — čekání na slot > {timeout}s"
+                )
+            try:
+                await asyncio.wait_for(w.event.wait(), left)
+            except asyncio.TimeoutError:
+                pass   # další průchod vyhodnotí timeout
+    finally:
+        with _cond:
+            _waiting.remove(w)
+            _notify()
+
+
+# ─── Metriky ──────────────────────────────────────────────────────────────────
+
+def depth(backend: str) -> int:
+    """Počet requestů čekajících na backend (pro odhad latence v routeru)."""
+    with _cond:
+        return sum(1 for w in _waiting if backend in w.gates)
+
+
+def metrics() -> dict[str, dict]:
+    """Per brána: limit, běžící, fronta (celkem i dle priority), doby čekání."""
+    out = {}
+    with _cond:
+        for key, g in sorted(_gates.items()):
+            queued = [w.priority for w in _waiting if key in w.gates]
+            waits  = sorted(s for _, s in g.waits)
+            out[key] = {
+                'limit':     g.limit,
+                'inflight':  g.inflight,
+                'queued':    len(queued),
+                'queued_by_priority': {p: queued.count(p) for p in sorted(set(queued))},
+                'acquired':  g.acquired,
+                'wait_avg':  sum(waits) / len(waits) if waits else 0.0,
+                'wait_p95':  waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else 0.0,
+                'wait_max':  waits[-1] if waits else 0.0,
+            }
+    return out
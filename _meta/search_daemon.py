@@ -0,0 +1,227 @@
+"""
+Search daemon pro `agent search` — index držený v paměti mezi dotazy.
+
+Každé `agent search` jinak znovu otevírá SQLite, vektorový soubor a ANN index
+a embedding dotazu hledá v prázdné LRU. Daemon je drží otevřené (SearchContext)
+spolu s LRU embeddingů dotazů; integrace v editoru volají search desítkykrát
+za minutu a studený start by převážil samotné hledání.
+
+  - UNIX socket ~/.ai-agent/search.sock (jen pro vlastníka)
+  - protokol: jeden JSON řádek dotaz → jeden JSON řádek odpověď
+      {"op": "search", "query": …, "top_n": …}  → {"results": […], "notes": […]}
+      {"op": "status"} / {"op": "stop"}
+  - změny indexu: PRAGMA data_version (commit z jiného spojení), inode DB
+    souboru (smazaná a znovu založená DB) a mtime ANN indexu → invalidate
+  - daemon neběží / neodpovídá → cmd_search hledá v procesu jako dřív
+
+CLI:
+  agent search-daemon             # běží v popředí (systemd / tmux / &)
+  agent search-daemon --status
+  agent search-daemon --stop
+"""
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import time
+from typing import Any
+
+from _meta import embeddings
+from _meta.chroma_indexer import (
+    ANN_INDEX_PATH, DB_DIR, INDEX_DB_PATH, C, D, G, R, Y, SearchContext, bold,
+    init_index_db, search,
+)
+
+# ─── Konfigurace ─────────────────────────────────────────────────────────────
+
+SOCKET_PATH     = DB_DIR / 'search.sock'
+CONNECT_TIMEOUT = 0.2     # s — klient: daemon, který hned nepřijme, se přeskočí
+QUERY_TIMEOUT   = 60.0    # s — klient: max. doba dotazu (embedding na studené Ollamě)
+REQUEST_TIMEOUT = 5.0     # s — daemon: max. čekání na řádek dotazu od klienta
+POLL_INTERVAL   = 1.0     # s — jak často smyčka kontroluje signál ke stopu
+
+RESULT_FIELDS = ('id', 'filepath', 'project', 'language', 'chunk_start', 'chunk_end',
+                 'chunk_type', 'name', 'content')
+
+
+# ─── Klient ───────────────────────────────────────────────────────────────────
+
+def _call(request: dict, timeout: float = QUERY_TIMEOUT) -> dict | None:
+    """Pošle dotaz daemonu; None = daemon neběží (chybí socket, odmítnuto, timeout)."""
+    if not SOCKET_PATH.exists():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(CONNECT_TIMEOUT)
+            s.connect(str(SOCKET_PATH))
+            s.settimeout(timeout)
+            s.sendall(json.dumps(request, ensure_ascii=False).encode() + b'\n')
+            with s.makefile('rb') as f:
+                line = f.readline()
+    except OSError:
+        return None
+    if not line:
+        return None
+    return json.loads(line)
+
+
+def query(opts: dict) -> tuple[list[tuple[dict, float]], list[str]] | None:
+    """
+    Hledání přes daemon — (výsledky, poznámky) jako chroma_indexer.search,
+    řádky jsou dict. None = daemon nedostupný nebo selhal → hledat v procesu.
+    """
+    resp = _call({'op': 'search', **opts})
+    if resp is None or 'error' in resp:
+        return None
+    return [(r, r['score']) for r in resp['results']], resp['notes']
+
+
+# ─── Daemon ───────────────────────────────────────────────────────────────────
+
+class _State:
+    """Teplý SearchContext + detekce změn indexu."""
+
+    def __init__(self) -> None:
+        self.ctx      = SearchContext(init_index_db())
+        self.started  = time.monotonic()
+        self.served   = 0
+        self.reloads  = 0
+        self._seen    = self._version()
+
+    def _version(self) -> tuple:
+        def stat(path) -> tuple[int, int]:
+            try:
+                st = path.stat()
+                return st.st_ino, st.st_mtime_ns
+            except FileNotFoundError:
+                return 0, 0
+        data_version = self.ctx.conn.execute("PRAGMA data_version").fetchone()[0]
+        return data_version, stat(INDEX_DB_PATH)[0], stat(ANN_INDEX_PATH)
+
+    def refresh(self) -> None:
+        """Index se od posledního dotazu změnil → zahodit cache (DB i znovu otevřít)."""
+        version = self._version()
+        if version == self._seen:
+            return
+        if version[1] != self._seen[1]:
+            self.ctx.close()
+            self.ctx = SearchContext(init_index_db())
+        else:
+            self.ctx.invalidate()
+        self.reloads += 1
+        self._seen = self._version()
+
+    def warm(self) -> None:
+        """Otevře vektory a ANN index předem, ať první dotaz neplatí studený start."""
+        self.ctx.vectors()
+        self.ctx.ann()
+
+    def handle(self, request: dict) -> dict:
+        op = request.pop('op', 'search')
+        if op == 'status':
+            vecs = self.ctx.vectors()
+            return {
+                'pid':     os.getpid(),
+                'uptime':  time.monotonic() - self.started,
+                'served':  self.served,
+                'reloads': self.reloads,
+                'rows':    vecs.rows,
+                'format':  vecs.fmt,
+                'embed':   embeddings.stats(),
+            }
+        if op == 'stop':
+            raise _Stop
+        if op != 'search':
+            return {'error': f"Neznámá operace '{op}'"}
+
+        self.refresh()
+        results, notes = search(self.ctx, **request)
+        self.served += 1
+        return {
+            'results': [{**{k: r[k] for k in RESULT_FIELDS}, 'score': float(score)}
+                        for r, score in results],
+            'notes':   notes,
+        }
+
+
+class _Stop(Exception):
+    """Požadavek na ukončení daemonu."""
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    timeout = REQUEST_TIMEOUT
+
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line:
+            return
+        stop = False
+        try:
+            resp = self.server.state.handle(json.loads(line))
+        except _Stop:
+            resp, stop = {'stopping': True}, True
+        except Exception as e:   # chyba dotazu nesmí shodit daemon
+            resp = {'error': f'{type(e).__name__}: {e}'}
+        self.wfile.write(json.dumps(resp, ensure_ascii=False).encode() + b'\n')
+        self.server.stopping = stop
+
+
+def serve() -> None:
+    """Spustí daemon v popředí; dotazy vyřizuje postupně (SQLite spojení je jedno)."""
+    if _call({'op': 'status'}, timeout=CONNECT_TIMEOUT) is not None:
+        print(f"{Y}Search daemon už běží ({SOCKET_PATH}){R}")
+        return
+    SOCKET_PATH.unlink(missing_ok=True)   # po pádu předchozího daemonu
+
+    state = _State()
+    state.warm()
+
+    old_umask = os.umask(0o177)
+    try:
+        server = socketserver.UnixStreamServer(str(SOCKET_PATH), _Handler)
+    finally:
+        os.umask(old_umask)
+    server.state    = state
+    server.stopping = False
+    server.timeout  = POLL_INTERVAL
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"{G}Search daemon běží{R}  {D}{SOCKET_PATH}  pid {os.getpid()}{R}")
+    try:
+        while not server.stopping:
+            server.handle_request()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        SOCKET_PATH.unlink(missing_ok=True)
+        state.ctx.close()
+    print(f"{D}Search daemon ukončen ({state.served} dotazů){R}")
+
+
+# ─── CLI ──────────────────────────────────────────────────────────────────────
+
+def cmd_daemon(args: Any) -> None:
+    if getattr(args, 'stop', False):
+        resp = _call({'op': 'stop'}, timeout=CONNECT_TIMEOUT * 10)
+        print(f"{G}Search daemon zastaven{R}" if resp else f"{Y}Search daemon neběží{R}")
+        return
+
+    if getattr(args, 'status', False):
+        resp = _call({'op': 'status'}, timeout=CONNECT_TIMEOUT * 10)
+        if resp is None:
+            print(f"{Y}Search daemon neběží{R}")
+            return
+        emb = resp['embed']
+        print(f"\n{bold('SEARCH DAEMON')}  {D}pid {resp['pid']}  {SOCKET_PATH}{R}")
+        print(f"  uptime     {C}{resp['uptime']:.0f} s{R}")
+        print(f"  dotazů     {C}{resp['served']}{R}  {D}(reloadů indexu: {resp['reloads']}){R}")
+        print(f"  vektory    {C}{resp['rows']}{R}  {D}{resp['format']}{R}")
+        print(f"  embeddingy {D}{json.dumps(emb)}{R}")
+        print()
+        return
+
+    serve()
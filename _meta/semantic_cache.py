@@ -2,67 +2,175 @@
 Sémantická cache — embedding-based lookup přes nomic-embed-text (Ollama).
 
 Fallback na hash cache pokud Ollama nedostupná.
+
+Embeddingy drží rezidentní index (normalizovaná float32 matice per operace):
+načte se z SQLite jednou, dál se jen dočítají nové řádky (id > last_id)
+a store() ho aktualizuje inkrementálně. Lookup = jeden součin matice × vektor.
+
+BLOBy se ukládají ve formátu CACHE_VEC_FORMAT (viz quantize.py); čtení
+pozná formát podle délky, takže starší float32 řádky fungují dál.
+Převod existujících řádků: convert_embeddings() / `agent cache --embed-format`.
 """
 
-import json
 import sqlite3
-import struct
-import urllib.request
-import urllib.error
-from _meta.billing import DB_DIR, DB_PATH, init_db
+import threading
+from _meta.billing import DB_PATH, init_db
+from _meta.db import migrate
+from _meta import embeddings, quantize
+from _meta.embeddings import EMBED_MODEL
 
 import numpy as np
 
-OLLAMA_EMBED_URL = 'http://localhost:11434/api/embeddings'
-EMBED_MODEL      = 'nomic-embed-text'
 EMBED_DIM        = 768
+CACHE_VEC_FORMAT = 'float16'   # float32 / float16 / int8
+
+
+_MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS cache_embeddings (
+        id          INTEGER PRIMARY KEY,
+        prompt_text TEXT,
+        response    TEXT,
+        embedding   BLOB,
+        operation   VARCHAR(50),
+        model       VARCHAR(30),
+        created     DATETIME DEFAULT CURRENT_TIMESTAMP,
+        hit_count   INTEGER DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_cache_emb_op ON cache_embeddings(operation, id)",
+]
 
 
 def _init_embed_table(conn: sqlite3.Connection) -> None:
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS cache_embeddings (
-            id          INTEGER PRIMARY KEY,
-            prompt_text TEXT,
-            response    TEXT,
-            embedding   BLOB,
-            operation   VARCHAR(50),
-            model       VARCHAR(30),
-            created     DATETIME DEFAULT CURRENT_TIMESTAMP,
-            hit_count   INTEGER DEFAULT 0
-        )
-    """)
-    conn.commit()
+    migrate(conn, 'semantic_cache', _MIGRATIONS)
 
 
 def embed(text: str) -> np.ndarray | None:
-    """Volá Ollama nomic-embed-text. Vrátí None pokud Ollama nedostupná."""
-    payload = json.dumps({'model': EMBED_MODEL, 'prompt': text}).encode()
-    req = urllib.request.Request(
-        OLLAMA_EMBED_URL, data=payload,
-        headers={'Content-Type': 'application/json'}
-    )
+    """
+    Embedding přes sdílenou službu (LRU + disková cache) — stejný prompt
+    v lookup() i store() tak stojí jen jeden Ollama request.
+    Vrátí None pokud Ollama nedostupná.
+    """
     try:
-        with urllib.request.urlopen(req, timeout=10) as r:
-            data = json.loads(r.read())
-        return np.array(data['embedding'], dtype=np.float32)
+        return embeddings.embed(text, EMBED_MODEL, timeout=10)
     except Exception:
         return None
 
 
-def _vec_to_blob(v: np.ndarray) -> bytes:
-    return struct.pack(f'{len(v)}f', *v)
+def _vec_to_blob(v: np.ndarray, fmt: str | None = None) -> bytes:
+    return quantize.encode(v, fmt or CACHE_VEC_FORMAT)
 
 
 def _blob_to_vec(b: bytes) -> np.ndarray:
-    n = len(b) // 4
-    return np.array(struct.unpack(f'{n}f', b), dtype=np.float32)
+    try:
+        return quantize.decode(b, EMBED_DIM)
+    except ValueError:
+        # Jiná dimenze (jiný embedding model) — float32; index ji přeskočí
+        return np.frombuffer(b, dtype=np.float32)
+
+
+def _normalize(v: np.ndarray) -> np.ndarray:
+    return v / (np.linalg.norm(v) + 1e-10)
+
+
+# ─── Rezidentní index ─────────────────────────────────────────────────────────
+
+class _OperationIndex:
+    """Normalizované embeddingy jedné operace v souvislé float32 matici."""
+
+    def __init__(self) -> None:
+        self.ids     = np.empty(0, dtype=np.int64)
+        self.matrix  = np.empty((0, EMBED_DIM), dtype=np.float32)
+        self.size    = 0
+        self.last_id = 0
+
+    def add(self, row_id: int, vec: np.ndarray) -> None:
+        if vec.shape[0] != self.matrix.shape[1]:
+            return  # jiný embedding model / dimenze — ignorovat
+        if self.size == len(self.ids):
+            cap = max(64, 2 * self.size)  # amortizované zdvojení kapacity
+            ids = np.empty(cap, dtype=np.int64)
+            mat = np.empty((cap, self.matrix.shape[1]), dtype=np.float32)
+            ids[:self.size] = self.ids[:self.size]
+            mat[:self.size] = self.matrix[:self.size]
+            self.ids, self.matrix = ids, mat
+        self.ids[self.size]    = row_id
+        self.matrix[self.size] = _normalize(vec)
+        self.size   += 1
+        self.last_id = max(self.last_id, row_id)
+
+    def best(self, q: np.ndarray) -> tuple[int | None, float]:
+        """Vrátí (id, cosine) nejpodobnějšího řádku; q musí být normalizovaný."""
+        if self.size == 0 or q.shape[0] != self.matrix.shape[1]:
+            return None, 0.0
+        scores = self.matrix[:self.size] @ q
+        i = int(np.argmax(scores))
+        return int(self.ids[i]), float(scores[i])
+
 
+_indexes: dict[str, _OperationIndex] = {}
+_index_lock = threading.Lock()
 
-def _cosine(a: np.ndarray, b: np.ndarray) -> float:
-    denom = np.linalg.norm(a) * np.linalg.norm(b)
-    if denom == 0:
-        return 0.0
-    return float(np.dot(a, b) / denom)
+
+def _sync_index(conn: sqlite3.Connection, operation: str) -> _OperationIndex:
+    """
+    Vrátí index pro operaci. První volání načte všechny řádky z SQLite,
+    další jen dočtou řádky přidané mezitím (např. jiným procesem).
+    """
+    idx = _indexes.get(operation)
+    if idx is None:
+        idx = _indexes[operation] = _OperationIndex()
+    rows = conn.execute("""
+        SELECT id, embedding FROM cache_embeddings
+        WHERE operation = ? AND id > ?
+        ORDER BY id
+    """, (operation, idx.last_id)).fetchall()
+    for row in rows:
+        idx.add(row['id'], _blob_to_vec(row['embedding']))
+    return idx
+
+
+def convert_embeddings(fmt: str, batch: int = 1000) -> tuple[int, float]:
+    """
+    Přepíše embeddingy v cache_embeddings do formátu fmt.
+    Vrátí (počet převedených řádků, recall@5 vůči původním vektorům).
+    """
+    conn = init_db()
+    _init_embed_table(conn)
+    ref: list[np.ndarray] = []
+    converted, last_id = 0, 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, embedding FROM cache_embeddings WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, batch)
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for r in rows:
+            vec = _blob_to_vec(r['embedding'])
+            if vec.shape[0] != EMBED_DIM:
+                continue
+            if len(ref) < 5000:
+                ref.append(vec)
+            blob = _vec_to_blob(vec, fmt)
+            if blob != r['embedding']:
+                updates.append((blob, r['id']))
+        conn.executemany("UPDATE cache_embeddings SET embedding = ? WHERE id = ?", updates)
+        conn.commit()
+        converted += len(updates)
+        last_id = rows[-1]['id']
+    conn.close()
+    reset_index()
+    recall = quantize.recall_at_k(np.stack(ref), fmt) if ref else 1.0
+    return converted, recall
+
+
+def reset_index() -> None:
+    """Zahodí rezidentní index (např. po ručním smazání cache_embeddings)."""
+    with _index_lock:
+        _indexes.clear()
 
 
 def lookup(prompt: str, operation: str, threshold: float = 0.90) -> str | None:
@@ -77,33 +185,22 @@ def lookup(prompt: str, operation: str, threshold: float = 0.90) -> str | None:
     conn = init_db()
     _init_embed_table(conn)
 
-    rows = conn.execute("""
-        SELECT id, embedding, response FROM cache_embeddings
-        WHERE operation = ?
-        ORDER BY created DESC
-        LIMIT 500
-    """, (operation,)).fetchall()
-
-    best_id   = None
-    best_score = 0.0
-    best_resp  = None
-
-    for row in rows:
-        stored = _blob_to_vec(row['embedding'])
-        score  = _cosine(vec, stored)
-        if score > best_score:
-            best_score = score
-            best_id    = row['id']
-            best_resp  = row['response']
-
-    if best_score >= threshold and best_resp:
-        conn.execute(
-            "UPDATE cache_embeddings SET hit_count = hit_count + 1 WHERE id = ?",
-            (best_id,)
-        )
-        conn.commit()
-        conn.close()
-        return best_resp
+    with _index_lock:
+        idx = _sync_index(conn, operation)
+        best_id, best_score = idx.best(_normalize(vec))
+
+    if best_id is not None and best_score >= threshold:
+        row = conn.execute(
+            "SELECT response FROM cache_embeddings WHERE id = ?", (best_id,)
+        ).fetchone()
+        if row and row['response']:
+            conn.execute(
+                "UPDATE cache_embeddings SET hit_count = hit_count + 1 WHERE id = ?",
+                (best_id,)
+            )
+            conn.commit()
+            conn.close()
+            return row['response']
 
     conn.close()
     return None
@@ -122,4 +219,10 @@ def store(prompt: str, response: str, operation: str, model: str) -> None:
         VALUES (?, ?, ?, ?, ?)
     """, (prompt, response, _vec_to_blob(vec), operation, model))
     conn.commit()
+
+    # Inkrementální update indexu (jen pokud už je načtený; jinak ho
+    # při prvním lookupu načte _sync_index včetně tohoto řádku)
+    with _index_lock:
+        if operation in _indexes:
+            _sync_index(conn, operation)
     conn.close()
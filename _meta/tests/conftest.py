@@ -0,0 +1,44 @@
+"""
+Společné fixtures pro testy _meta.
+
+HOME se přesměruje do dočasného adresáře ještě před importem modulů _meta —
+cesty k DB (~/.ai-agent/…) se počítají při importu. Ollama se nahrazuje
+fake_ollama (deterministické vektory podle textu), nic nejde po síti.
+"""
+
+import hashlib
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ['HOME'] = tempfile.mkdtemp(prefix='agent-test-home-')
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+import numpy as np
+import pytest
+
+from _meta import embeddings
+
+EMBED_DIM = 768
+
+
+def fake_vector(text: str) -> list[float]:
+    seed = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+    return np.random.default_rng(seed).standard_normal(EMBED_DIM).tolist()
+
+
+@pytest.fixture
+def fake_ollama(monkeypatch):
+    """Nahradí embeddings._post; vrací seznam zaslaných requestů (path, payload)."""
+    calls: list[tuple[str, dict]] = []
+
+    def post(path: str, payload: dict, timeout: float) -> dict:
+        calls.append((path, payload))
+        if path == embeddings.OLLAMA_BATCH_PATH:
+            return {'embeddings': [fake_vector(t) for t in payload['input']]}
+        return {'embedding': fake_vector(payload['prompt'])}
+
+    monkeypatch.setattr(embeddings, '_post', post)
+    embeddings.clear_memory()
+    return calls
@@ -0,0 +1,64 @@
+"""IVF ANN index — recall vůči přesnému hledání, odložené add/remove."""
+
+import numpy as np
+
+from _meta.ann_index import IVFIndex
+
+DIM = 64
+
+
+def _clustered(n: int, seed: int = 0) -> np.ndarray:
+    """Vektory kolem 40 center — jako embeddingy kódu, ne rovnoměrný šum."""
+    rng     = np.random.default_rng(seed)
+    centers = rng.standard_normal((40, DIM))
+    return (centers[rng.integers(0, 40, n)] + 0.3 * rng.standard_normal((n, DIM))).astype(np.float32)
+
+
+def _exact_top(vecs: np.ndarray, q: np.ndarray, k: int) -> set[int]:
+    m = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+    return set(np.argsort(m @ (q / np.linalg.norm(q)))[::-1][:k].tolist())
+
+
+def test_recall_against_exact_search():
+    vecs = _clustered(5000)
+    idx  = IVFIndex(DIM)
+    idx.build(np.arange(len(vecs)), vecs)
+    assert idx.nlist > 1
+
+    queries = _clustered(50, seed=1)
+    k = 10
+    hits = 0
+    for q in queries:
+        ids, _ = idx.search(q, k, nprobe=8)
+        hits += len(set(ids.tolist()) & _exact_top(vecs, q, k))
+    assert hits / (k * len(queries)) >= 0.9
+
+
+def test_deferred_add_remove_matches_sequential_semantics():
+    vecs = _clustered(2000)
+    idx  = IVFIndex(DIM)
+    idx.build(np.arange(2000), vecs)
+
+    rng = np.random.default_rng(2)
+    idx.remove([5, 6, 7])
+    idx.add([5, 2001], rng.standard_normal((2, DIM)))   # id 5 znovu použité
+    idx.remove([2001])
+    idx.add([2002], rng.standard_normal((1, DIM)))
+
+    expected = (set(range(2000)) - {6, 7}) | {2002}
+    assert len(idx) == len(expected)
+    assert set(idx.ids.tolist()) == expected
+
+
+def test_save_load_roundtrip(tmp_path):
+    vecs = _clustered(1500)
+    idx  = IVFIndex(DIM)
+    idx.build(np.arange(1500), vecs)
+    idx.add([9999], vecs[:1])
+
+    path = tmp_path / 'index.ivf.npz'
+    idx.save(path)
+    loaded = IVFIndex.load(path)
+    assert len(loaded) == 1501
+    ids, _ = loaded.search(vecs[0], 2)
+    assert set(ids.tolist()) == {0, 9999}
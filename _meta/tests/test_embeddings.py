@@ -0,0 +1,38 @@
+"""Embedding služba — LRU v paměti, disková cache, batch jen pro chybějící texty."""
+
+import numpy as np
+
+from _meta import embeddings
+
+
+def test_embed_hits_memory_then_disk(fake_ollama):
+    first = embeddings.embed('def retry(): pass')
+    again = embeddings.embed('def retry(): pass')
+    assert len(fake_ollama) == 1
+    np.testing.assert_array_equal(first, again)
+
+    # Po vyprázdnění LRU se vektor načte z embed_cache.db, ne z Ollamy
+    embeddings.clear_memory()
+    before = embeddings.stats()['disk_hits']
+    from_disk = embeddings.embed('def retry(): pass')
+    assert len(fake_ollama) == 1
+    assert embeddings.stats()['disk_hits'] == before + 1
+    np.testing.assert_array_equal(first, from_disk)
+
+
+def test_embed_many_requests_only_missing_texts(fake_ollama):
+    known = embeddings.embed('známý text')
+    out = embeddings.embed_many(['nový A', 'známý text', 'nový B', 'nový A'])
+
+    assert len(fake_ollama) == 2
+    path, payload = fake_ollama[-1]
+    assert path == embeddings.OLLAMA_BATCH_PATH
+    assert payload['input'] == ['nový A', 'nový B']
+    np.testing.assert_array_equal(out[1], known)
+    np.testing.assert_array_equal(out[0], out[3])
+
+
+def test_cache_false_bypasses_lru_and_disk(fake_ollama):
+    embeddings.embed('bez cache', cache=False)
+    embeddings.embed('bez cache', cache=False)
+    assert len(fake_ollama) == 2
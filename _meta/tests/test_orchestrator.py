@@ -0,0 +1,52 @@
+"""Orchestrator — single-flight: souběžné shodné requesty vykoná backend jednou."""
+
+import threading
+import time
+
+from _meta import health
+from _meta.orchestrator import Orchestrator
+from _meta.plugins.base import Backend, Response
+
+
+class SlowBackend(Backend):
+    name   = 'claude-code'
+    models = ['sonnet']
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def is_available(self) -> bool:
+        return True
+
+    def get_pricing(self, model: str) -> dict[str, float]:
+        return {'in': 0.0, 'out': 0.0}
+
+    def execute(self, messages, model, system=None, max_tokens=4096) -> Response:
+        with self._lock:
+            self.calls += 1
+        time.sleep(0.3)
+        return Response(text='odpověď', tokens_in=3, tokens_out=1,
+                        model=f'claude-code/{model}', cost=0.0)
+
+
+def test_concurrent_identical_requests_execute_once(fake_ollama):
+    health.reset()
+    backend = SlowBackend()
+    orc = Orchestrator()
+    orc.register(backend)
+
+    messages = [{'role': 'user', 'content': 'single-flight test'}]
+    results: list[Response] = []
+
+    def ask() -> None:
+        results.append(orc.request(messages, 'boilerplate', 'tests', model='sonnet'))
+
+    threads = [threading.Thread(target=ask) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+    assert backend.calls == 1
+    assert [r.text for r in results] == ['odpověď'] * 4
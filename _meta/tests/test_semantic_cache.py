@@ -0,0 +1,30 @@
+"""Sémantická cache — store() a lookup() nad rezidentním indexem per operace."""
+
+import pytest
+
+from _meta import semantic_cache
+
+
+@pytest.fixture(autouse=True)
+def _fresh_index():
+    semantic_cache.reset_index()
+    yield
+    semantic_cache.reset_index()
+
+
+def test_lookup_finds_stored_response(fake_ollama):
+    semantic_cache.store('Jak funguje borg prune?', 'Maže staré archivy.', 'explain', 'sonnet')
+    assert semantic_cache.lookup('Jak funguje borg prune?', 'explain') == 'Maže staré archivy.'
+
+
+def test_lookup_misses_other_prompt_and_operation(fake_ollama):
+    semantic_cache.store('Co dělá retry dekorátor?', 'Opakuje volání.', 'explain', 'sonnet')
+    assert semantic_cache.lookup('Napiš SQL migraci', 'explain') is None
+    assert semantic_cache.lookup('Co dělá retry dekorátor?', 'review') is None
+
+
+def test_store_updates_loaded_index(fake_ollama):
+    # Index operace je načtený (lookup) — store ho musí doplnit inkrementálně
+    assert semantic_cache.lookup('první dotaz', 'boilerplate') is None
+    semantic_cache.store('první dotaz', 'první odpověď', 'boilerplate', 'sonnet')
+    assert semantic_cache.lookup('první dotaz', 'boilerplate') == 'první odpověď'
@@ -8,6 +8,7 @@ CLI:       ~/bin/agent
 Použití (CLI):
   agent log --project X --operation doc_update --model sonnet --in 5000 --out 1200
   agent billing [--today|--week|--month] [--project X] [--model X] [--top]
+  agent billing --rebuild-rollups
   agent cache --stats | --list | --clear [--all]
   agent route --show
   agent route --test doc_update
@@ -34,12 +35,15 @@ from _meta.billing import (
     DB_DIR, DB_PATH,
     MODEL_PRICES, MODEL_ALIASES,
     init_db, normalize_model, calc_cost, hash_prompt,
-    cache_lookup, cache_store, log_cache_hit,
+    cache_lookup, cache_store, log_cache_hit, sweep_cache, flush,
+    rebuild_rollups,
 )
 from _meta.router import (
     ROUTING_RULES, CACHE_TTL, LOCAL_MODEL, OLLAMA_CHAT_URL,
-    resolve_model, get_cache_ttl,
+    LATENCY_BUDGET, STATS_WINDOW,
+    resolve_model, get_cache_ttl, stats_snapshot, get_policy,
 )
+from _meta.scheduler import PRIORITY_INTERACTIVE, metrics as scheduler_metrics
 
 # ─── ANSI barvy ───────────────────────────────────────────────────────────────
 
@@ -105,17 +109,31 @@ def cmd_log(args: argparse.Namespace) -> None:
 # ─── Příkaz: billing ─────────────────────────────────────────────────────────
 
 def cmd_billing(args: argparse.Namespace) -> None:
+    flush()   # zapsat billing záznamy tohoto procesu čekající ve frontě
     conn = init_db()
 
-    conditions: list[str] = ["(cache_hit = 0 OR cache_hit IS NULL)"]
+    if getattr(args, 'rebuild_rollups', False):
+        rebuild_rollups(conn)
+        conn.commit()
+        n = conn.execute("SELECT COUNT(*) AS n FROM billing_daily").fetchone()['n']
+        print(f"{G}✓ Rollupy přepočítány:{R} {n} denních řádků")
+        conn.close()
+        return
+
+    # Agregace čte z rollupů (hodinové pro okna, denní pro celou historii),
+    # token_log jen pro výpis posledních záznamů.
+    conditions: list[str] = []
     params: list = []
+    table = 'billing_hourly'
 
     if getattr(args, 'today', False):
-        conditions.append("DATE(timestamp) = DATE('now')")
+        conditions.append("bucket >= DATE('now')")
     elif getattr(args, 'week', False):
-        conditions.append("timestamp >= DATETIME('now', '-7 days')")
+        conditions.append("bucket >= strftime('%Y-%m-%d %H:00:00', 'now', '-7 days')")
     elif getattr(args, 'month', False):
-        conditions.append("timestamp >= DATETIME('now', '-30 days')")
+        conditions.append("bucket >= strftime('%Y-%m-%d %H:00:00', 'now', '-30 days')")
+    else:
+        table = 'billing_daily'
 
     if getattr(args, 'project', None):
         conditions.append("project = ?")
@@ -126,20 +144,17 @@ def cmd_billing(args: argparse.Namespace) -> None:
         conditions.append("(model = ? OR model LIKE ?)")
         params.extend([model, f'%{args.model}%'])
 
-    where = 'WHERE ' + ' AND '.join(conditions)
-
-    hit_conds = [c for c in conditions if 'cache_hit' not in c]
-    hit_conds.append("cache_hit = 1")
-    hit_where = 'WHERE ' + ' AND '.join(hit_conds)
+    where = 'WHERE ' + ' AND '.join(conditions + ["cache_hit = 0"])
+    hit_where = 'WHERE ' + ' AND '.join(conditions + ["cache_hit = 1"])
 
     if getattr(args, 'top', False):
         rows = conn.execute(f"""
             SELECT operation, project,
-                   COUNT(*)        AS calls,
+                   SUM(calls)      AS calls,
                    SUM(tokens_in)  AS t_in,
                    SUM(tokens_out) AS t_out,
                    SUM(cost_usd)   AS cost
-            FROM token_log {where}
+            FROM {table} {where}
             GROUP BY operation, project
             ORDER BY cost DESC
             LIMIT 20
@@ -156,43 +171,45 @@ def cmd_billing(args: argparse.Namespace) -> None:
         return
 
     summary = conn.execute(f"""
-        SELECT COUNT(*)        AS calls,
+        SELECT SUM(calls)      AS calls,
                SUM(tokens_in)  AS t_in,
                SUM(tokens_out) AS t_out,
                SUM(cost_usd)   AS cost
-        FROM token_log {where}
+        FROM {table} {where}
     """, params).fetchone()
 
     cache_stats = conn.execute(f"""
-        SELECT COUNT(*) AS hits FROM token_log {hit_where}
-    """, params).fetchone()
-
-    saved = conn.execute(f"""
-        SELECT COALESCE(SUM(cost_usd), 0.0) AS saved_cost
-        FROM token_log
-        WHERE prompt_hash IN (SELECT prompt_hash FROM token_log {hit_where})
-          AND (cache_hit = 0 OR cache_hit IS NULL)
-          AND response_text IS NOT NULL
+        SELECT SUM(calls)                     AS hits,
+               COALESCE(SUM(saved_cost), 0.0) AS saved_cost
+        FROM {table} {hit_where}
     """, params).fetchone()
 
     by_model = conn.execute(f"""
         SELECT model,
-               COUNT(*)        AS calls,
+               SUM(calls)      AS calls,
                SUM(tokens_in)  AS t_in,
                SUM(tokens_out) AS t_out,
                SUM(cost_usd)   AS cost
-        FROM token_log {where}
+        FROM {table} {where}
         GROUP BY model
         ORDER BY cost DESC
     """, params).fetchall()
 
+    recent_conds = ["(cache_hit = 0 OR cache_hit IS NULL)"]
+    recent_params: list = []
+    if getattr(args, 'project', None):
+        recent_conds.append("project = ?")
+        recent_params.append(args.project)
+    if getattr(args, 'model', None):
+        recent_conds.append("(model = ? OR model LIKE ?)")
+        recent_params.extend([normalize_model(args.model), f'%{args.model}%'])
     recent = conn.execute(f"""
         SELECT timestamp, project, operation, model,
                tokens_in, tokens_out, cost_usd
-        FROM token_log {where}
-        ORDER BY timestamp DESC
+        FROM token_log WHERE {' AND '.join(recent_conds)}
+        ORDER BY id DESC
         LIMIT 15
-    """, params).fetchall()
+    """, recent_params).fetchall()
 
     conn.close()
 
@@ -212,7 +229,7 @@ def cmd_billing(args: argparse.Namespace) -> None:
     cost   = summary['cost']  or 0.0
     calls  = summary['calls'] or 0
     hits   = cache_stats['hits'] or 0
-    saved_cost = (saved['saved_cost'] or 0.0) if saved else 0.0
+    saved_cost = cache_stats['saved_cost'] or 0.0
 
     print(f"\n  {D}Volání:{R} {calls:,}   "
           f"{D}Tokeny in:{R} {t_in:,}   "
@@ -249,22 +266,23 @@ def cmd_billing(args: argparse.Namespace) -> None:
 # ─── Příkaz: cache ────────────────────────────────────────────────────────────
 
 def cmd_cache(args: argparse.Namespace) -> None:
+    flush()   # zapsat billing záznamy tohoto procesu čekající ve frontě
+
+    if getattr(args, 'embed_format', None):
+        from _meta.semantic_cache import convert_embeddings
+        n, recall = convert_embeddings(args.embed_format)
+        print(f"{G}✓ Sémantická cache:{R} {n} embeddingů převedeno na {args.embed_format} "
+              f"{D}(recall@5 vůči původním: {recall:.3f}){R}")
+        return
+
     conn = init_db()
 
     if getattr(args, 'stats', False):
-        total_cached = conn.execute("""
-            SELECT COUNT(*) AS n FROM token_log
-            WHERE (cache_hit = 0 OR cache_hit IS NULL)
-              AND response_text IS NOT NULL AND response_text != ''
-        """).fetchone()['n']
-
-        min_ttl = min(v for v in CACHE_TTL.values() if v > 0)
-        valid_cached = conn.execute(f"""
-            SELECT COUNT(*) AS n FROM token_log
-            WHERE (cache_hit = 0 OR cache_hit IS NULL)
-              AND response_text IS NOT NULL AND response_text != ''
-              AND timestamp >= DATETIME('now', '-{min_ttl} hours')
-        """).fetchone()['n']
+        cached = conn.execute("""
+            SELECT COUNT(*) AS n,
+                   COALESCE(SUM(expires_at > DATETIME('now')), 0) AS valid
+            FROM response_cache
+        """).fetchone()
 
         total_hits = conn.execute("""
             SELECT COUNT(*) AS n FROM token_log WHERE cache_hit = 1
@@ -275,22 +293,18 @@ def cmd_cache(args: argparse.Namespace) -> None:
             WHERE (cache_hit = 0 OR cache_hit IS NULL)
         """).fetchone()['n']
 
+        # Úspora = hash-cache hity × cena původního volání
         saved = conn.execute("""
-            SELECT COALESCE(SUM(orig.tokens_in),  0) AS t_in,
-                   COALESCE(SUM(orig.tokens_out), 0) AS t_out,
-                   COALESCE(SUM(orig.cost_usd),   0) AS cost
-            FROM token_log AS hit
-            JOIN token_log AS orig
-              ON orig.prompt_hash = hit.prompt_hash
-             AND (orig.cache_hit = 0 OR orig.cache_hit IS NULL)
-             AND orig.response_text IS NOT NULL
-            WHERE hit.cache_hit = 1
+            SELECT COALESCE(SUM(hit_count * tokens_in),  0) AS t_in,
+                   COALESCE(SUM(hit_count * tokens_out), 0) AS t_out,
+                   COALESCE(SUM(hit_count * cost_usd),   0) AS cost
+            FROM response_cache
         """).fetchone()
 
         hit_rate = (total_hits / (total_real + total_hits) * 100) if (total_real + total_hits) > 0 else 0.0
 
         print(f"\n{bold('CACHE STATISTIKY')}")
-        print(f"  {D}Uložené odpovědi:{R}  {total_cached} celkem  {D}(z toho ~{valid_cached} v rámci TTL){R}")
+        print(f"  {D}Uložené odpovědi:{R}  {cached['n']} celkem  {D}(z toho {cached['valid']} platných){R}")
         print(f"  {D}Cache hity:{R}        {total_hits}")
         print(f"  {D}Hit rate:{R}          {hit_rate:.1f}%")
         if saved and saved['cost']:
@@ -308,14 +322,11 @@ def cmd_cache(args: argparse.Namespace) -> None:
 
     if getattr(args, 'list', False):
         rows = conn.execute("""
-            SELECT timestamp, project, operation, model,
-                   tokens_in, tokens_out, cost_usd,
-                   prompt_hash,
+            SELECT created_at, expires_at, operation, model,
+                   cost_usd, prompt_hash, hit_count,
                    LENGTH(response_text) AS resp_len
-            FROM token_log
-            WHERE (cache_hit = 0 OR cache_hit IS NULL)
-              AND response_text IS NOT NULL AND response_text != ''
-            ORDER BY timestamp DESC
+            FROM response_cache
+            ORDER BY created_at DESC
             LIMIT 30
         """).fetchall()
 
@@ -324,37 +335,32 @@ def cmd_cache(args: argparse.Namespace) -> None:
             print(f"  {D}Žádné záznamy.{R}\n")
             conn.close()
             return
-        print(f"{D}  {'Čas':<17} {'Projekt':<18} {'Operace':<20} {'Hash':<10} {'Velikost':>8} {'Cena':>9}{R}")
+        print(f"{D}  {'Čas':<17} {'Operace':<20} {'Hash':<10} {'Velikost':>8} {'Hity':>5} {'Cena':>9}  {'Platí do'}{R}")
         print(D + '  ' + '─' * 90 + R)
         for r in rows:
-            ts  = r['timestamp'][:16].replace('T', ' ')
-            h   = r['prompt_hash'][:8] if r['prompt_hash'] else '????????'
+            ts  = r['created_at'][:16].replace('T', ' ')
+            exp = r['expires_at'][:16].replace('T', ' ')
+            h   = r['prompt_hash'][:8]
             kb  = (r['resp_len'] or 0) / 1024
-            print(f"  {D}{ts}{R}  {C}{r['project']:<16}{R}  "
-                  f"{r['operation']:<20}  {D}{h}{R}  "
-                  f"{kb:>6.1f} kB  {Y}${r['cost_usd'] or 0:>7.4f}{R}")
+            print(f"  {D}{ts}{R}  {r['operation']:<20}  {D}{h}{R}  "
+                  f"{kb:>6.1f} kB  {r['hit_count']:>5}  {Y}${r['cost_usd'] or 0:>7.4f}{R}  {D}{exp}{R}")
         print()
         conn.close()
         return
 
     if getattr(args, 'clear', False):
         if getattr(args, 'all', False):
-            c = conn.execute("""
+            c = conn.execute("DELETE FROM response_cache")
+            # Texty odpovědí uložené starší verzí v token_log
+            conn.execute("""
                 UPDATE token_log SET response_text = NULL
                 WHERE response_text IS NOT NULL
             """)
             conn.commit()
             print(f"{Y}✓ Cache vymazána:{R} {c.rowcount} záznamů")
         else:
-            max_ttl = max(v for v in CACHE_TTL.values() if v > 0)
-            c = conn.execute(f"""
-                UPDATE token_log SET response_text = NULL
-                WHERE response_text IS NOT NULL
-                  AND timestamp < DATETIME('now', '-{max_ttl} hours')
-            """)
-            conn.commit()
-            print(f"{Y}✓ Expirovaná cache vymazána:{R} {c.rowcount} záznamů "
-                  f"{D}(starší než {max_ttl}h){R}")
+            n = sweep_cache(conn)
+            print(f"{Y}✓ Expirovaná cache vymazána:{R} {n} záznamů")
         conn.close()
         return
 
@@ -422,6 +428,32 @@ def cmd_route(args: argparse.Namespace) -> None:
               f"{Y}${cloud_calls['cost']:.4f}{R}")
         print()
 
+    stats = stats_snapshot()
+    if stats:
+        print(f"{bold('ŽIVÉ STATISTIKY BACKENDŮ')}  {D}(policy: {type(get_policy()).__name__}, "
+              f"okno {STATS_WINDOW} volání){R}")
+        print(f"{D}  {'Backend / model':<38} {'Vzorky':>6} {'p50':>8} {'p95':>8} {'Chyby':>7} {'Běží':>5}{R}")
+        print(D + '  ' + '─' * 78 + R)
+        for st in stats:
+            p50 = f"{st['p50']:.1f}s" if st['p50'] is not None else '—'
+            p95 = f"{st['p95']:.1f}s" if st['p95'] is not None else '—'
+            err = f"{st['error_rate'] * 100:.0f}%"
+            print(f"  {C}{st['key']:<38}{R} {st['samples']:>6} {p50:>8} {p95:>8} "
+                  f"{err:>7} {st['inflight']:>5}")
+        print(f"\n  {D}Latency budget:{R} " + '  '.join(
+            f"{op} {Y}{sec:.0f}s{R}" for op, sec in LATENCY_BUDGET.items()))
+        print()
+
+    queues = scheduler_metrics()
+    if queues:
+        print(f"{bold('SCHEDULER')}")
+        print(f"{D}  {'Brána':<38} {'Limit':>5} {'Běží':>5} {'Fronta':>6} {'Čekání ø':>9} {'p95':>7}{R}")
+        print(D + '  ' + '─' * 76 + R)
+        for key, m in queues.items():
+            print(f"  {C}{key:<38}{R} {m['limit']:>5} {m['inflight']:>5} {m['queued']:>6} "
+                  f"{m['wait_avg']:>8.1f}s {m['wait_p95']:>6.1f}s")
+        print()
+
 
 # ─── Spinner ─────────────────────────────────────────────────────────────────
 
@@ -484,6 +516,7 @@ def cmd_ask(args: argparse.Namespace) -> None:
             model=args.model,
             system=getattr(args, 'system', None),
             max_tokens=getattr(args, 'max_tokens', 4096),
+            priority=PRIORITY_INTERACTIVE,
         )
 
     print(resp.text)
@@ -516,6 +549,8 @@ def main() -> None:
     p_bill.add_argument('--project', help='Filtrovat projekt')
     p_bill.add_argument('--model',   help='Filtrovat model')
     p_bill.add_argument('--top',     action='store_true')
+    p_bill.add_argument('--rebuild-rollups', action='store_true',
+                        help='Přepočítat billing_hourly/daily z token_log')
 
     # ── agent cache ───────────────────────────────────────────────────────────
     p_cache = sub.add_parser('cache', help='Správa prompt cache')
@@ -523,6 +558,9 @@ def main() -> None:
     p_cache.add_argument('--list',  action='store_true')
     p_cache.add_argument('--clear', action='store_true')
     p_cache.add_argument('--all',   action='store_true')
+    p_cache.add_argument('--embed-format', dest='embed_format',
+                         choices=['float32', 'float16', 'int8'],
+                         help='Převést embeddingy sémantické cache do formátu')
 
     # ── agent route ───────────────────────────────────────────────────────────
     p_route = sub.add_parser('route', help='Zobrazit nebo otestovat model routing')
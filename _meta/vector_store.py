@@ -0,0 +1,103 @@
+"""
+Vektorový soubor pro code_index — matice řádků mapovaná přes np.memmap.
+
+Řádek = jeden normalizovaný embedding (EMBED_DIM) ve formátu float32,
+float16 nebo int8 + měřítko (viz quantize.py), bez hlavičky. Formát drží
+DB (index_meta.vec_format). SQLite drží jen metadata chunku a číslo
+řádku (code_chunks.vec_row).
+
+Soubor je append-only: smazaný chunk jen přestane na svůj řádek odkazovat
+(implicitní tombstone). Kompakce přepíše živé řádky do nové generace souboru
+(code_index.<gen>.vec) a teprve potom se v DB přepne generace + vec_row,
+takže pád uprostřed kompakce nechá platný starý soubor.
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+from _meta import quantize
+
+
+class VectorFile:
+    """Append-only matice embeddingů na disku, čtená přes np.memmap."""
+
+    def __init__(self, path: Path, dim: int, fmt: str = 'float32') -> None:
+        self.path  = path
+        self.dim   = dim
+        self.fmt   = fmt
+        self._dtype = quantize.row_dtype(dim, fmt)
+        self._mm: np.memmap | None = None
+        self._mm_rows = -1
+
+    @property
+    def row_bytes(self) -> int:
+        return self._dtype.itemsize
+
+    @property
+    def rows(self) -> int:
+        try:
+            return self.path.stat().st_size // self.row_bytes
+        except FileNotFoundError:
+            return 0
+
+    def append(self, vecs: np.ndarray) -> int:
+        """Připojí řádky na konec souboru, vrátí číslo prvního z nich."""
+        raw   = quantize.encode_rows(np.asarray(vecs).reshape(-1, self.dim), self.fmt)
+        start = self.rows
+        with open(self.path, 'ab') as f:
+            # Useknout případný neúplný řádek po pádu uprostřed zápisu
+            if f.tell() != start * self.row_bytes:
+                f.truncate(start * self.row_bytes)
+            f.write(raw.tobytes())
+        return start
+
+    def raw(self) -> np.ndarray:
+        """Read-only memmap uložených řádků (ve formátu souboru); po appendu se přemapuje."""
+        rows = self.rows
+        if rows == 0:
+            return np.empty(0, dtype=self._dtype)
+        if self._mm is None or self._mm_rows != rows:
+            self._mm      = np.memmap(self.path, dtype=self._dtype, mode='r', shape=(rows,))
+            self._mm_rows = rows
+        return self._mm
+
+    def take(self, rows) -> np.ndarray:
+        """Vybrané řádky jako float32 matice (len(rows) × dim)."""
+        if len(rows) == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return quantize.decode_rows(self.raw()[np.asarray(rows, dtype=np.int64)], self.fmt)
+
+    def scores(self, q: np.ndarray, block: int = 65536) -> np.ndarray:
+        """Skalární součin q s každým řádkem; dekvantizace po blocích (malá paměť)."""
+        raw = self.raw()
+        out = np.empty(len(raw), dtype=np.float32)
+        q   = np.asarray(q, dtype=np.float32)
+        for s in range(0, len(raw), block):
+            part = raw[s:s + block]
+            if self.fmt == 'int8':
+                out[s:s + block] = (part['q'] @ q) * part['scale']
+            else:
+                out[s:s + block] = np.asarray(part, dtype=np.float32) @ q
+        return out
+
+    def copy_rows_to(self, target: Path, rows: np.ndarray, block: int = 4096,
+                     fmt: str | None = None) -> None:
+        """
+        Zapíše vybrané řádky (v daném pořadí) do nového souboru a fsyncne ho.
+        fmt: cílový formát, pokud se liší (konverze float32 ↔ float16 ↔ int8).
+        """
+        raw = self.raw()
+        with open(target, 'wb') as f:
+            for s in range(0, len(rows), block):
+                part = raw[rows[s:s + block]]
+                if fmt and fmt != self.fmt:
+                    part = quantize.encode_rows(quantize.decode_rows(part, self.fmt), fmt)
+                f.write(np.ascontiguousarray(part).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self) -> None:
+        self._mm = None
+        self._mm_rows = -1
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """Agent UI — webové rozhraní pro orchestrátor. Port 8100."""
 
+import json
 import sys
 import os
 import subprocess
@@ -11,14 +12,18 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from datetime import date
 from pathlib import Path
-from flask import Flask, render_template, request, redirect, jsonify
+from flask import (
+    Flask, Response, render_template, request, redirect, jsonify, stream_with_context,
+)
 
+from _meta import claude_cli_pool, health, scheduler
 from _meta.orchestrator import Orchestrator
+from _meta.scheduler import PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
 from _meta.plugins.claude_code import ClaudeCodeBackend
 from _meta.plugins.claude import ClaudeBackend
 from _meta.plugins.ollama import OllamaBackend
-from _meta.billing import init_db
-from _meta.router import ROUTING_RULES, CACHE_TTL, LOCAL_MODEL, DEEPSEEK_MODEL
+from _meta.billing import init_db, normalize_model, flush as billing_flush
+from _meta.router import ROUTING_RULES, CACHE_TTL, LOCAL_MODEL, DEEPSEEK_MODEL, REQUEST_DEADLINE
 from _meta.conversations import (
     init_conv_db,
     template_list, template_get, template_create, template_update, template_delete,
@@ -60,18 +65,19 @@ for _op, _dest in ROUTING_RULES.items():
 
 def billing_today() -> dict:
     try:
+        billing_flush()
         conn  = init_db()
         today = date.today().isoformat()
         row   = conn.execute("""
             SELECT
-                COUNT(*)                                          AS total_calls,
-                SUM(CASE WHEN cache_hit = 0 THEN 1 ELSE 0 END)  AS real_calls,
-                SUM(CASE WHEN cache_hit = 1 THEN 1 ELSE 0 END)  AS cache_hits,
-                COALESCE(SUM(tokens_in),  0)                     AS total_in,
-                COALESCE(SUM(tokens_out), 0)                     AS total_out,
-                COALESCE(SUM(cost_usd),   0.0)                   AS total_cost
-            FROM token_log
-            WHERE DATE(timestamp) = ?
+                COALESCE(SUM(calls), 0)                               AS total_calls,
+                SUM(CASE WHEN cache_hit = 0 THEN calls ELSE 0 END)   AS real_calls,
+                SUM(CASE WHEN cache_hit = 1 THEN calls ELSE 0 END)   AS cache_hits,
+                COALESCE(SUM(tokens_in),  0)                          AS total_in,
+                COALESCE(SUM(tokens_out), 0)                          AS total_out,
+                COALESCE(SUM(cost_usd),   0.0)                        AS total_cost
+            FROM billing_daily
+            WHERE bucket = ?
         """, (today,)).fetchone()
         conn.close()
         return dict(row) if row else {}
@@ -186,6 +192,7 @@ def _run_summary(cid: int, model_id: str, model_name: str, prompt: str) -> None:
             project='agent-ui-summary',
             model=model_name,
             notes=f'auto-summary/{model_id}',
+            priority=PRIORITY_BACKGROUND,
         )
         elapsed = int((time.time() - start) * 1000)
         conn = init_conv_db()
@@ -229,6 +236,7 @@ def _generate_conv_name(cid: int, first_exchange: str) -> None:
             project='agent-ui-naming',
             model='haiku',
             notes='auto-name',
+            priority=PRIORITY_BACKGROUND,
         )
         name = resp.text.strip().strip('"\'').strip()[:100]
         conn = init_conv_db()
@@ -250,21 +258,27 @@ def index():
 def status():
     backends = [
         {'name': 'Claude Code (Pro/Max)', 'id': 'claude-code',
-         'available': claude_code_backend.is_available(), 'models': ['opus', 'sonnet', 'haiku'],
+         'available': health.is_up(claude_code_backend), 'models': ['opus', 'sonnet', 'haiku'],
          'note': 'CLI · bez API klíče'},
         {'name': 'Claude API (Anthropic)', 'id': 'claude',
-         'available': claude_backend.is_available(), 'models': ['opus', 'sonnet', 'haiku'],
+         'available': health.is_up(claude_backend), 'models': ['opus', 'sonnet', 'haiku'],
          'note': 'ANTHROPIC_API_KEY'},
         {'name': f'Ollama / {LOCAL_MODEL}', 'id': 'ollama-qwen',
-         'available': ollama_backend.is_available(), 'models': [LOCAL_MODEL],
+         'available': health.is_up(ollama_backend), 'models': [LOCAL_MODEL],
          'note': 'lokální · zdarma'},
         {'name': f'Ollama / {DEEPSEEK_MODEL}', 'id': 'ollama-deepseek',
-         'available': ollama_backend.is_available(), 'models': [DEEPSEEK_MODEL],
+         'available': health.is_up(ollama_backend), 'models': [DEEPSEEK_MODEL],
          'note': 'lokální · zdarma'},
     ]
     return render_template('partials/status.html', backends=backends)
 
 
+@app.route('/status/scheduler')
+def status_scheduler():
+    """Fronta scheduleru: limit, běžící, čekající (dle priority), doby čekání."""
+    return jsonify(scheduler.metrics())
+
+
 @app.route('/memory')
 def memory():
     return render_template('partials/memory.html', mem=memory_stats())
@@ -280,28 +294,29 @@ def memory_header():
 @app.route('/stats')
 def stats():
     try:
+        billing_flush()
         conn = init_db()
         rows = conn.execute("""
             SELECT timestamp, project, operation, model,
                    tokens_in, tokens_out, cost_usd, cache_hit, notes
-            FROM token_log ORDER BY timestamp DESC LIMIT 50
+            FROM token_log ORDER BY id DESC LIMIT 50
         """).fetchall()
         history = [dict(r) for r in rows]
         daily = conn.execute("""
-            SELECT DATE(timestamp) AS day, COUNT(*) AS calls,
-                   SUM(CASE WHEN cache_hit=1 THEN 1 ELSE 0 END) AS cache_hits,
+            SELECT bucket AS day, SUM(calls) AS calls,
+                   SUM(CASE WHEN cache_hit=1 THEN calls ELSE 0 END) AS cache_hits,
                    COALESCE(SUM(tokens_in),0) AS tokens_in,
                    COALESCE(SUM(tokens_out),0) AS tokens_out,
                    COALESCE(SUM(cost_usd),0.0) AS cost
-            FROM token_log GROUP BY DATE(timestamp)
+            FROM billing_daily GROUP BY bucket
             ORDER BY day DESC LIMIT 7
         """).fetchall()
         daily = [dict(r) for r in daily]
         summary = conn.execute("""
-            SELECT COUNT(*) AS total,
-                   SUM(CASE WHEN cache_hit=1 THEN 1 ELSE 0 END) AS hits,
+            SELECT COALESCE(SUM(calls),0) AS total,
+                   SUM(CASE WHEN cache_hit=1 THEN calls ELSE 0 END) AS hits,
                    COALESCE(SUM(cost_usd),0.0) AS total_cost
-            FROM token_log
+            FROM billing_daily
         """).fetchone()
         conn.close()
         return render_template('stats.html', history=history, daily=daily,
@@ -455,20 +470,19 @@ def ask_get():
                            unanswered=unanswered)
 
 
-@app.route('/ask', methods=['POST'])
-def ask_post():
-    prompt        = request.form.get('prompt', '').strip()
-    operation     = request.form.get('operation', '_default')
-    project       = request.form.get('project', 'agent-ui').strip() or 'agent-ui'
-    model         = request.form.get('model', 'auto')
-    backend_force = request.form.get('backend_force', 'auto')
-    conv_id       = request.form.get('conv_id', type=int)
-    template_id   = request.form.get('template_id', type=int)
-    summary_id    = request.form.get('summary_id', type=int)
-
-    if not prompt:
-        return render_template('partials/response.html',
-                               error='Prompt nesmí být prázdný.', response=None)
+def _ask_prepare(form) -> dict:
+    """
+    Společná příprava /ask a /ask/stream: uloží prompt do konverzace,
+    sestaví messages + system a vybere orchestrátor dle backend_force.
+    """
+    prompt        = form.get('prompt', '').strip()
+    operation     = form.get('operation', '_default')
+    project       = form.get('project', 'agent-ui').strip() or 'agent-ui'
+    model         = form.get('model', 'auto')
+    backend_force = form.get('backend_force', 'auto')
+    conv_id       = form.get('conv_id', type=int)
+    template_id   = form.get('template_id', type=int)
+    summary_id    = form.get('summary_id', type=int)
 
     conn       = init_conv_db()
     msg_id     = None
@@ -516,33 +530,53 @@ def ask_post():
     else:
         active_orc = orc
 
+    return {
+        'orc':         active_orc,
+        'prompt':      prompt,
+        'conv_id':     conv_id,
+        'msg_id':      msg_id,
+        'is_new_conv': is_new_conv,
+        'kwargs':      dict(messages=messages, operation=operation, project=project,
+                            model=model, system=system,
+                            notes=f'agent-ui/{backend_force}',
+                            priority=PRIORITY_INTERACTIVE, deadline=REQUEST_DEADLINE),
+    }
+
+
+def _ask_save(ctx: dict, resp, elapsed_ms: int) -> None:
+    """Uloží odpověď do konverzace a případně spustí auto-název."""
+    conv_id, msg_id = ctx['conv_id'], ctx['msg_id']
+    if not (conv_id and msg_id):
+        return
+    conn = init_conv_db()
+    msg_save_assistant(conn, conv_id, msg_id, resp.text,
+                       resp.model, _detect_backend(resp.model),
+                       resp.tokens_in, resp.tokens_out,
+                       resp.cost, elapsed_ms)
+    conv = conv_get(conn, conv_id)
+    conn.close()
+    # Auto-název po první skutečné odpovědi
+    if ctx['is_new_conv'] and (not conv or not conv.get('name')):
+        snippet = f'Dotaz: {ctx["prompt"][:200]}\nOdpověď: {resp.text[:200]}'
+        threading.Thread(
+            target=_generate_conv_name, args=(conv_id, snippet), daemon=True
+        ).start()
+
+
+@app.route('/ask', methods=['POST'])
+def ask_post():
+    if not request.form.get('prompt', '').strip():
+        return render_template('partials/response.html',
+                               error='Prompt nesmí být prázdný.', response=None)
+
+    ctx   = _ask_prepare(request.form)
     start = time.time()
     try:
-        resp = active_orc.request(
-            messages=messages,
-            operation=operation,
-            project=project,
-            model=model,
-            system=system,
-            notes=f'agent-ui/{backend_force}',
-        )
+        resp = ctx['orc'].request(**ctx['kwargs'])
         elapsed_ms = int((time.time() - start) * 1000)
 
         # ── Uložení odpovědi do DB ───────────────────────────────────────────
-        if conv_id and msg_id:
-            conn = init_conv_db()
-            msg_save_assistant(conn, conv_id, msg_id, resp.text,
-                               resp.model, _detect_backend(resp.model),
-                               resp.tokens_in, resp.tokens_out,
-                               resp.cost, elapsed_ms)
-            conv = conv_get(conn, conv_id)
-            conn.close()
-            # Auto-název po první skutečné odpovědi
-            if is_new_conv and (not conv or not conv.get('name')):
-                snippet = f'Dotaz: {prompt[:200]}\nOdpověď: {resp.text[:200]}'
-                threading.Thread(
-                    target=_generate_conv_name, args=(conv_id, snippet), daemon=True
-                ).start()
+        _ask_save(ctx, resp, elapsed_ms)
 
         return render_template('partials/response.html', response=resp,
                                error=None, elapsed_ms=elapsed_ms)
@@ -551,6 +585,56 @@ def ask_post():
                                response=None, elapsed_ms=None)
 
 
+def _sse(event: str, data) -> str:
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+@app.route('/ask/stream', methods=['POST'])
+def ask_stream():
+    """
+    Server-Sent Events varianta /ask (POST + fetch stream na klientu):
+      event: delta  {"text": "..."}       — průběžný text
+      event: done   {"html": "..."}       — finální partials/response.html
+      event: error  {"html": "..."}
+    """
+    if not request.form.get('prompt', '').strip():
+        html = render_template('partials/response.html',
+                               error='Prompt nesmí být prázdný.', response=None)
+        return Response(_sse('error', {'html': html}), mimetype='text/event-stream')
+
+    ctx = _ask_prepare(request.form)
+
+    def generate():
+        start = time.time()
+        gen   = ctx['orc'].stream_request(**ctx['kwargs'])
+        try:
+            while True:
+                try:
+                    delta = next(gen)
+                except StopIteration as stop:
+                    resp = stop.value
+                    break
+                yield _sse('delta', {'text': delta})
+
+            elapsed_ms = int((time.time() - start) * 1000)
+            _ask_save(ctx, resp, elapsed_ms)
+            html = render_template('partials/response.html', response=resp,
+                                   error=None, elapsed_ms=elapsed_ms)
+            yield _sse('done', {'html': html})
+        except Exception as exc:
+            html = render_template('partials/response.html', error=str(exc),
+                                   response=None, elapsed_ms=None)
+            yield _sse('error', {'html': html})
+        finally:
+            gen.close()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 if __name__ == '__main__':
     print('Agent UI: http://localhost:8100/')
+    if claude_code_backend.is_available():
+        # Výchozí cloud route — předehřát CLI procesy ještě před prvním dotazem
+        claude_cli_pool.prewarm(normalize_model(ROUTING_RULES['_default']))
     app.run(host='0.0.0.0', port=8100, debug=False)